@@ -0,0 +1,138 @@
+"""
+Microbenchmark do status_engine contra a implementação antiga (um documento
+por vez, com datetime.fromisoformat em cada linha).
+
+    python -m benchmarks.status_engine                 # 10k, 100k e 1M linhas
+    python -m benchmarks.status_engine --sizes 10000 --repeat 5
+    python -m benchmarks.status_engine --native       # nextPayment como Timestamp
+"""
+import time
+import random
+import argparse
+from datetime import datetime, timezone, timedelta
+
+from services import status_engine
+
+EXPIRING_WINDOW = timedelta(days=10)
+
+
+# --- Implementação anterior (por documento), mantida aqui só como referência ---
+
+def legacy_parse_next_payment(value):
+    if value is None:
+        return None
+    if hasattr(value, "to_datetime"):
+        return value.to_datetime().astimezone(timezone.utc)
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc)
+    if isinstance(value, str):
+        if value.endswith("Z"):
+            value = value.replace("Z", "+00:00")
+        return datetime.fromisoformat(value).astimezone(timezone.utc)
+    return None
+
+
+def legacy_compute_status(data: dict, now: datetime):
+    status = data.get("status")
+    if status == 0:
+        return None
+    next_payment = legacy_parse_next_payment(data.get("nextPayment"))
+    if not next_payment:
+        return None
+    days_diff = (next_payment.date() - now.date()).days
+    if days_diff < 0:
+        new_status = 3
+    elif days_diff <= 10:
+        new_status = 2
+    else:
+        new_status = 1
+    return new_status if new_status != status else None
+
+
+def legacy_next_transition(data: dict, now: datetime):
+    if data.get("status") == 0:
+        return None
+    next_payment = legacy_parse_next_payment(data.get("nextPayment"))
+    if not next_payment:
+        return None
+    due = datetime.combine(next_payment.date(), datetime.min.time(), tzinfo=timezone.utc)
+    if now < due - EXPIRING_WINDOW:
+        return due - EXPIRING_WINDOW
+    if now < due + timedelta(days=1):
+        return due + timedelta(days=1)
+    return None
+
+
+def legacy_status_update(data: dict, now: datetime) -> dict:
+    update = {}
+    new_status = legacy_compute_status(data, now)
+    if new_status is not None:
+        update["status"] = new_status
+    transition = legacy_next_transition({**data, **update}, now)
+    if transition != data.get("statusChangeAt"):
+        update["statusChangeAt"] = transition
+    return update
+
+
+# --- Dados ---
+
+def make_rows(n: int, now: datetime, seed: int = 42, native: bool = False) -> list[dict]:
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        due = now + timedelta(days=rng.randint(-60, 60), seconds=rng.randint(0, 86399))
+        rows.append({
+            "nextPayment": due if native else due.isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+            "status": rng.choice([0, 1, 1, 1, 2, 3]),
+            "statusChangeAt": None,
+        })
+    return rows
+
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(sizes: list[int], repeat: int, native: bool = False):
+    now = datetime.now(timezone.utc)
+    today = status_engine.parse_days([now.date().isoformat()])[0]
+    print(f"{'rows':>10} {'legacy ms':>12} {'engine ms':>12} {'speedup':>9} {'parse ms':>10} {'kernel ms':>10}")
+    for n in sizes:
+        rows = make_rows(n, now, native=native)
+
+        # As duas implementações precisam concordar antes de comparar tempos
+        sample = rows[:10_000]
+        assert [legacy_status_update(r, now) for r in sample] == status_engine.status_updates(sample, now)
+
+        legacy = _best_of(lambda: [legacy_status_update(r, now) for r in rows], repeat)
+        engine = _best_of(lambda: status_engine.status_updates(rows, now), repeat)
+
+        # Só o parser de datas e só o cálculo vetorizado (colunas já prontas)
+        values = [r["nextPayment"] for r in rows]
+        parse = _best_of(lambda: status_engine.parse_days(values), repeat)
+        next_payment = status_engine.parse_days(values)
+        status = status_engine.parse_statuses([r["status"] for r in rows])
+
+        def kernel():
+            new_status, _ = status_engine.compute_statuses(next_payment, status, today)
+            status_engine.next_transitions(next_payment, new_status, today)
+
+        core = _best_of(kernel, repeat)
+        print(
+            f"{n:>10} {legacy * 1000:>12.1f} {engine * 1000:>12.1f} {legacy / engine:>8.1f}x "
+            f"{parse * 1000:>10.1f} {core * 1000:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="status_engine microbenchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--native", action="store_true", help="nextPayment como datetime (Timestamp do Firestore)")
+    args = parser.parse_args()
+    run(args.sizes, args.repeat, args.native)
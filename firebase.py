@@ -1,29 +1,106 @@
 import os
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
-import firebase_admin
-from firebase_admin import credentials, firestore, auth as admin_auth
-
 CLIENT_EMAIL = os.getenv("CLIENT_EMAIL")
 PRIVATE_KEY  = (os.getenv("PRIVATE_KEY") or "").replace("\\n", "\n")
 PROJECT_ID   = os.getenv("PROJECT_ID")
-assert CLIENT_EMAIL and PRIVATE_KEY and PROJECT_ID, "Faltam variáveis no .env"
 
-# Monta o “service account” mínimo (sem precisar do arquivo .json)
-service_account_info = {
-    "type": "service_account",
-    "project_id": PROJECT_ID,
-    "private_key": PRIVATE_KEY,
-    "client_email": CLIENT_EMAIL,
-    "token_uri": "https://oauth2.googleapis.com/token",
-}
+# "firestore" (padrão) ou "memory" (services/memory_firestore.py, sem projeto Firebase)
+DATA_BACKEND = os.getenv("DATA_BACKEND", "firestore")
+
+# O Admin SDK e o cliente do Firestore só são criados no primeiro uso (ou no
+# warm-up do lifespan), para que importar o app não dependa do .env nem da rede
+_lock = threading.Lock()
+_fs = None
+
+
+def _init_app():
+    import firebase_admin
+    from firebase_admin import credentials
+
+    assert CLIENT_EMAIL and PRIVATE_KEY and PROJECT_ID, "Faltam variáveis no .env"
+
+    # Monta o “service account” mínimo (sem precisar do arquivo .json)
+    service_account_info = {
+        "type": "service_account",
+        "project_id": PROJECT_ID,
+        "private_key": PRIVATE_KEY,
+        "client_email": CLIENT_EMAIL,
+        "token_uri": "https://oauth2.googleapis.com/token",
+    }
+
+    cred = credentials.Certificate(service_account_info)
+
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(cred, {"projectId": PROJECT_ID})
+
+
+def get_fs():
+    """Cliente assíncrono do Firestore, criado sob demanda (os handlers fazem await nas operações)."""
+    global _fs
+    if _fs is None:
+        with _lock:
+            if _fs is None and DATA_BACKEND == "memory":
+                from services.memory_firestore import MemoryClient
+
+                _fs = MemoryClient()
+            elif _fs is None:
+                from firebase_admin import firestore_async
+
+                _init_app()
+                _fs = firestore_async.client()
+    return _fs
+
+
+_watch_fs = None
+
+
+def get_watch_fs():
+    """
+    Cliente síncrono usado só pelos listeners (on_snapshot não existe no
+    cliente assíncrono); os callbacks rodam numa thread do SDK.
+    """
+    global _watch_fs
+    if DATA_BACKEND == "memory":
+        return get_fs()
+    if _watch_fs is None:
+        with _lock:
+            if _watch_fs is None:
+                from firebase_admin import firestore
+
+                _init_app()
+                _watch_fs = firestore.client()
+    return _watch_fs
+
+
+def get_auth():
+    from firebase_admin import auth as admin_auth
+
+    get_fs()
+    return admin_auth
+
+
+def transactional(fn):
+    """Decorator de transação assíncrona (importa o SDK só quando usado)."""
+    if DATA_BACKEND == "memory":
+        from services.memory_firestore import transactional as memory_transactional
+
+        return memory_transactional(fn)
+
+    from google.cloud.firestore import async_transactional
+
+    return async_transactional(fn)
+
+
+def increment(value):
+    if DATA_BACKEND == "memory":
+        from services.memory_firestore import Increment
 
-cred = credentials.Certificate(service_account_info)
+        return Increment(value)
 
-if not firebase_admin._apps:
-    firebase_admin.initialize_app(cred, {"projectId": PROJECT_ID})
+    from google.cloud.firestore import Increment
 
-fs = firestore.client()
-auth = admin_auth
\ No newline at end of file
+    return Increment(value)
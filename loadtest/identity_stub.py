@@ -0,0 +1,175 @@
+"""
+Stub local do Identity Toolkit / Secure Token / certificados de assinatura,
+para rodar o app sem um projeto Firebase. Emite ID tokens RS256 válidos para
+o TokenVerifier (mesmo iss/aud/sub do Firebase) assinados com uma chave gerada
+na subida.
+
+    python -m loadtest.identity_stub --port 9099
+
+e no app: IDENTITY_TOOLKIT_URL=SECURE_TOKEN_URL=http://127.0.0.1:9099,
+TOKEN_CERTS_URL=http://127.0.0.1:9099/certs, PROJECT_ID igual ao do stub.
+"""
+import os
+import time
+import uuid
+import asyncio
+import argparse
+from datetime import datetime, timezone, timedelta
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+PROJECT_ID = os.getenv("PROJECT_ID", "sinu-loadtest")
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "0"))
+TOKEN_TTL = 3600
+
+
+def _generate_signing_key() -> tuple[str, str]:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "identity-stub")])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=30))
+        .sign(key, hashes.SHA256())
+    )
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    return private_pem, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+KEY_ID = uuid.uuid4().hex
+_private_pem, _cert_pem = _generate_signing_key()
+_signer = None
+
+# email -> {uid, password, name}; refresh token -> email
+_users: dict[str, dict] = {}
+_refresh_tokens: dict[str, str] = {}
+
+app = FastAPI()
+
+
+def _sign_id_token(uid: str, email: str, name: str | None = None) -> str:
+    from google.auth import crypt, jwt
+
+    global _signer
+    if _signer is None:
+        # Carregar a chave RSA é caro; o signer é criado uma vez só
+        _signer = crypt.RSASigner.from_string(_private_pem, KEY_ID)
+
+    now = int(time.time())
+    claims = {
+        "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+        "aud": PROJECT_ID,
+        "auth_time": now,
+        "user_id": uid,
+        "sub": uid,
+        "iat": now,
+        "exp": now + TOKEN_TTL,
+        "email": email,
+        "email_verified": False,
+        "firebase": {"identities": {"email": [email]}, "sign_in_provider": "password"},
+    }
+    if name:
+        claims["name"] = name
+    return jwt.encode(_signer, claims).decode()
+
+
+def _session(user: dict) -> dict:
+    refresh_token = uuid.uuid4().hex
+    _refresh_tokens[refresh_token] = user["email"]
+    return {
+        "idToken": _sign_id_token(user["uid"], user["email"], user.get("name")),
+        "refreshToken": refresh_token,
+        "localId": user["uid"],
+        "email": user["email"],
+        "displayName": user.get("name"),
+        "expiresIn": str(TOKEN_TTL),
+    }
+
+
+def _error(message: str, status: int = 400) -> JSONResponse:
+    return JSONResponse({"error": {"code": status, "message": message}}, status_code=status)
+
+
+@app.middleware("http")
+async def injected_latency(request: Request, call_next):
+    if STUB_LATENCY_MS:
+        await asyncio.sleep(STUB_LATENCY_MS / 1000)
+    return await call_next(request)
+
+
+@app.get("/certs")
+def certs():
+    return JSONResponse({KEY_ID: _cert_pem}, headers={"Cache-Control": "public, max-age=3600"})
+
+
+@app.post("/v1/accounts:signUp")
+async def sign_up(request: Request):
+    body = await request.json()
+    email = body.get("email")
+    if not email or not body.get("password"):
+        return _error("MISSING_EMAIL")
+    if email in _users:
+        return _error("EMAIL_EXISTS")
+
+    _users[email] = {"uid": uuid.uuid4().hex[:28], "email": email, "password": body["password"]}
+    return _session(_users[email])
+
+
+@app.post("/v1/accounts:signInWithPassword")
+async def sign_in_with_password(request: Request):
+    body = await request.json()
+    user = _users.get(body.get("email"))
+    if user is None:
+        return _error("EMAIL_NOT_FOUND")
+    if user["password"] != body.get("password"):
+        return _error("INVALID_PASSWORD")
+    return _session(user)
+
+
+@app.post("/v1/accounts:signInWithIdp")
+async def sign_in_with_idp(request: Request):
+    body = await request.json()
+    # Qualquer token do Google é aceito; o e-mail é derivado dele
+    token = body.get("postBody", "").split("=", 1)[-1].split("&", 1)[0]
+    email = f"google-{token[:16]}@example.com"
+    user = _users.setdefault(email, {"uid": uuid.uuid4().hex[:28], "email": email, "password": None, "name": "Google User"})
+    return _session(user)
+
+
+@app.post("/v1/token")
+async def refresh_token(request: Request):
+    form = await request.form()
+    email = _refresh_tokens.pop(form.get("refresh_token"), None)
+    if form.get("grant_type") != "refresh_token" or email is None:
+        return _error("INVALID_REFRESH_TOKEN")
+
+    session = _session(_users[email])
+    return {
+        "id_token": session["idToken"],
+        "refresh_token": session["refreshToken"],
+        "user_id": session["localId"],
+        "expires_in": session["expiresIn"],
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9099)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
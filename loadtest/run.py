@@ -0,0 +1,324 @@
+"""
+Gerador de carga: N usuários virtuais executando uma mistura de operações
+(login, list, add, update, recalc) por um tempo fixo. Mede p50/p95/p99 e
+throughput por rota e grava o resultado em JSON para comparar execuções.
+
+    # sobe o stub de identidade e o app (DATA_BACKEND=memory) e roda a carga
+    python -m loadtest.run --spawn --users 20 --duration 30
+
+    # contra um app já rodando, comparando com uma execução anterior
+    python -m loadtest.run --base-url http://127.0.0.1:8000 --compare loadtest/results/antes.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from datetime import datetime, timezone
+
+import httpx
+
+DEFAULT_MIX = "login=1,list=6,add=2,update=2,recalc=0.2"
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    unknown = set(weights) - set(ACTIONS)
+    if unknown:
+        raise SystemExit(f"Unknown actions in --mix: {', '.join(sorted(unknown))}")
+    return weights
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def _subscription_payload() -> dict:
+    day = random.randint(1, 28)
+    return {
+        "name": random.choice(["Netflix", "Spotify", "Gym", "Cloud", "News", "Music"]),
+        "description": None,
+        "price": round(random.uniform(5, 120), 2),
+        "currency": random.choice(["BRL", "USD"]),
+        "subscriptionType": "monthly",
+        "billingDay": day,
+        "billingFrequency": "monthly",
+        "nextPayment": f"2026-{random.randint(1, 12):02d}-{day:02d}T12:00:00.000Z",
+        "paymentMethod": "credit_card",
+        "status": 1,
+        "cardBank": "Bank",
+        "cardFinalNumbers": random.choice(["1234", "5678", "9012"]),
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    def add(self, route: str, seconds: float, ok: bool):
+        self.samples.setdefault(route, []).append(seconds)
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    async def call(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs) -> httpx.Response | None:
+        started = time.perf_counter()
+        try:
+            r = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.add(route, time.perf_counter() - started, False)
+            return None
+        self.add(route, time.perf_counter() - started, r.status_code < 400)
+        return r
+
+    def report(self, elapsed: float) -> dict:
+        routes = {}
+        for route, values in sorted(self.samples.items()):
+            values = sorted(values)
+            routes[route] = {
+                "count": len(values),
+                "errors": self.errors.get(route, 0),
+                "throughput": round(len(values) / elapsed, 2),
+                "p50Ms": round(_percentile(values, 50) * 1000, 2),
+                "p95Ms": round(_percentile(values, 95) * 1000, 2),
+                "p99Ms": round(_percentile(values, 99) * 1000, 2),
+                "meanMs": round(sum(values) / len(values) * 1000, 2),
+                "maxMs": round(values[-1] * 1000, 2),
+            }
+        total = sum(r["count"] for r in routes.values())
+        return {
+            "requests": total,
+            "errors": sum(self.errors.values()),
+            "throughput": round(total / elapsed, 2),
+            "routes": routes,
+        }
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, index: int, run_id: str, job_token: str | None):
+        self.client = client
+        self.recorder = recorder
+        self.email = f"lt-{run_id}-{index}@example.com"
+        self.password = f"pw-{run_id}-{index}"
+        self.job_token = job_token
+        self.id_token = None
+        self.subscription_ids: list[str] = []
+
+    @property
+    def auth(self) -> dict:
+        return {"Authorization": f"Bearer {self.id_token}"}
+
+    async def setup(self, seed: int):
+        r = await self.recorder.call(
+            self.client, "POST /signup", "POST", "/signup",
+            json={"name": self.email, "email": self.email, "password": self.password},
+        )
+        if r is None or r.status_code != 200:
+            raise RuntimeError(f"Signup failed: {r.status_code if r else 'connection error'} {r.text if r else ''}")
+        self.id_token = r.json()["idToken"]
+        for _ in range(seed):
+            await self.add()
+
+    async def login(self):
+        r = await self.recorder.call(
+            self.client, "POST /login", "POST", "/login", json={"email": self.email, "password": self.password}
+        )
+        if r is not None and r.status_code == 200:
+            self.id_token = r.json()["idToken"]
+
+    async def list(self):
+        await self.recorder.call(
+            self.client, "GET /subscription/list", "GET", "/subscription/list", params={"limit": 50}, headers=self.auth
+        )
+
+    async def add(self):
+        r = await self.recorder.call(
+            self.client, "POST /subscription/add", "POST", "/subscription/add", json=_subscription_payload(), headers=self.auth
+        )
+        if r is not None and r.status_code == 200:
+            self.subscription_ids.append(r.json()["subscription_id"])
+
+    async def update(self):
+        if not self.subscription_ids:
+            return await self.add()
+        await self.recorder.call(
+            self.client, "PATCH /subscription/update/{id}", "PATCH",
+            f"/subscription/update/{random.choice(self.subscription_ids)}",
+            json={"price": round(random.uniform(5, 120), 2)}, headers=self.auth,
+        )
+
+    async def recalc(self):
+        await self.recorder.call(
+            self.client, "POST /job/recalculate", "POST", "/job/recalculate?wait=true",
+            headers={"Authorization": f"Bearer {self.job_token}"},
+        )
+
+    async def run(self, weights: dict[str, float], deadline: float):
+        actions, cumulative = list(weights), list(weights.values())
+        while time.perf_counter() < deadline:
+            action = random.choices(actions, weights=cumulative)[0]
+            await getattr(self, action)()
+
+
+ACTIONS = ("login", "list", "add", "update", "recalc")
+
+
+async def run_load(args) -> dict:
+    weights = _parse_mix(args.mix)
+    recorder = Recorder()
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30) as client:
+        users = [VirtualUser(client, recorder, i, run_id, args.job_token) for i in range(args.users)]
+        await asyncio.gather(*(u.setup(args.seed) for u in users))
+
+        # As métricas de setup (signup + carga inicial) não entram no resultado
+        recorder = Recorder()
+        for user in users:
+            user.recorder = recorder
+
+        started = time.perf_counter()
+        await asyncio.gather(*(u.run(weights, started + args.duration) for u in users))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "startedAt": datetime.now(timezone.utc).isoformat(),
+        "gitCommit": _git_commit(),
+        "config": {
+            "baseUrl": args.base_url,
+            "users": args.users,
+            "durationS": args.duration,
+            "mix": weights,
+            "seedPerUser": args.seed,
+            "memoryLatencyMs": os.getenv("MEMORY_LATENCY_MS"),
+            "stubLatencyMs": os.getenv("STUB_LATENCY_MS"),
+        },
+        "elapsedS": round(elapsed, 2),
+        **recorder.report(elapsed),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def _wait_ready(url: str, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Timed out waiting for {url}")
+
+
+def _spawn(args) -> list[subprocess.Popen]:
+    """Sobe o stub de identidade e o app (backend em memória) como subprocessos."""
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    env = {
+        **os.environ,
+        "DATA_BACKEND": "memory",
+        "PROJECT_ID": os.getenv("PROJECT_ID", "sinu-loadtest"),
+        "API_KEY": "loadtest",
+        "JOB_TOKEN": args.job_token,
+        "IDENTITY_TOOLKIT_URL": stub_url,
+        "SECURE_TOKEN_URL": stub_url,
+        "TOKEN_CERTS_URL": f"{stub_url}/certs",
+        "OUTBOX_PATH": ":memory:",
+        "WARMUP_TIMEOUT": "2",
+        # Todos os usuários virtuais saem do mesmo IP
+        "RATE_LIMIT_LOGIN": "1000000/1",
+        "RATE_LIMIT_SIGNUP": "1000000/1",
+    }
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "loadtest.identity_stub", "--port", str(args.stub_port)], cwd=root, env=env
+    )
+    _wait_ready(f"{stub_url}/certs")
+
+    port = args.base_url.rsplit(":", 1)[-1].split("/")[0]
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", port, "--log-level", "warning"], cwd=root, env=env
+    )
+    _wait_ready(f"{args.base_url}/health")
+    return [api, stub]
+
+
+def _compare(result: dict, base_path: str):
+    with open(base_path) as f:
+        base = json.load(f)
+
+    def delta(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"\nvs {base_path} ({base.get('gitCommit')})")
+    print(f"{'route':34} {'p50':>10} {'p95':>10} {'p99':>10} {'req/s':>10}")
+    for route, stats in result["routes"].items():
+        old = base["routes"].get(route)
+        if not old:
+            continue
+        print(
+            f"{route:34} {delta(stats['p50Ms'], old['p50Ms']):>10} {delta(stats['p95Ms'], old['p95Ms']):>10} "
+            f"{delta(stats['p99Ms'], old['p99Ms']):>10} {delta(stats['throughput'], old['throughput']):>10}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the sinu API")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"action weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=10, help="subscriptions created per user before the run")
+    parser.add_argument("--job-token", default=os.getenv("JOB_TOKEN", "loadtest-job-token"))
+    parser.add_argument("--spawn", action="store_true", help="start the identity stub and the app (memory backend)")
+    parser.add_argument("--stub-port", type=int, default=9099)
+    parser.add_argument("--out", help="result file (default: loadtest/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="previous result file to compare against")
+    args = parser.parse_args()
+
+    processes = _spawn(args) if args.spawn else []
+    try:
+        result = asyncio.run(run_load(args))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    out = args.out or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"{'route':34} {'count':>7} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+    for route, stats in result["routes"].items():
+        print(
+            f"{route:34} {stats['count']:>7} {stats['errors']:>5} {stats['p50Ms']:>9} "
+            f"{stats['p95Ms']:>9} {stats['p99Ms']:>9} {stats['throughput']:>8}"
+        )
+    print(f"\n{result['requests']} requests, {result['errors']} errors, {result['throughput']} req/s -> {out}")
+
+    if args.compare:
+        _compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,94 @@
+import time
+STARTED_AT = time.perf_counter()
+
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, HTTPException, Header, Depends, Request, Response, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Header, Depends, Request, Response, Body, Query
+from fastapi import WebSocket, WebSocketDisconnect
 from google.auth.exceptions import GoogleAuthError
-from firebase import fs, auth as fb_auth
+from firebase import get_fs, transactional, PROJECT_ID
 from fastapi import Depends
-from pydantic import BaseModel
-import os, requests
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import AfterValidator, BaseModel
+from typing import Annotated, Literal
+from contextlib import asynccontextmanager
+import os, json, base64, asyncio, hashlib, importlib, httpx
 from datetime import datetime, timezone
-from dateutil.relativedelta import relativedelta 
-from services.services import send_email
+from services.outbox import Outbox
+from services.change_feed import ChangeFeed, FeedFull
+from services import billing, cards, rollup, subscription_io, status_engine, summary, timestamps
+from services.token_verifier import InvalidTokenError, TokenVerifier
+from services.response_cache import EtagBuilder, ResponseCache, etag_for
+from services import http_client, idempotency, jobs, metrics, migrate_timestamps, profiling, resilience
+from services.single_flight import SingleFlight
+from services.admission import Admission, AdmissionMiddleware, Rejected, client_ip
+from services.http_client import IDENTITY_TOOLKIT_URL, SECURE_TOKEN_URL
+
+# Módulos pesados importados em paralelo durante o warm-up
+WARMUP_MODULES = ["firebase_admin.firestore_async", "google.cloud.firestore", "google.auth.jwt"]
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))
+
+async def _timed(step: str, timings: dict, fn, *args):
+    started = time.perf_counter()
+    try:
+        return await fn(*args)
+    finally:
+        timings[step] = round((time.perf_counter() - started) * 1000, 1)
+
+async def _open_firestore_channel():
+    # Uma leitura qualquer abre o canal gRPC antes da primeira requisição
+    await get_fs().collection("jobs").document("warmup").get()
+
+async def _warm_up(app: FastAPI):
+    timings = {}
+    await asyncio.gather(
+        *(_timed(f"import:{name}", timings, asyncio.to_thread, importlib.import_module, name) for name in WARMUP_MODULES)
+    )
+    metrics.instrument_firestore()
+    resilience.protect_firestore()
+    await _timed("firebase", timings, asyncio.to_thread, get_fs)
+
+    results = await asyncio.gather(
+        _timed("firestoreChannel", timings, asyncio.wait_for, _open_firestore_channel(), WARMUP_TIMEOUT),
+        _timed("signingKeys", timings, asyncio.wait_for, asyncio.to_thread(token_verifier.keys.get), WARMUP_TIMEOUT),
+        return_exceptions=True,
+    )
+    for result in results:
+        # Falha de rede no warm-up não impede a subida; a primeira requisição tenta de novo
+        if isinstance(result, Exception):
+            print(f"Warm-up step failed: {result!r}")
+
+    app.state.warmup = timings
+    app.state.time_to_ready_ms = round((time.perf_counter() - STARTED_AT) * 1000, 1)
+    print(f"Ready in {app.state.time_to_ready_ms} ms (warm-up: {timings})")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.time_to_ready_ms = None
+    await _warm_up(app)
+    profiling.instrument_sync_endpoints(app)
+    get_support_outbox().start()
+    yield
+    change_feed.close()
+    # join() da thread do sender fora do event loop
+    await asyncio.to_thread(get_support_outbox().stop)
+    await http_client.close_client()
+
+app =  FastAPI(lifespan=lifespan)
+
+@app.exception_handler(resilience.DependencyUnavailable)
+async def dependency_unavailable(request: Request, exc: resilience.DependencyUnavailable):
+    # Circuito aberto: falha na hora em vez de esperar a dependência
+    return JSONResponse(
+        {"detail": "SERVICE_UNAVAILABLE", "dependency": exc.dependency},
+        status_code=503,
+        headers={"Retry-After": str(int(exc.retry_after))},
+    )
 
-app =  FastAPI()
+# Bulkheads por grupo de rotas (jobs isolados) e rate limit nos endpoints de auth/suporte.
+# Fica dentro do CORS para o navegador conseguir ler os 429/503.
+admission = Admission()
+app.add_middleware(AdmissionMiddleware, bulkheads=admission.bulkheads)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,16 +102,64 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Server-Timing", "X-Profile-Id", "Idempotent-Replayed"],
 )
 
+# Latência por rota e chamadas a Firestore/Google/SMTP (exposto em /metrics)
+app.add_middleware(metrics.MetricsMiddleware)
+
 API_KEY = os.getenv("API_KEY")
 JOB_TOKEN = os.getenv("JOB_TOKEN")
+RECALC_BATCH_SIZE = 500
+RECALC_CHUNK_SIZE = 5000     # documentos avaliados por passada do status_engine
+IMPORT_BATCH_SIZE = 500
+IMPORT_MAX_ERRORS = 100      # erros de linha devolvidos na resposta (o resto só é contado)
+BATCH_MAX_OPERATIONS = 500   # operações por chamada de /subscription/batch e /cards/batch
+COMMIT_MAX_WRITES = 500      # limite de escritas de um commit do Firestore
+CONFIRM_BULK_MAX = COMMIT_MAX_WRITES - 1  # um commit só: assinaturas + o set do rollup
+
+# Verificação local dos ID tokens (chaves em memória + cache de tokens verificados)
+token_verifier = TokenVerifier(PROJECT_ID)
+
+# Cache por usuário das respostas de leitura (invalidado pelas mutações)
+response_cache = ResponseCache()
+
+# Refreshes simultâneos do mesmo token (abas acordando juntas) viram uma chamada só
+refresh_flight = SingleFlight()
+
+# Fila persistente dos e-mails de suporte (enviados em background). Criada no
+# lifespan (ou no primeiro uso), para que importar o app não abra o SQLite
+_support_outbox: Outbox | None = None
+
+def get_support_outbox() -> Outbox:
+    global _support_outbox
+    if _support_outbox is None:
+        _support_outbox = Outbox()
+    return _support_outbox
+
+# Um listener do Firestore por usuário conectado em /subscription/stream
+change_feed = ChangeFeed()
+metrics.register_gauge("sinu_feed_connections", "Open /subscription/stream connections", lambda: change_feed.connections)
+metrics.register_gauge("sinu_feed_listeners", "Active Firestore snapshot listeners", lambda: change_feed.listeners)
+STREAM_PING_SECONDS = 15     # mantém a conexão viva através de proxies
+
+# Perfis recentes (X-Profile: <JOB_TOKEN> ou amostragem 1-em-N por rota)
+profile_store = profiling.ProfileStore()
+app.add_middleware(profiling.ProfilingMiddleware, store=profile_store, token=JOB_TOKEN)
 
 class UserData(BaseModel):
     name: str | None = None
     email: str
     password: str
 
+def _iso_date(value: str) -> str:
+    # Gravado como Timestamp: precisa ser uma data ISO válida
+    if timestamps.to_instant(value) is None:
+        raise ValueError("must be an ISO 8601 date")
+    return value
+
+IsoDate = Annotated[str, AfterValidator(_iso_date)]
+
 class SubscriptionData(BaseModel):
     name: str
     description: str | None = None
@@ -41,12 +168,15 @@ class SubscriptionData(BaseModel):
     subscriptionType: str
     billingDay: int
     billingFrequency: str
-    nextPayment: str
+    nextPayment: IsoDate
     paymentMethod: str
     status: int
     cardBank: str | None = None
     cardFinalNumbers: str | None = None
 
+# Campos que podem ser pedidos em `fields=` no /subscription/list
+SUBSCRIPTION_FIELDS = set(SubscriptionData.model_fields) | {"user_id", "createdDate"}
+
 class SubscriptionUpdate(BaseModel):
     name: str | None = None
     description: str | None = None
@@ -55,12 +185,23 @@ class SubscriptionUpdate(BaseModel):
     subscriptionType: str | None = None
     billingDay: int | None = None
     billingFrequency: str | None = None
-    nextPayment: str | None = None
+    nextPayment: IsoDate | None = None
     paymentMethod: str | None = None
     status: int | None = None
     cardBank: str | None = None
     cardFinalNumbers: str | None = None
 
+class BulkConfirmRequest(BaseModel):
+    ids: list[str]
+
+class SubscriptionOperation(BaseModel):
+    op: Literal["update", "delete"]
+    id: str
+    update: SubscriptionUpdate | None = None
+
+class SubscriptionBatchRequest(BaseModel):
+    operations: list[SubscriptionOperation]
+
 class SupportRequest(BaseModel):
     name: str
     email: str
@@ -76,68 +217,206 @@ class CardData(BaseModel):
     limit: float
     status: int
 
-def _update_card_total_spent(uid: str, card_final_numbers: str):
-    """
-    Recalcula o total gasto de um cartão específico com base em todas as
-    assinaturas associadas a ele.
-    """
-    if not card_final_numbers:
-        return
-
-    # 1. Encontra todas as assinaturas para este cartão
-    subscriptions_ref = fs.collection("accounts").document(uid).collection("subscriptions")
-    query = subscriptions_ref.where("cardFinalNumbers", "==", card_final_numbers)
-    
-    total_spent = 0.0
-    for sub in query.stream():
-        total_spent += sub.to_dict().get("price", 0.0)
-
-    # 2. Encontra o documento do cartão para atualizar
-    cards_ref = fs.collection("accounts").document(uid).collection("cards")
-    card_query = cards_ref.where("cardFinalNumbers", "==", card_final_numbers).limit(1)
-    
-    card_doc = next(card_query.stream(), None)
-    if card_doc:
-        # 3. Atualiza o total gasto no documento do cartão
-        card_doc.reference.update({"totalSpent": total_spent})
+class CardOperation(BaseModel):
+    op: Literal["update", "delete"]
+    id: str
+    update: CardData | None = None
 
+class CardBatchRequest(BaseModel):
+    operations: list[CardOperation]
 
 @app.get("/")
 async def root():
     return {"message": "Hello World"}
 
-def verify_firebase_token(authorization: str = Header(None)):
+@app.get("/health")
+async def health():
+    return {
+        "ready": app.state.time_to_ready_ms is not None,
+        "timeToReadyMs": app.state.time_to_ready_ms,
+        "warmupMs": getattr(app.state, "warmup", {}),
+        "dependencies": resilience.states(),
+    }
+
+async def verify_firebase_token(authorization: str = Header(None)):
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing token")
     id_token = authorization.split(" ", 1)[1]
+
+    # Token já verificado: só uma consulta ao cache, sem sair do event loop
+    decoded = token_verifier.get_cached(id_token)
+    if decoded is not None:
+        return decoded
+
     try:
-        decoded = fb_auth.verify_id_token(id_token)  # verifica assinatura e expiração
+        decoded = await run_in_threadpool(token_verifier.verify, id_token)  # verifica assinatura e expiração
         return decoded  # contém uid, email, name, picture, etc.
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid token")
     
+async def verify_stream_token(authorization: str = Header(None), access_token: str | None = Query(default=None)):
+    # EventSource do navegador não manda headers: aceita o ID token (vale 1h) na query,
+    # verificado do mesmo jeito que o do header
+    if not authorization and access_token:
+        authorization = f"Bearer {access_token}"
+    return await verify_firebase_token(authorization)
+
+def rate_limited(name: str):
+    limiter = admission.rate_limiters[name]
+
+    async def check(req: Request, authorization: str = Header(None)):
+        # Por uid quando o token já foi verificado antes (só consulta o cache); senão por IP
+        decoded = None
+        if authorization and authorization.startswith("Bearer "):
+            decoded = token_verifier.get_cached(authorization.split(" ", 1)[1])
+        uid = decoded and (decoded.get("uid") or decoded.get("user_id"))
+        try:
+            limiter.check(f"uid:{uid}" if uid else f"ip:{client_ip(req.scope)}")
+        except Rejected as e:
+            raise HTTPException(status_code=429, detail=e.detail, headers={"Retry-After": str(max(1, round(e.retry_after)))})
+
+    return check
+
 def verify_job_token(authorization: str = Header(None)):
     if authorization != f"Bearer {JOB_TOKEN}":
         raise HTTPException(status_code=401, detail="Invalid job token")
     
 def parse_next_payment(value):
-    
-    if value is None:
-        return None
-    
-    if hasattr(value, "to_datetime"):  # Timestamp do Firestore
-        return value.to_datetime().astimezone(timezone.utc)
-    
-    if isinstance(value, str):
-        # "2026-01-01T19:41:21.994Z" -> datetime
-        if value.endswith("Z"):
-            value = value.replace("Z", "+00:00")
-        return datetime.fromisoformat(value).astimezone(timezone.utc)
+    # Timestamp nativo ou string ISO (documentos ainda não migrados)
+    return timestamps.to_instant(value)
+
+async def _idempotent(uid: str, scope: str, key: str | None, payload, run):
+    """
+    Executa `run()` uma vez por Idempotency-Key: repetições com a mesma chave
+    recebem a resposta gravada (header Idempotent-Replayed) sem refazer escritas.
+    """
+    if key is None:
+        return await run()
+    if not key or len(key) > idempotency.IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
+
+    try:
+        saved = await idempotency.begin(uid, scope, key, idempotency.fingerprint(payload))
+    except idempotency.IdempotencyConflict as e:
+        raise HTTPException(status_code=409 if e.in_progress else 422, detail=str(e))
+    if saved is not None:
+        return JSONResponse(saved["body"], status_code=saved["status"], headers={"Idempotent-Replayed": "true"})
 
-    return None
+    try:
+        body = await run()
+    except BaseException:
+        # Falhou: a chave fica livre para uma nova tentativa
+        await idempotency.release(uid, scope, key)
+        raise
+    await idempotency.complete(uid, scope, key, 200, body)
+    return body
+
+def _check_operations(operations: list) -> list[dict]:
+    """Resultado inicial de cada operação; erro já nas repetidas e nos updates vazios."""
+    if not operations:
+        raise HTTPException(status_code=400, detail="No operations")
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_OPERATIONS} operations per request")
+
+    results, seen = [], set()
+    for operation in operations:
+        result = {"id": operation.id, "op": operation.op, "ok": False}
+        if operation.id in seen:
+            result["error"] = "Duplicate operation for this id"
+        elif operation.op == "update" and not (operation.update and operation.update.model_dump(exclude_unset=True)):
+            result["error"] = "No fields to update"
+        seen.add(operation.id)
+        results.append(result)
+    return results
+
+class _ChunkedCommit:
+    """
+    Batches de até COMMIT_MAX_WRITES escritas. Cada commit é atômico e leva os
+    incrementos (cartões, rollup) das próprias operações; um commit que falha
+    marca só as operações dele.
+    """
 
-@app.post("/auth/google")
-def login_google(
+    def __init__(self, uid: str, card_refs: dict | None = None):
+        self.uid = uid
+        self.card_refs = card_refs or {}
+        self.commits = 0
+        self._reset()
+
+    def _reset(self):
+        self.batch = get_fs().batch()
+        self.writes = 0
+        self.card_deltas = {}
+        self.rollup_deltas = {}
+        self.results = []
+
+    def _total_writes(self, writes: list, card_deltas: dict, rollup_deltas: dict) -> int:
+        # Além dos documentos: um incremento por cartão (agregado no commit) e o rollup da conta
+        cards_touched = {card for card in (*self.card_deltas, *card_deltas) if card in self.card_refs}
+        return self.writes + len(writes) + len(cards_touched) + (1 if self.rollup_deltas or rollup_deltas else 0)
+
+    async def add(self, result: dict, writes: list, card_deltas: dict | None = None, rollup_deltas: dict | None = None):
+        """`writes`: [(método do batch, ref, dados...)] de uma operação."""
+        card_deltas, rollup_deltas = card_deltas or {}, rollup_deltas or {}
+        if self._total_writes(writes, card_deltas, rollup_deltas) > COMMIT_MAX_WRITES:
+            await self.flush()
+        for method, ref, *data in writes:
+            getattr(self.batch, method)(ref, *data)
+        self.writes += len(writes)
+        rollup.add_deltas(self.card_deltas, card_deltas)
+        rollup.add_deltas(self.rollup_deltas, rollup_deltas)
+        self.results.append(result)
+
+    async def flush(self):
+        if not self.results:
+            return
+        cards.apply_card_deltas(self.batch, self.card_refs, {c: d for c, d in self.card_deltas.items() if d})
+        if self.rollup_deltas:
+            rollup.apply_rollup(self.batch, self.uid, self.rollup_deltas)
+        try:
+            await self.batch.commit()
+        except Exception as e:
+            for result in self.results:
+                result["error"] = f"Commit failed: {e}"
+        else:
+            self.commits += 1
+            for result in self.results:
+                result["ok"] = True
+        self._reset()
+
+async def _cached_response(req: Request, res: Response, uid: str, resource: str, loader):
+    """
+    Read-through no cache por usuário. `loader` (async) devolve (valor, etag).
+    Se o cliente já tem a versão atual (If-None-Match), responde 304 sem corpo.
+    """
+    entry = response_cache.get(uid, resource)
+    if entry is None:
+        value, etag = await loader()
+        # Timestamps saem como ISO com "Z", o mesmo formato de quando eram strings
+        entry = response_cache.set(uid, resource, timestamps.to_json(value), etag)
+
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    if req.headers.get("if-none-match") == entry.etag:
+        return Response(status_code=304, headers=headers)
+
+    res.headers.update(headers)
+    return entry.value
+
+async def _google_post(url: str, idempotent: bool = False, **kwargs):
+    # Chamada aos endpoints de auth do Google pelo cliente compartilhado (prazo, retries e breaker)
+    try:
+        r = await http_client.post(url, idempotent=idempotent, **kwargs)
+    except (httpx.TimeoutException, asyncio.TimeoutError):
+        raise HTTPException(status_code=504, detail="UPSTREAM_TIMEOUT")
+    except httpx.HTTPError:
+        raise HTTPException(status_code=502, detail="UPSTREAM_UNAVAILABLE")
+
+    # Erro do Google não é credencial inválida: não derruba sessão nem cookie
+    if r.status_code >= 500 or r.status_code == 429:
+        raise HTTPException(status_code=502, detail="UPSTREAM_UNAVAILABLE")
+    return r
+
+@app.post("/auth/google", dependencies=[Depends(rate_limited("google"))])
+async def login_google(
     req: Request, # Adicionado para acessar os cabeçalhos
     res: Response,
     googleIdToken: str | None = Body(default=None, embed=True),
@@ -147,7 +426,7 @@ def login_google(
         raise HTTPException(status_code=400, detail="Missing googleIdToken or accessToken")    
 
     # 1) Troca no Firebase (signInWithIdp)
-    url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithIdp?key={API_KEY}"   
+    url = f"{IDENTITY_TOOLKIT_URL}/v1/accounts:signInWithIdp?key={API_KEY}"   
     if googleIdToken:
         post_body = f"id_token={googleIdToken}&providerId=google.com"                         
     else:
@@ -170,7 +449,7 @@ def login_google(
         "returnIdpCredential": True,
         "returnSecureToken": True
     }
-    r = requests.post(url, json=payload)                                                       
+    r = await _google_post(url, idempotent=True, json=payload)
     if r.status_code != 200:
         msg = r.json().get("error", {}).get("message", "GOOGLE_SIGNIN_FAILED")
         raise HTTPException(status_code=400, detail=msg)
@@ -198,7 +477,7 @@ def login_google(
         if not user_name:
             try:
                 # Decodifica o token para extrair o nome de dentro dele
-                decoded_token = fb_auth.verify_id_token(id_token, check_revoked=False)
+                decoded_token = await run_in_threadpool(token_verifier.verify, id_token)
                 user_name = decoded_token.get("name")
             except Exception:
                 user_name = None  # Garante que não quebre se a decodificação falhar
@@ -206,25 +485,26 @@ def login_google(
         update_data = {
             "uid": uid,
             "email": data.get("email"),
-            "lastLoginAt": datetime.now(timezone.utc).isoformat(),
+            "lastLoginAt": datetime.now(timezone.utc),
         }
 
         # Só adiciona o nome para atualização se ele foi encontrado
         if user_name:
             update_data["name"] = user_name
 
-        fs.collection("accounts").document(uid).set(update_data, merge=True)
+        await get_fs().collection("accounts").document(uid).set(update_data, merge=True)
+        response_cache.invalidate(uid)
     except Exception:
         pass
 
     return {"idToken": id_token, "uid": uid, "token_type": "Bearer"} 
 
 
-@app.post("/signup")
+@app.post("/signup", dependencies=[Depends(rate_limited("signup"))])
 async def signup(user: UserData, res: Response):
-    url = f"https://identitytoolkit.googleapis.com/v1/accounts:signUp?key={API_KEY}"
+    url = f"{IDENTITY_TOOLKIT_URL}/v1/accounts:signUp?key={API_KEY}"
     payload = {"email": user.email, "password": user.password, "returnSecureToken": True}
-    r = requests.post(url, json=payload)
+    r = await _google_post(url, json=payload)
     if r.status_code != 200:
         msg = r.json().get("error", {}).get("message", "SIGNUP_FAILED")
         raise HTTPException(status_code=400, detail=msg)
@@ -233,15 +513,17 @@ async def signup(user: UserData, res: Response):
     uid = data["localId"]
 
     try:
-        fs.collection("accounts").document(uid).set({
+        await get_fs().collection("accounts").document(uid).set({
             "uid": uid,
             "name": user.name,
             "email": user.email,
-            "createdAt": datetime.now(timezone.utc).isoformat(),
+            "createdAt": datetime.now(timezone.utc),
         }, merge=True)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    response_cache.invalidate(uid)
+
     # 🔥 seta cookie
     res.set_cookie(
         key="refresh_token",
@@ -255,11 +537,11 @@ async def signup(user: UserData, res: Response):
 
     return {"idToken": data["idToken"], "uid": uid, "token_type": "Bearer"}
 
-@app.post("/login")
+@app.post("/login", dependencies=[Depends(rate_limited("login"))])
 async def login(user: UserData, res: Response):
-    url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={API_KEY}"
+    url = f"{IDENTITY_TOOLKIT_URL}/v1/accounts:signInWithPassword?key={API_KEY}"
     payload = {"email": user.email, "password": user.password, "returnSecureToken": True}
-    r = requests.post(url, json=payload)
+    r = await _google_post(url, idempotent=True, json=payload)
 
     if r.status_code != 200:
         msg = r.json().get("error", {}).get("message", "LOGIN_FAILED")
@@ -281,23 +563,28 @@ async def login(user: UserData, res: Response):
     return {"idToken": data["idToken"], "uid": data["localId"], "token_type": "Bearer"}
     
 @app.post("/auth/refresh")
-def refresh(req: Request, res: Response, refreshToken: str | None = Body(default=None, embed=True)):
+async def refresh(req: Request, res: Response, refreshToken: str | None = Body(default=None, embed=True)):
     # app (body) OU browser (cookie)
     rt = refreshToken or req.cookies.get("refresh_token")
     if not rt:
         raise HTTPException(status_code=401, detail="No refresh token")
 
-    url = f"https://securetoken.googleapis.com/v1/token?key={API_KEY}"
-    form = {"grant_type": "refresh_token", "refresh_token": rt}
-    r = requests.post(url, data=form, headers={"Content-Type": "application/x-www-form-urlencoded"})
+    async def exchange():
+        url = f"{SECURE_TOKEN_URL}/v1/token?key={API_KEY}"
+        form = {"grant_type": "refresh_token", "refresh_token": rt}
+        r = await _google_post(url, idempotent=True, data=form, headers={"Content-Type": "application/x-www-form-urlencoded"})
+        return r.status_code, r.json()
 
-    if r.status_code != 200:
+    # Quem chegar com o mesmo token enquanto (ou logo depois) a troca roda recebe o mesmo resultado
+    status_code, data = await refresh_flight.do(hashlib.sha256(rt.encode()).hexdigest(), exchange)
+
+    if status_code != 200:
         # invalida cookie se existir
         res.delete_cookie("refresh_token", path="/auth")
-        detail = r.json().get("error", {}).get("message", "INVALID_REFRESH_TOKEN")
+        detail = data.get("error", {}).get("message", "INVALID_REFRESH_TOKEN")
         raise HTTPException(status_code=401, detail=detail)
 
-    data = r.json()  # id_token, refresh_token (novo), user_id, expires_in...
+    # data: id_token, refresh_token (novo), user_id, expires_in...
 
     # se veio de cookie, rotacione o cookie
     if req.cookies.get("refresh_token"):
@@ -314,7 +601,13 @@ def refresh(req: Request, res: Response, refreshToken: str | None = Body(default
     return {"idToken": data["id_token"], "uid": data.get("user_id"), "token_type": "Bearer"}
 
 @app.post("/auth/logout")
-def logout(res: Response):
+def logout(res: Response, authorization: str = Header(None)):
+    # O ID token deste login para de valer já (nesta instância), sem esperar o exp
+    if authorization and authorization.startswith("Bearer "):
+        try:
+            token_verifier.revoke(authorization.split(" ", 1)[1])
+        except InvalidTokenError:
+            pass
     res.delete_cookie(
         key="refresh_token",
         path="/auth",
@@ -325,107 +618,444 @@ def logout(res: Response):
     return {"detail": "Logged out successfully"}
 
 @app.get("/user/profile")
-def get_user_profile(decoded = Depends(verify_firebase_token)):
+async def get_user_profile(req: Request, res: Response, decoded = Depends(verify_firebase_token)):
     uid = decoded.get("uid") or decoded.get("user_id")
 
     if not uid:
         raise HTTPException(status_code=401, detail="Invalid token payload")
 
-    user = fs.collection("accounts").document(uid).get()
-    if not user.exists:
-        raise HTTPException(status_code=404, detail="User not found")
+    async def load():
+        user = await get_fs().collection("accounts").document(uid).get()
+        if not user.exists:
+            raise HTTPException(status_code=404, detail="User not found")
+        return user.to_dict(), etag_for(user)
 
-    return user.to_dict()
+    return await _cached_response(req, res, uid, "profile", load)
+
+@app.get("/user/summary")
+async def get_user_summary(
+    req: Request,
+    res: Response,
+    upcoming: int = Query(default=5, ge=0, le=50),
+    months: int = Query(default=12, ge=1, le=36),
+    decoded = Depends(verify_firebase_token),
+):
+    uid = decoded.get("uid") or decoded.get("user_id")
+
+    if not uid:
+        raise HTTPException(status_code=401, detail="Invalid token payload")
+
+    # O corpo depende do dia (vencidas, mês inicial da projeção), calculado em UTC:
+    # a data entra na chave do cache e no ETag, senão um 304 de ontem valeria hoje
+    now = datetime.now(timezone.utc)
+    resource = f"summary?upcoming={upcoming}&months={months}&date={now.date().isoformat()}&tz=UTC"
+
+    async def load():
+        # Uma passada pelo stream, lendo só os campos usados no resumo
+        query = (
+            get_fs().collection("accounts").document(uid).collection("subscriptions")
+              .select(summary.SUMMARY_FIELDS)
+        )
+        result = summary.SpendingSummary(now, upcoming=upcoming, months=months)
+        etag = EtagBuilder(resource)
+        async for sub in query.stream():
+            result.add(sub.id, sub.to_dict())
+            etag.add(sub)
+        return result.result(), etag.etag()
+
+    return await _cached_response(req, res, uid, resource, load)
+
+def _encode_cursor(doc, order_field: str | None) -> str:
+    cursor = {"id": doc.id}
+    if order_field:
+        cursor[order_field] = timestamps.to_iso(doc.get(order_field))
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+def _decode_cursor(cursor: str) -> dict:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # JSON válido mas que não é um cursor nosso (ex.: editado à mão)
+    if not isinstance(position, dict) or not isinstance(position.get("id"), str):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
 
 @app.get("/subscription/list")
-def list_subscriptions(decoded = Depends(verify_firebase_token)):
+async def list_subscriptions(
+    req: Request,
+    res: Response,
+    limit: int | None = Query(default=None, ge=1, le=500),
+    cursor: str | None = None,
+    status: int | None = None,
+    cardFinalNumbers: str | None = None,
+    currency: str | None = None,
+    nextPaymentFrom: str | None = None,
+    nextPaymentTo: str | None = None,
+    fields: str | None = None,
+    decoded = Depends(verify_firebase_token),
+):
     uid = decoded.get("uid") or decoded.get("user_id")
 
     if not uid:
         raise HTTPException(status_code=401, detail="Invalid token payload")
 
-    snapshots = fs.collection("accounts").document(uid).collection("subscriptions").stream()
+    selected = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    if selected and not set(selected) <= SUBSCRIPTION_FIELDS:
+        raise HTTPException(status_code=400, detail="Unknown field in fields")
+
+    # Filtros aplicados direto no Firestore (ver firestore.indexes.json)
+    query = get_fs().collection("accounts").document(uid).collection("subscriptions")
+    for field, value in (("status", status), ("cardFinalNumbers", cardFinalNumbers), ("currency", currency)):
+        if value is not None:
+            query = query.where(field, "==", value)
+
+    # Intervalo em nextPayment (Timestamp) exige ordenar primeiro por ele
+    order_field = None
+    if nextPaymentFrom or nextPaymentTo:
+        order_field = "nextPayment"
+        for op, value in ((">=", nextPaymentFrom), ("<=", nextPaymentTo)):
+            if value:
+                instant = timestamps.to_instant(value)
+                if instant is None:
+                    raise HTTPException(status_code=400, detail="Invalid nextPayment range")
+                query = query.where("nextPayment", op, instant)
+        query = query.order_by("nextPayment")
+    query = query.order_by("__name__")
+
+    if selected:
+        query = query.select(sorted(set(selected) | ({order_field} if order_field else set())))
+
+    if cursor:
+        position = _decode_cursor(cursor)
+        values = {"__name__": position.get("id")}
+        if order_field:
+            values = {order_field: timestamps.to_instant(position.get(order_field)), **values}
+        query = query.start_after(values)
+
+    if limit:
+        # Busca um a mais para saber se existe próxima página
+        query = query.limit(limit + 1)
+
+    async def load():
+        snapshots = [doc async for doc in query.stream()]
+        next_cursor = None
+        if limit and len(snapshots) > limit:
+            snapshots = snapshots[:limit]
+            next_cursor = _encode_cursor(snapshots[-1], order_field)
+
+        subscriptions = []
+        for sub in snapshots:
+            data = sub.to_dict()
+            if selected:
+                data = {f: data[f] for f in selected if f in data}
+            data["id"] = sub.id
+            subscriptions.append(data)
+
+        return {"items": subscriptions, "nextCursor": next_cursor}, etag_for(*snapshots)
+
+    resource = "subscriptions?" + str(sorted(req.query_params.multi_items()))
+    result = await _cached_response(req, res, uid, resource, load)
+    if isinstance(result, Response):
+        return result
+
+    # Mantém o corpo como lista (compatível com os fronts); o cursor vai no header
+    if result["nextCursor"]:
+        res.headers["X-Next-Cursor"] = result["nextCursor"]
+    return result["items"]
+
+async def _open_feed(uid: str) -> asyncio.Queue:
+    try:
+        return await change_feed.connect(uid)
+    except FeedFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Change feed unavailable", headers={"Retry-After": "5"})
+
+@app.get("/subscription/stream")
+async def stream_subscriptions(decoded = Depends(verify_stream_token)):
+    """
+    Server-Sent Events: um `sync` com todas as assinaturas e depois só as
+    mudanças (added, modified, removed). `resync` pede para reconectar.
+    O token vai no header Authorization ou, com EventSource, em `?access_token=`.
+    """
+    uid = decoded.get("uid") or decoded.get("user_id")
 
-    subscriptions = []
-    for sub in snapshots:
-        data = sub.to_dict()
-        data["id"] = sub.id
-        subscriptions.append(data)
+    if not uid:
+        raise HTTPException(status_code=401, detail="Invalid token payload")
+
+    queue = await _open_feed(uid)
+
+    async def events():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), STREAM_PING_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event is None:
+                    break
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            change_feed.disconnect(uid, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    return subscriptions
+@app.websocket("/subscription/stream")
+async def stream_subscriptions_ws(websocket: WebSocket):
+    """
+    Mesmos eventos do SSE em JSON. O token vai no header Authorization ou,
+    no navegador (sem headers), na primeira mensagem.
+    """
+    await websocket.accept()
+    try:
+        authorization = websocket.headers.get("authorization")
+        if not authorization:
+            authorization = f"Bearer {await asyncio.wait_for(websocket.receive_text(), 10)}"
+        decoded = await verify_firebase_token(authorization)
+        uid = decoded.get("uid") or decoded.get("user_id")
+        if not uid:
+            raise HTTPException(status_code=401, detail="Invalid token payload")
+        queue = await _open_feed(uid)
+    except HTTPException as e:
+        await websocket.close(code=1013 if e.status_code == 503 else 1008, reason=str(e.detail))
+        return
+    except (asyncio.TimeoutError, WebSocketDisconnect):
+        await websocket.close(code=1008)
+        return
+
+    # Lê o socket em paralelo só para perceber quando o cliente fecha
+    received = asyncio.ensure_future(websocket.receive())
+    next_event = asyncio.ensure_future(queue.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({next_event, received}, return_when=asyncio.FIRST_COMPLETED)
+            if received in done:
+                if received.result()["type"] == "websocket.disconnect":
+                    break
+                received = asyncio.ensure_future(websocket.receive())  # mensagens do cliente são ignoradas
+            if next_event in done:
+                event = next_event.result()
+                if event is None:
+                    await websocket.close()
+                    break
+                await websocket.send_text(json.dumps(event, default=str))
+                next_event = asyncio.ensure_future(queue.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        received.cancel()
+        next_event.cancel()
+        change_feed.disconnect(uid, queue)
+
+def _subscription_document(uid: str, subscription: SubscriptionData, now: datetime | None = None) -> dict:
+    """Monta o documento de uma nova assinatura, já com o status inicial calculado."""
+    now = now or datetime.now(timezone.utc)
+    data = {
+        "user_id": uid,
+        "name": subscription.name,
+        "description": subscription.description,
+        "price": subscription.price,
+        "currency": subscription.currency,
+        "subscriptionType": subscription.subscriptionType,
+        "billingDay": subscription.billingDay,
+        "billingFrequency": subscription.billingFrequency,
+        "createdDate": now,
+        "nextPayment": timestamps.to_instant(subscription.nextPayment),
+        "paymentMethod": subscription.paymentMethod,
+        "status": subscription.status,
+        "cardBank": subscription.cardBank,
+        "cardFinalNumbers": subscription.cardFinalNumbers,
+    }
+    data.update(_status_update(data, now))
+    return data
 
 @app.post("/subscription/add")
-def create_subscription(subscription: SubscriptionData, decoded = Depends(verify_firebase_token)):
+async def create_subscription(
+    subscription: SubscriptionData,
+    idempotency_key: str | None = Header(default=None),
+    decoded = Depends(verify_firebase_token),
+):
     uid = decoded.get("uid") or decoded.get("user_id")
 
     if not uid:
         raise HTTPException(status_code=401, detail="Invalid token payload")
 
-    try:
-        # Cria o documento
-        doc_ref = fs.collection("accounts").document(uid).collection("subscriptions").add({
-            "user_id": uid,
-            "name": subscription.name,
-            "description": subscription.description,
-            "price": subscription.price,
-            "currency": subscription.currency,
-            "subscriptionType": subscription.subscriptionType,
-            "billingDay": subscription.billingDay,
-            "billingFrequency": subscription.billingFrequency,
-            "createdDate": datetime.now(timezone.utc).isoformat(),
-            "nextPayment": subscription.nextPayment,
-            "paymentMethod": subscription.paymentMethod,
-            "status": subscription.status,
-            "cardBank": subscription.cardBank,
-            "cardFinalNumbers": subscription.cardFinalNumbers,
-        })
-
-        inserted_id = doc_ref[1].id  # o ID do documento criado
+    run = lambda: _create_subscription(uid, subscription)
+    return await _idempotent(uid, "subscription/add", idempotency_key, subscription.model_dump(mode="json"), run)
 
+async def _create_subscription(uid: str, subscription: SubscriptionData):
+    doc_ref = get_fs().collection("accounts").document(uid).collection("subscriptions").document()
+    data = _subscription_document(uid, subscription)
+
+    @transactional
+    async def _create(transaction):
+        # Cria o documento e soma o preço no cartão e no rollup da conta no mesmo commit
+        deltas = cards.card_deltas(None, data)
+        card_refs, earliest = await asyncio.gather(
+            cards.lookup_card_refs(uid, deltas, transaction),
+            rollup.earliest_next_payment(uid, transaction, doc_ref.id, data),
+        )
+        transaction.set(doc_ref, data)
+        cards.apply_card_deltas(transaction, card_refs, deltas)
+        rollup.apply_rollup(transaction, uid, rollup.rollup_deltas(None, data), earliest)
+
+    try:
+        await _create(get_fs().transaction())
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    # Recalcula o status inicial da nova assinatura
-    _update_subscription_status(doc_ref[1])
-
-    # ATUALIZA O GASTO TOTAL DO CARTÃO ASSOCIADO
-    if subscription.cardFinalNumbers:
-        _update_card_total_spent(uid, subscription.cardFinalNumbers)
+    response_cache.invalidate(uid)
 
     return {
         "detail": "Subscription created successfully",
-        "subscription_id": inserted_id
+        "subscription_id": doc_ref.id
     }
 
+@app.get("/subscription/export")
+async def export_subscriptions(format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"), decoded = Depends(verify_firebase_token)):
+    uid = decoded.get("uid") or decoded.get("user_id")
+
+    if not uid:
+        raise HTTPException(status_code=401, detail="Invalid token payload")
+
+    snapshots = get_fs().collection("accounts").document(uid).collection("subscriptions").stream()
+
+    # Gera linha a linha direto do stream do Firestore, sem montar a lista
+    async def rows():
+        if format == "csv":
+            yield subscription_io.csv_header()
+        async for sub in snapshots:
+            if format == "csv":
+                yield subscription_io.to_csv(sub.id, sub.to_dict())
+            else:
+                yield subscription_io.to_ndjson(sub.id, sub.to_dict())
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        rows(),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=subscriptions.{format}"},
+    )
+
+@app.post("/subscription/import")
+async def import_subscriptions(req: Request, format: str | None = Query(default=None, pattern="^(ndjson|csv)$"), decoded = Depends(verify_firebase_token)):
+    uid = decoded.get("uid") or decoded.get("user_id")
+
+    if not uid:
+        raise HTTPException(status_code=401, detail="Invalid token payload")
+
+    fmt = format or ("csv" if "csv" in req.headers.get("content-type", "") else "ndjson")
+    subscriptions_ref = get_fs().collection("accounts").document(uid).collection("subscriptions")
+    now = datetime.now(timezone.utc)
+
+    imported = failed = 0
+    errors = []
+    touched_cards = set()
+    batch, pending = get_fs().batch(), 0
+    # Última linha do arquivo já gravada: um import interrompido continua dela
+    last_line = committed_line = 0
+    aborted = None
+
+    async def commit():
+        nonlocal batch, pending, imported, committed_line
+        await batch.commit()
+        imported += pending
+        committed_line = last_line
+        batch, pending = get_fs().batch(), 0
+
+    try:
+        async for line, record in subscription_io.iter_records(req.stream(), fmt):
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                subscription = SubscriptionData.model_validate(record)
+            except Exception as e:
+                failed += 1
+                if len(errors) < IMPORT_MAX_ERRORS:
+                    errors.append({"line": line, "error": str(e)})
+                continue
+
+            batch.set(subscriptions_ref.document(), _subscription_document(uid, subscription, now))
+            pending += 1
+            last_line = line
+            if subscription.cardFinalNumbers:
+                touched_cards.add(subscription.cardFinalNumbers)
+
+            # Grava em lotes (limite de 500 escritas por commit)
+            if pending == IMPORT_BATCH_SIZE:
+                await commit()
+
+        if pending:
+            await commit()
+    except Exception as e:
+        # Commit falhou no meio (cota, prazo, contenção): os lotes já gravados ficam
+        aborted = str(e)
+    finally:
+        # Recalcula o total de cada cartão afetado e o rollup da conta uma única vez,
+        # também depois de uma falha (senão os lotes gravados ficam fora dos totais)
+        if imported:
+            if touched_cards:
+                await cards.recompute_card_totals(uid, touched_cards)
+            await rollup.rebuild(uid)
+            response_cache.invalidate(uid)
+
+    body = {
+        "detail": "Subscriptions imported" if aborted is None else "Import interrupted",
+        "imported": imported,
+        "failed": failed,
+        "errors": errors,
+        "lastImportedLine": committed_line,
+    }
+    if aborted is not None:
+        # Importação parcial: reenviar só as linhas depois de lastImportedLine
+        return JSONResponse({**body, "error": aborted}, status_code=500)
+    return body
+
 @app.delete("/subscription/delete/{subscription_id}")
-def delete_subscription(subscription_id: str, decoded = Depends(verify_firebase_token)):
+async def delete_subscription(subscription_id: str, decoded = Depends(verify_firebase_token)):
     uid = decoded.get("uid") or decoded.get("user_id")
     
     if not uid:
         raise HTTPException(status_code=401, detail="Invalid token payload")
     
-    doc_ref = fs.collection("accounts").document(uid).collection("subscriptions").document(subscription_id)
-    doc = doc_ref.get()
-    if not doc.exists:
-        raise HTTPException(status_code=404, detail="Subscription not found")
+    doc_ref = get_fs().collection("accounts").document(uid).collection("subscriptions").document(subscription_id)
+
+    @transactional
+    async def _delete(transaction):
+        doc = await doc_ref.get(transaction=transaction)
+        if not doc.exists:
+            raise HTTPException(status_code=404, detail="Subscription not found")
+
+        # Tira o preço da assinatura do gasto total do cartão associado
+        deltas = cards.card_deltas(doc.to_dict(), None)
+        card_refs, earliest = await asyncio.gather(
+            cards.lookup_card_refs(uid, deltas, transaction),
+            rollup.earliest_next_payment(uid, transaction, subscription_id, None),
+        )
 
-    # Guarda os dados antes de deletar para saber qual cartão atualizar
-    sub_data = doc.to_dict()
-    card_to_update = sub_data.get("cardFinalNumbers")
+        transaction.delete(doc_ref)
+        cards.apply_card_deltas(transaction, card_refs, deltas)
+        rollup.apply_rollup(transaction, uid, rollup.rollup_deltas(doc.to_dict(), None), earliest)
 
     try:
-        doc_ref.delete()
+        await _delete(get_fs().transaction())
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    # ATUALIZA O GASTO TOTAL DO CARTÃO ASSOCIADO
-    if card_to_update:
-        _update_card_total_spent(uid, card_to_update)
+    response_cache.invalidate(uid)
 
     return {"detail": "Subscription deleted successfully"}
 
 @app.patch("/subscription/update/{subscription_id}")
-def update_subscription(
+async def update_subscription(
     subscription_id: str,
     update: SubscriptionUpdate,
     decoded = Depends(verify_firebase_token)
@@ -435,99 +1065,139 @@ def update_subscription(
     if not uid:
         raise HTTPException(status_code=401, detail="Invalid token payload")
 
+    # Só pega os campos que realmente vieram no payload
+    update_data = update.model_dump(exclude_unset=True)
+
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No fields to update")
+
     doc_ref = (
-        fs.collection("accounts")
+        get_fs().collection("accounts")
           .document(uid)
           .collection("subscriptions")
           .document(subscription_id)
     )
 
-    doc = doc_ref.get()
-    if not doc.exists:
-        raise HTTPException(status_code=404, detail="Subscription not found")
+    if "nextPayment" in update_data:
+        update_data["nextPayment"] = timestamps.to_instant(update_data["nextPayment"])
 
-    # Guarda os dados antigos para saber qual cartão atualizar
-    old_data = doc.to_dict()
-    old_card_final_numbers = old_data.get("cardFinalNumbers")
+    new_card = update_data.get("cardFinalNumbers")
 
-    # Só pega os campos que realmente vieram no payload
-    update_data = update.model_dump(exclude_unset=True)
+    @transactional
+    async def _update(transaction):
+        # O documento antigo e o índice do cartão novo são lidos em paralelo
+        doc, card_refs = await asyncio.gather(
+            doc_ref.get(transaction=transaction),
+            cards.lookup_card_refs(uid, [new_card] if new_card else [], transaction),
+        )
+        if not doc.exists:
+            raise HTTPException(status_code=404, detail="Subscription not found")
 
-    if not update_data:
-        raise HTTPException(status_code=400, detail="No fields to update")
+        old_data = doc.to_dict()
+        new_data = {**old_data, **update_data}
 
-    # Atualiza no Firestore
-    doc_ref.update(update_data)
+        # Recalcula o status junto com a atualização
+        changes = {**update_data, **_status_update(new_data)}
 
-    # Recalcula o status após a atualização
-    _update_subscription_status(doc_ref)
+        # Move a diferença de preço entre os cartões afetados (O(1) escritas)
+        deltas = cards.card_deltas(old_data, new_data)
+        card_refs.update(await cards.lookup_card_refs(uid, [c for c in deltas if c != new_card], transaction))
 
-    # ATUALIZA O GASTO TOTAL DO(S) CARTÃO(ÕES) AFETADO(S)
-    new_card_final_numbers = update_data.get("cardFinalNumbers")
-    
-    # Se o cartão mudou, atualiza o antigo e o novo
-    if new_card_final_numbers and new_card_final_numbers != old_card_final_numbers:
-        if old_card_final_numbers:
-            _update_card_total_spent(uid, old_card_final_numbers)
-        _update_card_total_spent(uid, new_card_final_numbers)
-    # Se o cartão não mudou mas o preço sim, atualiza o mesmo cartão
-    elif "price" in update_data and old_card_final_numbers:
-        _update_card_total_spent(uid, old_card_final_numbers)
+        # O vencimento mais próximo da conta só muda se status/nextPayment mudaram
+        new_data.update(changes)
+        earliest = rollup.UNCHANGED
+        if any(old_data.get(field) != new_data.get(field) for field in ("status", "nextPayment")):
+            earliest = await rollup.earliest_next_payment(uid, transaction, subscription_id, new_data)
+
+        transaction.update(doc_ref, changes)
+        cards.apply_card_deltas(transaction, card_refs, deltas)
+        rollup.apply_rollup(transaction, uid, rollup.rollup_deltas(old_data, new_data), earliest)
 
+    await _update(get_fs().transaction())
+
+    response_cache.invalidate(uid)
 
     return {"detail": "Subscription updated successfully"}
 
 @app.get("/cards/list")
-def list_card_brands(decoded = Depends(verify_firebase_token)):
+async def list_card_brands(req: Request, res: Response, decoded = Depends(verify_firebase_token)):
     uid = decoded.get("uid") or decoded.get("user_id")
 
     if not uid:
         raise HTTPException(status_code=401, detail="Invalid token payload")
-    
-    snapshots = fs.collection("accounts").document(uid).collection("cards").stream()
 
-    cards = [doc.to_dict() for doc in snapshots]
-    return {"cards": cards}
+    async def load():
+        snapshots = [doc async for doc in get_fs().collection("accounts").document(uid).collection("cards").stream()]
+        return {"cards": [doc.to_dict() for doc in snapshots]}, etag_for(*snapshots)
+
+    return await _cached_response(req, res, uid, "cards", load)
 
 @app.post("/cards/create")
-def create_card(card: CardData, decoded = Depends(verify_firebase_token)):
+async def create_card(
+    card: CardData,
+    idempotency_key: str | None = Header(default=None),
+    decoded = Depends(verify_firebase_token),
+):
     uid = decoded.get("uid") or decoded.get("user_id")
 
     if not uid:
         raise HTTPException(status_code=401, detail="Invalid token payload")
-    
+
+    run = lambda: _create_card(uid, card)
+    return await _idempotent(uid, "cards/create", idempotency_key, card.model_dump(mode="json"), run)
+
+async def _update_card(uid: str, doc_ref, update_data: dict, release_old: bool = True):
+    """
+    Atualiza o cartão numa transação. Se o número mudou, move o índice e soma
+    as assinaturas do número novo na mesma transação: uma assinatura criada
+    no meio refaz a soma em vez de ficar fora do total.
+    """
+    new_card_final_numbers = update_data.get("cardFinalNumbers")
+
+    @transactional
+    async def _update(transaction):
+        doc = await doc_ref.get(transaction=transaction)
+        if not doc.exists:
+            raise HTTPException(status_code=404, detail="Card not found")
+
+        data = dict(update_data)
+        old_card_final_numbers = doc.to_dict().get("cardFinalNumbers")
+        if new_card_final_numbers and new_card_final_numbers != old_card_final_numbers:
+            data["totalSpent"] = await cards.sum_card_subscriptions(uid, new_card_final_numbers, transaction)
+            if old_card_final_numbers and release_old:
+                transaction.delete(cards.card_index_ref(uid, old_card_final_numbers))
+            transaction.set(cards.card_index_ref(uid, new_card_final_numbers), {"cardId": doc_ref.id})
+        transaction.update(doc_ref, data)
+
+    await _update(get_fs().transaction())
+
+async def _create_card(uid: str, card: CardData):
     card_data = card.model_dump()
     new_card_final_numbers = card_data.get("cardFinalNumbers")
-    
-    total_spent = 0.0
-    
-    # Query all subscriptions for the user
-    subscriptions_snapshots = fs.collection("accounts").document(uid).collection("subscriptions").stream()
-    
-    for sub in subscriptions_snapshots:
-        sub_data = sub.to_dict()
-        # Check if the subscription uses the same card
-        if sub_data.get("cardFinalNumbers") == new_card_final_numbers:
-            # Add the price to the total
-            total_spent += sub_data.get("price", 0.0)
-            
-    # Update the totalSpent in the card data to be saved
-    card_data["totalSpent"] = total_spent
 
     try:
-        # Adiciona o cartão e pega a referência do documento
-        timestamp, doc_ref = fs.collection("accounts").document(uid).collection("cards").add(card_data)
-        # Pega o ID gerado
-        card_id = doc_ref.id
-        # Atualiza o documento para incluir seu próprio ID
-        doc_ref.update({"id": card_id})
+        # Cria o cartão já com o próprio ID e registra no índice de cartões
+        doc_ref = get_fs().collection("accounts").document(uid).collection("cards").document()
+        card_data["id"] = doc_ref.id
+
+        @transactional
+        async def _create(transaction):
+            # Soma só as assinaturas deste cartão, na mesma transação da criação
+            # (depois disso o total é mantido por incrementos)
+            total = await cards.sum_card_subscriptions(uid, new_card_final_numbers, transaction)
+            transaction.set(doc_ref, {**card_data, "totalSpent": total})
+            transaction.set(cards.card_index_ref(uid, new_card_final_numbers), {"cardId": doc_ref.id})
+
+        await _create(get_fs().transaction())
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    response_cache.invalidate(uid)
+
     return {"detail": "Card created successfully"}
 
 @app.patch("/cards/update/{card_id}")
-def update_card(
+async def update_card(
     card_id: str,
     update: CardData,
     decoded = Depends(verify_firebase_token)
@@ -538,165 +1208,534 @@ def update_card(
         raise HTTPException(status_code=401, detail="Invalid token payload")
 
     doc_ref = (
-        fs.collection("accounts")
+        get_fs().collection("accounts")
           .document(uid)
           .collection("cards")
           .document(card_id)
     )
 
-    doc = doc_ref.get()
-    if not doc.exists:
-        raise HTTPException(status_code=404, detail="Card not found")
-
     # Só pega os campos que realmente vieram no payload
     update_data = update.model_dump(exclude_unset=True)
 
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
 
-    # Atualiza no Firestore
-    doc_ref.update(update_data)
+    # Atualiza no Firestore (se o número mudou, move o índice e recalcula o total)
+    await _update_card(uid, doc_ref, update_data)
+
+    response_cache.invalidate(uid)
 
     return {"detail": "Card updated successfully"}
 
 @app.delete("/cards/delete/{card_id}")
-def delete_card(card_id: str, decoded = Depends(verify_firebase_token)):
+async def delete_card(card_id: str, decoded = Depends(verify_firebase_token)):
     uid = decoded.get("uid") or decoded.get("user_id")
     
     if not uid:
         raise HTTPException(status_code=401, detail="Invalid token payload")
     
-    doc_ref = fs.collection("accounts").document(uid).collection("cards").document(card_id)
-    doc = doc_ref.get()
+    doc_ref = get_fs().collection("accounts").document(uid).collection("cards").document(card_id)
+    doc = await doc_ref.get()
     if not doc.exists:
         raise HTTPException(status_code=404, detail="Card not found")
 
     try:
-        doc_ref.delete()
+        batch = get_fs().batch()
+        batch.delete(doc_ref)
+        card_final_numbers = doc.to_dict().get("cardFinalNumbers")
+        if card_final_numbers:
+            batch.delete(cards.card_index_ref(uid, card_final_numbers))
+        await batch.commit()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    response_cache.invalidate(uid)
+
     return {"detail": "Card deleted successfully"}
 
+@app.post("/cards/batch")
+async def batch_cards(request: CardBatchRequest, decoded = Depends(verify_firebase_token)):
+    """Várias atualizações/remoções de cartões: um get_all e commits de até 500 escritas."""
+    uid = decoded.get("uid") or decoded.get("user_id")
+    if not uid:
+        raise HTTPException(status_code=401, detail="Invalid token payload")
+
+    results = _check_operations(request.operations)
+    pending = [(operation, result) for operation, result in zip(request.operations, results) if "error" not in result]
+
+    cards_ref = get_fs().collection("accounts").document(uid).collection("cards")
+    refs = [cards_ref.document(operation.id) for operation, _ in pending]
+    docs = {doc.id: doc async for doc in get_fs().get_all(refs)} if refs else {}
+
+    # Cartões com número novo vão cada um na própria transação (soma + índice),
+    # como no /cards/update; o resto vai nos commits em lote
+    renumbered = {}
+    for operation, _ in pending:
+        doc = docs.get(operation.id)
+        if operation.op == "update" and doc is not None and doc.exists:
+            new_numbers = operation.update.model_dump(exclude_unset=True).get("cardFinalNumbers")
+            if new_numbers and new_numbers != doc.to_dict().get("cardFinalNumbers"):
+                renumbered[operation.id] = new_numbers
+    claimed = set(renumbered.values())
+
+    def release_index(old_numbers: str | None) -> list:
+        # Não apaga o índice de um número que outra operação do lote passou a usar
+        if not old_numbers or old_numbers in claimed:
+            return []
+        return [("delete", cards.card_index_ref(uid, old_numbers))]
+
+    commit = _ChunkedCommit(uid)
+    for operation, result in pending:
+        doc = docs.get(operation.id)
+        if doc is None or not doc.exists:
+            result["error"] = "Card not found"
+            continue
+        old_numbers = doc.to_dict().get("cardFinalNumbers")
+
+        if operation.op == "delete":
+            await commit.add(result, [("delete", doc.reference), *release_index(old_numbers)])
+            continue
+
+        if operation.id in renumbered:
+            continue
+        await commit.add(result, [("update", doc.reference, operation.update.model_dump(exclude_unset=True))])
+    await commit.flush()
+
+    renumbered_ok = 0
+    for operation, result in pending:
+        if operation.id not in renumbered or "error" in result:
+            continue
+        old_numbers = docs[operation.id].to_dict().get("cardFinalNumbers")
+        try:
+            await _update_card(
+                uid, docs[operation.id].reference, operation.update.model_dump(exclude_unset=True),
+                release_old=old_numbers not in claimed,
+            )
+        except HTTPException as e:
+            result["error"] = e.detail
+        except Exception as e:
+            result["error"] = str(e)
+        else:
+            result["ok"] = True
+            renumbered_ok += 1
+
+    if commit.commits or renumbered_ok:
+        response_cache.invalidate(uid)
+
+    return {"results": results, "commits": commit.commits + renumbered_ok}
+
 @app.get("/cards/{card_id}")
-def get_card(card_id: str, decoded = Depends(verify_firebase_token)):
+async def get_card(card_id: str, req: Request, res: Response, decoded = Depends(verify_firebase_token)):
     uid = decoded.get("uid") or decoded.get("user_id")
 
     if not uid:
         raise HTTPException(status_code=401, detail="Invalid token payload")
 
-    doc_ref = fs.collection("accounts").document(uid).collection("cards").document(card_id)
-    doc = doc_ref.get()
-    if not doc.exists:
-        raise HTTPException(status_code=404, detail="Card not found")
+    async def load():
+        doc = await get_fs().collection("accounts").document(uid).collection("cards").document(card_id).get()
+        if not doc.exists:
+            raise HTTPException(status_code=404, detail="Card not found")
+        return {"card": doc.to_dict()}, etag_for(doc)
 
-    return {"card": doc.to_dict()}
+    return await _cached_response(req, res, uid, f"card:{card_id}", load)
 
-def _update_subscription_status(doc_ref):
+def _status_update(data: dict, now: datetime | None = None) -> dict:
     """
-    Lê uma assinatura, recalcula seu status (Ativo, Expirando, Vencido)
-    e a atualiza no banco de dados se o status mudou.
+    Campos de status que precisam ser gravados para a assinatura: o novo
+    status e o `statusChangeAt` usado pelo job incremental. Vazio se nada mudou.
     """
-    doc = doc_ref.get()
-    if not doc.exists:
-        return
+    return status_engine.status_update(data, now)
 
-    data = doc.to_dict()
-    status = data.get("status")
-    
-    # Ignora assinaturas já canceladas/inativas
-    if status == 0:
-        return
+def _payment_confirmation(data: dict, now: datetime) -> dict:
+    """
+    Campos a gravar ao confirmar o pagamento de uma assinatura vencida: o
+    próximo vencimento (calculado direto, respeitando o billingDay), o status
+    reativado e a próxima transição.
+    """
+    # Garante que só podemos confirmar pagamento de uma assinatura vencida
+    if data.get("status") != 3:
+        raise HTTPException(status_code=400, detail="Subscription is not expired")
 
-    next_payment_raw = data.get("nextPayment")
-    next_payment = parse_next_payment(next_payment_raw)
-    
+    next_payment = parse_next_payment(data.get("nextPayment"))
     if not next_payment:
-        return
+        raise HTTPException(status_code=400, detail="Subscription has no nextPayment")
+
+    freq = data.get("billingFrequency") or "monthly"
+    if freq not in billing.FREQUENCIES:
+        freq = "monthly"  # mesmo padrão de antes para frequências desconhecidas
 
+    # Próximo vencimento depois de hoje, sem iterar período a período
+    next_payment = billing.next_due(next_payment, freq, now, data.get("billingDay"))
+
+    # Prepara os dados para atualização: reativa o status e avança a data
+    update_data = {
+        "status": 1, # Reativa para "Active"
+        "nextPayment": next_payment.astimezone(timezone.utc)
+    }
+    # Ajusta o status para a nova data (pode já estar Expirando) e agenda a próxima transição
+    update_data.update(_status_update({**data, **update_data}, now))
+    return update_data
+
+@app.post("/subscription/batch")
+async def batch_subscriptions(request: SubscriptionBatchRequest, decoded = Depends(verify_firebase_token)):
+    """
+    Várias atualizações/remoções de assinaturas numa chamada (multi-seleção
+    do front): uma leitura (get_all) para todos os documentos, escritas em
+    commits de até 500 e o total de cada cartão afetado ajustado uma vez.
+    """
+    uid = decoded.get("uid") or decoded.get("user_id")
+    if not uid:
+        raise HTTPException(status_code=401, detail="Invalid token payload")
+
+    results = _check_operations(request.operations)
+    pending = [(operation, result) for operation, result in zip(request.operations, results) if "error" not in result]
+
+    subscriptions_ref = get_fs().collection("accounts").document(uid).collection("subscriptions")
+    refs = [subscriptions_ref.document(operation.id) for operation, _ in pending]
+    docs = {doc.id: doc async for doc in get_fs().get_all(refs)} if refs else {}
+    now = datetime.now(timezone.utc)
+
+    # Estado antigo e novo de cada operação
+    planned = []
+    for operation, result in pending:
+        doc = docs.get(operation.id)
+        if doc is None or not doc.exists:
+            result["error"] = "Subscription not found"
+            continue
+        old_data = doc.to_dict()
+        if operation.op == "delete":
+            planned.append((result, [("delete", doc.reference)], old_data, None))
+            continue
+
+        update_data = operation.update.model_dump(exclude_unset=True)
+        if "nextPayment" in update_data:
+            update_data["nextPayment"] = timestamps.to_instant(update_data["nextPayment"])
+        new_data = {**old_data, **update_data}
+        changes = {**update_data, **_status_update(new_data, now)}
+        new_data.update(changes)
+        planned.append((result, [("update", doc.reference, changes)], old_data, new_data))
+
+    # Índice dos cartões envolvidos: também uma leitura só
+    card_numbers = {card for _, _, old, new in planned for card in cards.card_deltas(old, new)}
+    commit = _ChunkedCommit(uid, await cards.lookup_card_refs(uid, card_numbers))
+    for result, writes, old_data, new_data in planned:
+        await commit.add(result, writes, cards.card_deltas(old_data, new_data), rollup.rollup_deltas(old_data, new_data))
+    await commit.flush()
+
+    if commit.commits:
+        # Vencimento mais próximo recalculado uma vez, depois de todos os commits
+        await rollup.refresh_earliest(uid)
+        response_cache.invalidate(uid)
+
+    return {"results": results, "commits": commit.commits}
+
+# Precisa vir antes de /subscription/confirm-payment/{subscription_id}
+@app.post("/subscription/confirm-payment/bulk")
+async def confirm_payments_bulk(request: BulkConfirmRequest, decoded = Depends(verify_firebase_token)):
+    uid = decoded.get("uid") or decoded.get("user_id")
+    if not uid:
+        raise HTTPException(status_code=401, detail="Invalid token payload")
+
+    ids = list(dict.fromkeys(request.ids))
+    if not ids:
+        raise HTTPException(status_code=400, detail="No subscriptions to confirm")
+    if len(ids) > CONFIRM_BULK_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {CONFIRM_BULK_MAX} subscriptions per request")
+
+    subscriptions_ref = get_fs().collection("accounts").document(uid).collection("subscriptions")
+    refs = [subscriptions_ref.document(subscription_id) for subscription_id in ids]
     now = datetime.now(timezone.utc)
-    days_diff = (next_payment.date() - now.date()).days
-    
-    new_status = status
-    
-    if days_diff < 0:
-        new_status = 3  # Expired
-    elif days_diff <= 10:
-        new_status = 2  # Expiring
-    else:
-        new_status = 1  # Active
-        
-    if new_status != status:
-        doc_ref.update({"status": new_status})
 
+    confirmed, skipped = [], []
+    batch = get_fs().batch()
+    deltas = {}
+
+    # Uma leitura para todos os documentos e um único commit para as escritas
+    async for doc in get_fs().get_all(refs):
+        if not doc.exists:
+            skipped.append({"id": doc.id, "reason": "Subscription not found"})
+            continue
+        try:
+            update_data = _payment_confirmation(doc.to_dict(), now)
+        except HTTPException as e:
+            skipped.append({"id": doc.id, "reason": e.detail})
+            continue
+
+        batch.update(doc.reference, update_data)
+        rollup.add_deltas(deltas, rollup.rollup_deltas(doc.to_dict(), {**doc.to_dict(), **update_data}))
+        confirmed.append({"id": doc.id, "update": timestamps.to_json(update_data)})
+
+    if confirmed:
+        # Contadores do rollup no mesmo commit; o vencimento mais próximo é recalculado depois
+        rollup.apply_rollup(batch, uid, deltas)
+        await batch.commit()
+        await rollup.refresh_earliest(uid)
+        response_cache.invalidate(uid)
+
+    return {"confirmed": confirmed, "skipped": skipped}
 
 @app.post("/subscription/confirm-payment/{subscription_id}")
-def confirm_payment(
+async def confirm_payment(
     subscription_id: str,
+    idempotency_key: str | None = Header(default=None),
     decoded = Depends(verify_firebase_token)
 ):
     uid = decoded.get("uid") or decoded.get("user_id")
     if not uid:
         raise HTTPException(status_code=401, detail="Invalid token payload")
 
+    # Sem a chave, um retry confirmaria de novo e avançaria mais um ciclo
+    run = lambda: _confirm_payment(uid, subscription_id)
+    return await _idempotent(uid, "subscription/confirm-payment", idempotency_key, {"id": subscription_id}, run)
+
+async def _confirm_payment(uid: str, subscription_id: str):
     doc_ref = (
-        fs.collection("accounts")
+        get_fs().collection("accounts")
           .document(uid)
           .collection("subscriptions")
           .document(subscription_id)
     )
     
-    doc = doc_ref.get()
-    if not doc.exists:
-        raise HTTPException(status_code=404, detail="Subscription not found")
+    @transactional
+    async def _confirm(transaction):
+        doc = await doc_ref.get(transaction=transaction)
+        if not doc.exists:
+            raise HTTPException(status_code=404, detail="Subscription not found")
 
-    data = doc.to_dict()
-    
-    # Garante que só podemos confirmar pagamento de uma assinatura vencida
-    if data.get("status") != 3:
-        raise HTTPException(status_code=400, detail="Subscription is not expired")
+        old_data = doc.to_dict()
+        update_data = _payment_confirmation(old_data, datetime.now(timezone.utc))
+        new_data = {**old_data, **update_data}
+        earliest = await rollup.earliest_next_payment(uid, transaction, subscription_id, new_data)
+
+        transaction.update(doc_ref, update_data)
+        rollup.apply_rollup(transaction, uid, rollup.rollup_deltas(old_data, new_data), earliest)
+        return update_data
 
-    # Lógica para calcular a próxima data de pagamento
+    update_data = await _confirm(get_fs().transaction())
+
+    response_cache.invalidate(uid)
+
+    return {"detail": "Payment confirmed and subscription reactivated", 
+            "update": timestamps.to_json(update_data)}
+
+RECALC_FIELDS = ["status", "nextPayment", "statusChangeAt"]
+
+async def _recalc_plan(params: dict) -> list[dict]:
+    # Incremental: poucas assinaturas na janela, uma partição só (a query tem filtro de intervalo)
+    if params["incremental"]:
+        return [{}]
+    return await jobs.collection_group_partitions("subscriptions")
+
+async def _recalc_partition(params: dict, partition: dict, checkpoint) -> dict:
+    """Recalcula os status de uma partição; checkpoint a cada bloco do status_engine."""
+    now = params["now"]
+    query = get_fs().collection_group("subscriptions").select(RECALC_FIELDS)
+    if params["incremental"]:
+        # Só as assinaturas cuja transição caiu na janela desde a última
+        # execução bem-sucedida (exige o índice de statusChangeAt)
+        query = (
+            query.where("statusChangeAt", ">", params["watermark"])
+                 .where("statusChangeAt", "<=", now)
+        )
+    else:
+        query = jobs.partition_query(query, partition)
+
+    counters = {"scanned": 0, "changed": 0, "written": 0, **(partition.get("counters") or {})}
+    batch, pending = get_fs().batch(), 0
+    # Variação dos contadores de status por conta, gravada no mesmo commit
+    rollup_deltas = {}
+    touched_uids = set()
+
+    async def commit():
+        nonlocal batch, pending, rollup_deltas
+        for uid, deltas in rollup_deltas.items():
+            rollup.apply_rollup(batch, uid, deltas)
+        await batch.commit()
+        counters["written"] += pending
+        for uid in touched_uids:
+            response_cache.invalidate(uid)
+        batch, pending, rollup_deltas = get_fs().batch(), 0, {}
+        touched_uids.clear()
+
+    async def apply(chunk):
+        nonlocal pending
+        # Status de todo o bloco calculado numa passada vetorizada
+        updates = status_engine.status_updates([doc.to_dict() for doc in chunk], now)
+        for doc, update in zip(chunk, updates):
+            if not update:
+                continue
+
+            counters["changed"] += 1
+            batch.update(doc.reference, update)
+            pending += 1
+            uid = doc.reference.parent.parent.id
+            touched_uids.add(uid)
+            if "status" in update:
+                old = doc.to_dict()
+                rollup.add_deltas(rollup_deltas.setdefault(uid, {}), rollup.rollup_deltas(old, {**old, **update}))
+
+            # Grava em lotes (limite de 500 escritas por commit, contando as das contas)
+            if pending + len(rollup_deltas) >= RECALC_BATCH_SIZE:
+                await commit()
+
+        # Checkpoint só depois que tudo até o fim do bloco foi confirmado
+        if pending:
+            await commit()
+        if not params["incremental"]:
+            await checkpoint(chunk[-1].reference.path, dict(counters))
+
+    chunk = []
+    async for doc in query.stream():
+        counters["scanned"] += 1
+        chunk.append(doc)
+        if len(chunk) == RECALC_CHUNK_SIZE:
+            await apply(chunk)
+            chunk = []
+
+    if chunk:
+        await apply(chunk)
+
+    return counters
+
+async def _recalc_finish(params: dict, totals: dict) -> dict:
+    # Só avança a marca d'água depois que todas as partições terminaram
+    mode = "incremental" if params["incremental"] else "full"
+    await get_fs().collection("jobs").document("recalculate").set(
+        {"watermark": params["now"], "lastRunAt": datetime.now(timezone.utc), "mode": mode}, merge=True
+    )
+    return {
+        "ok": True,
+        "mode": mode,
+        "processed": totals.get("scanned", 0),
+        "scanned": totals.get("scanned", 0),
+        "changed": totals.get("changed", 0),
+        "written": totals.get("written", 0),
+        "elapsedMs": round((datetime.now(timezone.utc) - params["now"]).total_seconds() * 1000, 1),
+    }
+
+jobs.register("recalculate", _recalc_plan, _recalc_partition, _recalc_finish)
+
+async def _submit_job(res: Response, kind: str, params: dict, wait: bool, identity: dict | None = None) -> dict:
+    run = await jobs.submit(kind, params, identity)
+    # Devolve na hora o id para acompanhar em /job/status/{id}; `wait` espera o fim
+    if wait:
+        run = await jobs.wait(run["id"])
+        res.status_code = 200
+    return timestamps.to_json(run)
+
+@app.post("/job/recalculate", status_code=202, dependencies=[Depends(verify_job_token)])
+async def recalculate_subscriptions(res: Response, full: bool = False, wait: bool = False):
     now = datetime.now(timezone.utc)
-    next_payment = parse_next_payment(data.get("nextPayment"))
-    freq = data.get("billingFrequency", "monthly")
-
-    # Avança a data de pagamento até que ela esteja no futuro
-    while next_payment.date() <= now.date():
-        if freq == "yearly":
-            next_payment = next_payment + relativedelta(years=1)
-        else:  # default: monthly
-            next_payment = next_payment + relativedelta(months=1)
-            
-    # Prepara os dados para atualização: reativa o status e avança a data
-    update_data = {
-        "status": 1, # Reativa para "Active"
-        "nextPayment": next_payment.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+    job = await get_fs().collection("jobs").document("recalculate").get()
+    watermark = (job.to_dict() or {}).get("watermark")
+
+    # Sem `full`, só a janela desde a última execução bem-sucedida
+    incremental = not full and watermark is not None
+    # Uma execução interrompida só é retomada pelo mesmo modo (`full` começa outra)
+    return await _submit_job(
+        res, "recalculate", {"incremental": incremental, "now": now, "watermark": watermark}, wait,
+        identity={"incremental": incremental},
+    )
+
+@app.get("/job/status/{job_id}", dependencies=[Depends(verify_job_token)])
+async def job_status(job_id: str):
+    run = await jobs.get_run(job_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return timestamps.to_json(run)
+
+
+async def _single_partition(params: dict) -> list[dict]:
+    # Jobs que já percorrem as contas sozinhos (e gravam o próprio relatório em jobs/{kind})
+    return [{}]
+
+async def _report_totals(params: dict, totals: dict) -> dict:
+    return {"ok": True, **totals}
+
+async def _reconcile_cards_partition(params: dict, partition: dict, checkpoint) -> dict:
+    report = await cards.reconcile_card_totals(params["uid"])
+    for drift in report["drift"]:
+        response_cache.invalidate(drift["uid"])
+    return {"accounts": report["accounts"], "cards": report["cards"], "drifted": report["drifted"]}
+
+async def _check_rollups_partition(params: dict, partition: dict, checkpoint) -> dict:
+    report = await rollup.check_rollups(params["uid"], params["repair"])
+    for drift in report["drift"]:
+        response_cache.invalidate(drift["uid"])
+    return {"accounts": report["accounts"], "drifted": report["drifted"]}
+
+async def _migrate_timestamps_partition(params: dict, partition: dict, checkpoint) -> dict:
+    # Retomável: o checkpoint e os contadores de cada origem ficam em jobs/migrate-timestamps
+    report = await migrate_timestamps.migrate_timestamps(params["restart"])
+    counters = {}
+    for state in report.values():
+        for key in ("scanned", "migrated", "invalid", "skipped"):
+            counters[key] = counters.get(key, 0) + state.get(key, 0)
+    return counters
+
+jobs.register("reconcile-cards", _single_partition, _reconcile_cards_partition, _report_totals)
+jobs.register("check-rollups", _single_partition, _check_rollups_partition, _report_totals)
+jobs.register("migrate-timestamps", _single_partition, _migrate_timestamps_partition, _report_totals)
+
+@app.post("/job/reconcile-cards", status_code=202, dependencies=[Depends(verify_job_token)])
+async def reconcile_cards(res: Response, uid: str | None = None, wait: bool = False):
+    return await _submit_job(res, "reconcile-cards", {"uid": uid}, wait)
+
+
+@app.post("/job/check-rollups", status_code=202, dependencies=[Depends(verify_job_token)])
+async def check_rollups(res: Response, uid: str | None = None, repair: bool = True, wait: bool = False):
+    # Reconstrói os rollups a partir das assinaturas
+    return await _submit_job(res, "check-rollups", {"uid": uid, "repair": repair}, wait)
+
+
+@app.post("/job/migrate-timestamps", status_code=202, dependencies=[Depends(verify_job_token)])
+async def run_timestamp_migration(res: Response, restart: bool = False, wait: bool = False):
+    return await _submit_job(res, "migrate-timestamps", {"restart": restart}, wait)
+
+
+@app.get("/job/stats", dependencies=[Depends(verify_job_token)])
+def job_stats():
+    return {
+        "tokenCache": token_verifier.stats(),
+        "responseCache": response_cache.stats(),
+        "supportOutbox": get_support_outbox().stats(),
+        "refreshSingleFlight": refresh_flight.stats(),
+        "admission": admission.stats(),
+        "changeFeed": change_feed.stats(),
     }
 
-    doc_ref.update(update_data)
 
-    return {"detail": "Payment confirmed and subscription reactivated", 
-            "update": update_data}
+@app.get("/job/profiles", dependencies=[Depends(verify_job_token)])
+def list_profiles():
+    return profile_store.list()
 
-@app.post("/job/recalculate", dependencies=[Depends(verify_job_token)])
-def recalculate_subscriptions():
-    subscriptions_ref = fs.collection_group("subscriptions")
-    updated_count = 0
-    
-    for doc in subscriptions_ref.stream():
-        # A lógica complexa agora está na função auxiliar
-        _update_subscription_status(doc.reference)
-        updated_count += 1
-    
-    return {"ok": True, "processed": updated_count}
 
+@app.get("/job/profiles/{profile_id}", dependencies=[Depends(verify_job_token)])
+def download_profile(profile_id: str):
+    speedscope = profile_store.get(profile_id)
+    if speedscope is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
 
-@app.post("/api/support")
+    # Abrir em https://www.speedscope.app
+    return Response(
+        speedscope,
+        media_type="application/json",
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.speedscope.json"'},
+    )
+
+
+@app.get("/metrics", dependencies=[Depends(verify_job_token)])
+def prometheus_metrics():
+    return Response(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/api/support", status_code=202, dependencies=[Depends(rate_limited("support"))])
 def support_request(request: SupportRequest):
 
-    success = send_email(request.name, request.email, request.subject, request.message)
-    if not success:
-        raise HTTPException(status_code=500, detail="Failed to send support request")
+    try:
+        message_id = get_support_outbox().enqueue(request.name, request.email, request.subject, request.message)
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to queue support request")
 
-    return {"detail": "Support request sent successfully"}
\ No newline at end of file
+    return {"detail": "Support request queued", "id": message_id}
\ No newline at end of file
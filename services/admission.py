@@ -0,0 +1,226 @@
+"""
+Controle de admissão: bulkheads por grupo de rotas e rate limit por cliente.
+
+Cada grupo (jobs, support, auth, default) tem um limite de requisições em
+execução e uma fila curta; com a fila cheia (ou depois de esperar
+ADMISSION_QUEUE_TIMEOUT) a requisição é recusada na hora com 503 e
+Retry-After, em vez de esperar na threadpool atrás de trabalho lento. Os jobs
+ficam no próprio grupo e não ocupam as vagas das leituras.
+
+    ADMISSION_<GRUPO>_LIMIT / ADMISSION_<GRUPO>_QUEUE   (ex.: ADMISSION_JOBS_LIMIT=2)
+
+Rate limit com token bucket por IP (ou por uid, quando o token já é
+conhecido), configurável por RATE_LIMIT_<NOME>="requisições/segundos".
+"""
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict
+
+from services.metrics import is_stream_route
+
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+# Atrás de um proxy/load balancer o IP do cliente vem no X-Forwarded-For
+TRUST_PROXY_HEADERS = os.getenv("TRUST_PROXY_HEADERS", "false").lower() == "true"
+RATE_LIMIT_MAX_KEYS = 10000
+
+# grupo -> (em execução, na fila)
+_DEFAULT_LIMITS = {
+    "jobs": (2, 4),
+    "support": (8, 16),
+    "auth": (32, 64),
+    "default": (128, 256),
+}
+
+# Prefixos de rota -> grupo (o primeiro que casar); fora dos bulkheads: health e streams
+ROUTE_GROUPS = (
+    ("/job/", "jobs"),
+    ("/api/support", "support"),
+    ("/login", "auth"),
+    ("/signup", "auth"),
+    ("/auth/", "auth"),
+)
+EXEMPT_PATHS = {"/", "/health", "/metrics"}
+
+_DEFAULT_RATES = {
+    "login": "10/60",
+    "signup": "5/600",
+    "google": "10/60",
+    "support": "5/600",
+}
+
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Bulkhead:
+    def __init__(self, name: str, limit: int, queue: int):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self._semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        if self.active >= self.limit:
+            if self.waiting >= self.queue:
+                self.rejected += 1
+                raise Rejected(503, "SERVER_BUSY", 1)
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), ADMISSION_QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise Rejected(503, "SERVER_BUSY", 1)
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        self.admitted += 1
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "queue": self.queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+def _bulkheads() -> dict[str, Bulkhead]:
+    bulkheads = {}
+    for name, (limit, queue) in _DEFAULT_LIMITS.items():
+        limit = int(os.getenv(f"ADMISSION_{name.upper()}_LIMIT", limit))
+        queue = int(os.getenv(f"ADMISSION_{name.upper()}_QUEUE", queue))
+        bulkheads[name] = Bulkhead(name, limit, queue)
+    return bulkheads
+
+
+def route_group(path: str) -> str | None:
+    if path in EXEMPT_PATHS:
+        return None
+    for prefix, group in ROUTE_GROUPS:
+        if path.startswith(prefix):
+            return group
+    return "default"
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI: segura cada requisição no bulkhead do grupo da rota."""
+
+    def __init__(self, app, bulkheads: dict[str, Bulkhead]):
+        self.app = app
+        self.bulkheads = bulkheads
+
+    async def __call__(self, scope, receive, send):
+        # Streams têm os próprios limites (change_feed) e ficariam com a vaga por minutos.
+        # Pela rota, não pelo Accept: o header sozinho não pode furar o bulkhead
+        if scope["type"] != "http" or is_stream_route(scope) or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        group = route_group(scope["path"])
+        if group is None:
+            return await self.app(scope, receive, send)
+
+        bulkhead = self.bulkheads[group]
+        try:
+            await bulkhead.acquire()
+        except Rejected as e:
+            return await _reject(send, e)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            bulkhead.release()
+
+
+async def _reject(send, error: Rejected):
+    body = json.dumps({"detail": error.detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": error.status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, int(error.retry_after + 0.999))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimiter:
+    """Token bucket por chave: `capacity` requisições, repostas ao longo de `period` segundos."""
+
+    def __init__(self, name: str, capacity: int, period: float, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.name = name
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.max_keys = max_keys
+        # chave -> (tokens, última atualização); LRU para não crescer sem limite
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self.allowed = 0
+        self.rejected = 0
+
+    def check(self, key: str):
+        """Consome um token de `key` ou levanta Rejected (429) com o tempo até o próximo."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            self.rejected += 1
+            raise Rejected(429, "TOO_MANY_REQUESTS", (1 - tokens) / self.rate)
+
+        self._buckets[key] = (tokens - 1, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        self.allowed += 1
+
+    def stats(self) -> dict:
+        return {"capacity": self.capacity, "keys": len(self._buckets), "allowed": self.allowed, "rejected": self.rejected}
+
+
+def _rate_limiters() -> dict[str, RateLimiter]:
+    limiters = {}
+    for name, default in _DEFAULT_RATES.items():
+        count, period = os.getenv(f"RATE_LIMIT_{name.upper()}", default).split("/")
+        limiters[name] = RateLimiter(name, int(count), float(period))
+    return limiters
+
+
+def client_ip(scope) -> str:
+    if TRUST_PROXY_HEADERS:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                return value.decode().split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class Admission:
+    """Bulkheads e rate limiters do processo (configurados pelo ambiente)."""
+
+    def __init__(self):
+        self.bulkheads = _bulkheads()
+        self.rate_limiters = _rate_limiters()
+
+    def stats(self) -> dict:
+        return {
+            "bulkheads": {name: bulkhead.stats() for name, bulkhead in self.bulkheads.items()},
+            "rateLimits": {name: limiter.stats() for name, limiter in self.rate_limiters.items()},
+        }
@@ -0,0 +1,72 @@
+"""
+Calendário de cobrança das assinaturas. O próximo vencimento é calculado em
+tempo constante (sem somar período por período), respeitando o `billingDay`:
+dia 31 vira o último dia dos meses mais curtos, sem "escorregar" nos meses
+seguintes como acontecia somando relativedelta.
+"""
+import calendar
+from datetime import datetime, timedelta
+
+# Frequência -> tamanho do período em meses (weekly é tratado à parte, em dias)
+MONTHS_PER_PERIOD = {
+    "monthly": 1,
+    "quarterly": 3,
+    "semiannual": 6,
+    "yearly": 12,
+}
+FREQUENCIES = ("weekly", *MONTHS_PER_PERIOD)
+
+
+def _add_months(anchor: datetime, months: int, billing_day: int) -> datetime:
+    month_index = anchor.month - 1 + months
+    year, month = anchor.year + month_index // 12, month_index % 12 + 1
+    day = min(billing_day, calendar.monthrange(year, month)[1])
+    return anchor.replace(year=year, month=month, day=day)
+
+
+def occurrence(anchor: datetime, frequency: str, k: int, billing_day: int | None = None) -> datetime:
+    """k-ésimo vencimento a partir de `anchor` (k=0 é o próprio anchor)."""
+    if k == 0:
+        return anchor
+    if frequency == "weekly":
+        return anchor + timedelta(weeks=k)
+    if frequency not in MONTHS_PER_PERIOD:
+        raise ValueError(f"Unsupported billing frequency: {frequency}")
+    if not isinstance(billing_day, int) or not 1 <= billing_day <= 31:
+        billing_day = anchor.day
+    return _add_months(anchor, k * MONTHS_PER_PERIOD[frequency], billing_day)
+
+
+def _first_period_after(anchor: datetime, frequency: str, after: datetime, billing_day: int | None) -> int:
+    """Menor k tal que o vencimento k cai num dia posterior a `after`."""
+    if anchor.date() > after.date():
+        return 0
+
+    if frequency == "weekly":
+        return (after.date() - anchor.date()).days // 7 + 1
+    if frequency not in MONTHS_PER_PERIOD:
+        raise ValueError(f"Unsupported billing frequency: {frequency}")
+
+    step = MONTHS_PER_PERIOD[frequency]
+    months = (after.year - anchor.year) * 12 + (after.month - anchor.month)
+    k = max(1, -(-months // step))
+    # No mês de `after` o vencimento pode cair no mesmo dia ou antes dele
+    if occurrence(anchor, frequency, k, billing_day).date() <= after.date():
+        k += 1
+    return k
+
+
+def next_due(anchor: datetime, frequency: str, after: datetime, billing_day: int | None = None) -> datetime:
+    """
+    Primeiro vencimento do calendário de `anchor` cuja data é posterior à de
+    `after` (o próprio anchor se ele já estiver no futuro).
+    """
+    return occurrence(anchor, frequency, _first_period_after(anchor, frequency, after, billing_day), billing_day)
+
+
+def occurrences(anchor: datetime, frequency: str, after: datetime | None = None, billing_day: int | None = None):
+    """Gera os vencimentos futuros sob demanda, a partir do primeiro depois de `after`."""
+    k = _first_period_after(anchor, frequency, after, billing_day) if after is not None else 0
+    while True:
+        yield occurrence(anchor, frequency, k, billing_day)
+        k += 1
@@ -0,0 +1,165 @@
+import asyncio
+from datetime import datetime, timezone
+
+from firebase import get_fs, increment
+
+
+def _account_ref(uid: str):
+    return get_fs().collection("accounts").document(uid)
+
+
+def card_index_ref(uid: str, card_final_numbers: str):
+    """
+    Índice `accounts/{uid}/cardIndex/{cardFinalNumbers}` -> {"cardId": ...}.
+    Substitui a query por `cardFinalNumbers` na coleção de cartões.
+
+    Migração: cartões criados antes do índice não têm entrada. Rodar uma vez
+    depois do deploy `POST /job/reconcile-cards` (ou `python -m services.cards`),
+    que reconstrói o índice de todas as contas; até lá `lookup_card_refs` cai
+    na query antiga para esses cartões.
+    """
+    return _account_ref(uid).collection("cardIndex").document(card_final_numbers)
+
+
+def card_deltas(old: dict | None, new: dict | None) -> dict[str, float]:
+    """
+    Diferença de gasto por cartão entre a versão antiga e a nova de uma
+    assinatura. Se o cartão mudou, o preço sai do antigo e entra no novo.
+    """
+    deltas: dict[str, float] = {}
+
+    if old and old.get("cardFinalNumbers"):
+        card = old["cardFinalNumbers"]
+        deltas[card] = deltas.get(card, 0.0) - (old.get("price") or 0.0)
+
+    if new and new.get("cardFinalNumbers"):
+        card = new["cardFinalNumbers"]
+        deltas[card] = deltas.get(card, 0.0) + (new.get("price") or 0.0)
+
+    return {card: delta for card, delta in deltas.items() if delta}
+
+
+async def lookup_card_refs(uid: str, card_numbers, transaction=None) -> dict:
+    """
+    Resolve `cardFinalNumbers` -> referência do cartão pelo índice (um
+    get_all para todos os cartões). Números sem entrada no índice (cartões
+    anteriores a ele) são procurados pela query em `cards`; os que não têm
+    cartão são ignorados.
+    """
+    card_numbers = list(dict.fromkeys(card_numbers))
+    if not card_numbers:
+        return {}
+    refs = [card_index_ref(uid, card) for card in card_numbers]
+    # O ID do documento do índice é o próprio cardFinalNumbers
+    found = {
+        snap.id: _account_ref(uid).collection("cards").document(snap.get("cardId"))
+        async for snap in get_fs().get_all(refs, transaction=transaction)
+        if snap.exists
+    }
+
+    missing = [card for card in card_numbers if card not in found]
+    if missing:
+        fallbacks = await asyncio.gather(*(_query_card_ref(uid, card, transaction) for card in missing))
+        found.update({card: ref for card, ref in zip(missing, fallbacks) if ref is not None})
+    return found
+
+
+async def _query_card_ref(uid: str, card_final_numbers: str, transaction=None):
+    query = (
+        _account_ref(uid).collection("cards")
+        .where("cardFinalNumbers", "==", card_final_numbers)
+        .select([])
+        .limit(1)
+    )
+    async for card in query.stream(transaction=transaction):
+        return card.reference
+    return None
+
+
+def apply_card_deltas(writer, card_refs: dict, deltas: dict[str, float]):
+    """Aplica os incrementos de `totalSpent` num batch ou transação."""
+    for card, delta in deltas.items():
+        if card in card_refs:
+            writer.update(card_refs[card], {"totalSpent": increment(delta)})
+
+
+async def sum_card_subscriptions(uid: str, card_final_numbers: str, transaction=None) -> float:
+    query = (
+        _account_ref(uid).collection("subscriptions")
+        .where("cardFinalNumbers", "==", card_final_numbers)
+        .select(["price"])
+    )
+    return sum([sub.to_dict().get("price") or 0.0 async for sub in query.stream(transaction=transaction)])
+
+
+async def recompute_card_totals(uid: str, card_numbers) -> int:
+    """Recalcula de uma vez o total dos cartões informados (ex.: após importação)."""
+    card_refs = await lookup_card_refs(uid, card_numbers)
+    if not card_refs:
+        return 0
+
+    totals = await asyncio.gather(*(sum_card_subscriptions(uid, card) for card in card_refs))
+    batch = get_fs().batch()
+    for card_ref, total in zip(card_refs.values(), totals):
+        batch.update(card_ref, {"totalSpent": total})
+    await batch.commit()
+    return len(card_refs)
+
+
+async def reconcile_card_totals(uid: str | None = None) -> dict:
+    """
+    Recalcula o `totalSpent` de todos os cartões a partir das assinaturas,
+    corrige o que tiver divergido e reconstrói o índice de cartões.
+    """
+    if uid:
+        accounts = [_account_ref(uid)]
+    else:
+        accounts = [doc.reference async for doc in get_fs().collection("accounts").select([]).stream()]
+
+    report = {"accounts": 0, "cards": 0, "drifted": 0, "drift": []}
+
+    for account_ref in accounts:
+        report["accounts"] += 1
+
+        totals: dict[str, float] = {}
+        subscriptions = account_ref.collection("subscriptions").select(["price", "cardFinalNumbers"])
+        async for sub in subscriptions.stream():
+            data = sub.to_dict()
+            card = data.get("cardFinalNumbers")
+            if card:
+                totals[card] = totals.get(card, 0.0) + (data.get("price") or 0.0)
+
+        batch = get_fs().batch()
+        async for card in account_ref.collection("cards").stream():
+            data = card.to_dict()
+            card_numbers = data.get("cardFinalNumbers")
+            if not card_numbers:
+                continue
+
+            report["cards"] += 1
+            expected = totals.get(card_numbers, 0.0)
+            if abs((data.get("totalSpent") or 0.0) - expected) > 0.005:
+                report["drifted"] += 1
+                report["drift"].append({
+                    "uid": account_ref.id,
+                    "cardId": card.id,
+                    "stored": data.get("totalSpent"),
+                    "expected": expected,
+                })
+                batch.update(card.reference, {"totalSpent": expected})
+
+            batch.set(card_index_ref(account_ref.id, card_numbers), {"cardId": card.id})
+        await batch.commit()
+
+    await get_fs().collection("jobs").document("reconcile-cards").set({
+        "lastRunAt": datetime.now(timezone.utc),
+        "accounts": report["accounts"],
+        "cards": report["cards"],
+        "drifted": report["drifted"],
+    }, merge=True)
+    return report
+
+
+if __name__ == "__main__":
+    result = asyncio.run(reconcile_card_totals())
+    print(f"{result['accounts']} accounts, {result['cards']} cards, {result['drifted']} drifted")
@@ -0,0 +1,207 @@
+"""
+Feed em tempo real das assinaturas de cada usuário (/subscription/stream).
+
+Um único listener do Firestore (on_snapshot) por usuário ativo, compartilhado
+por todas as conexões dele (abas, celular...). O listener mantém o estado atual
+em memória: uma conexão nova recebe um evento `sync` com tudo, sem ler o
+Firestore de novo, e depois só as diferenças (added, modified, removed). Quando
+a última conexão do usuário fecha, o listener fica vivo por FEED_IDLE_SECONDS
+(reconexões rápidas o reaproveitam) e depois é desligado.
+
+Conexões e listeners são limitados (FeedFull quando acabam as vagas) e
+aparecem em /job/stats e no /metrics.
+"""
+import os
+import asyncio
+
+from firebase import get_watch_fs
+from services.timestamps import to_json
+
+FEED_MAX_CONNECTIONS = int(os.getenv("FEED_MAX_CONNECTIONS", "1000"))
+FEED_MAX_CONNECTIONS_PER_USER = int(os.getenv("FEED_MAX_CONNECTIONS_PER_USER", "10"))
+FEED_MAX_LISTENERS = int(os.getenv("FEED_MAX_LISTENERS", "500"))
+FEED_IDLE_SECONDS = float(os.getenv("FEED_IDLE_SECONDS", "30"))
+FEED_READY_TIMEOUT = float(os.getenv("FEED_READY_TIMEOUT", "10"))
+# Eventos pendentes por conexão; um cliente lento demais é desconectado (e ressincroniza)
+FEED_QUEUE_SIZE = 256
+
+_CHANGE_TYPES = {"ADDED": "added", "MODIFIED": "modified", "REMOVED": "removed"}
+
+
+class FeedFull(Exception):
+    pass
+
+
+class _UserFeed:
+    __slots__ = ("uid", "watch", "documents", "ready", "queues", "idle_handle")
+
+    def __init__(self, uid: str):
+        self.uid = uid
+        self.watch = None
+        self.documents: dict[str, dict] = {}
+        self.ready = asyncio.Event()
+        self.queues: set[asyncio.Queue] = set()
+        self.idle_handle: asyncio.TimerHandle | None = None
+
+
+class ChangeFeed:
+    def __init__(self):
+        self._feeds: dict[str, _UserFeed] = {}
+        self._connections = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stats = {"connected": 0, "rejected": 0, "dropped": 0, "listenersStarted": 0, "listenersStopped": 0, "events": 0}
+
+    # --- conexões ---
+
+    async def connect(self, uid: str) -> asyncio.Queue:
+        """
+        Registra uma conexão e devolve a fila de eventos dela (o primeiro é o
+        `sync`; None marca o fim). Levanta FeedFull se não houver vaga.
+        """
+        self._loop = asyncio.get_running_loop()
+        feed = self._feeds.get(uid)
+        if self._connections >= FEED_MAX_CONNECTIONS or (feed and len(feed.queues) >= FEED_MAX_CONNECTIONS_PER_USER):
+            self._stats["rejected"] += 1
+            raise FeedFull("Too many connections")
+
+        if feed is None:
+            if len(self._feeds) >= FEED_MAX_LISTENERS:
+                self._stats["rejected"] += 1
+                raise FeedFull("Too many listeners")
+            feed = self._start(uid)
+
+        if feed.idle_handle is not None:
+            feed.idle_handle.cancel()
+            feed.idle_handle = None
+
+        # Reserva a vaga antes de esperar o primeiro snapshot
+        self._connections += 1
+        queue = asyncio.Queue(FEED_QUEUE_SIZE)
+        try:
+            await asyncio.wait_for(feed.ready.wait(), FEED_READY_TIMEOUT)
+        except BaseException:
+            self._connections -= 1
+            self._schedule_idle(feed)
+            raise
+
+        # Sem await entre o registro e o sync: nenhum evento fica de fora nem duplicado
+        feed.queues.add(queue)
+        queue.put_nowait({"type": "sync", "documents": [{"id": doc_id, **data} for doc_id, data in feed.documents.items()]})
+        self._stats["connected"] += 1
+        return queue
+
+    def disconnect(self, uid: str, queue: asyncio.Queue):
+        feed = self._feeds.get(uid)
+        if feed is None or queue not in feed.queues:
+            return
+        feed.queues.discard(queue)
+        self._connections -= 1
+        self._schedule_idle(feed)
+
+    def _schedule_idle(self, feed: _UserFeed):
+        if not feed.queues and feed.idle_handle is None:
+            feed.idle_handle = self._loop.call_later(FEED_IDLE_SECONDS, self._stop_if_idle, feed.uid)
+
+    # --- listeners ---
+
+    def _start(self, uid: str) -> _UserFeed:
+        feed = self._feeds[uid] = _UserFeed(uid)
+        loop = self._loop
+
+        def on_snapshot(docs, changes, read_time):
+            # Roda na thread do SDK: só repassa para o event loop
+            events = [
+                {
+                    "type": _CHANGE_TYPES[change.type.name],
+                    "id": change.document.id,
+                    "data": None if change.type.name == "REMOVED" else to_json(change.document.to_dict()),
+                }
+                for change in changes
+            ]
+            loop.call_soon_threadsafe(self._publish, feed, events)
+
+        subscriptions = get_watch_fs().collection("accounts").document(uid).collection("subscriptions")
+        feed.watch = subscriptions.on_snapshot(on_snapshot)
+        self._stats["listenersStarted"] += 1
+        return feed
+
+    def _publish(self, feed: _UserFeed, events: list[dict]):
+        if self._feeds.get(feed.uid) is not feed:
+            return  # listener já desligado
+
+        for event in events:
+            if event["type"] == "removed":
+                feed.documents.pop(event["id"], None)
+            else:
+                feed.documents[event["id"]] = event["data"]
+
+        # O primeiro snapshot só preenche o estado (as conexões recebem o sync)
+        if not feed.ready.is_set():
+            feed.ready.set()
+            return
+
+        for queue in list(feed.queues):
+            try:
+                for event in events:
+                    queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Cliente não acompanha: encerra; ao reconectar recebe um sync novo
+                self._drop(feed, queue)
+        self._stats["events"] += len(events)
+
+    @staticmethod
+    def _end(queue: asyncio.Queue, *events):
+        # Descarta o que estiver pendente e fecha a conexão depois de `events`
+        while not queue.empty():
+            queue.get_nowait()
+        for event in events:
+            queue.put_nowait(event)
+        queue.put_nowait(None)
+
+    def _drop(self, feed: _UserFeed, queue: asyncio.Queue):
+        self._stats["dropped"] += 1
+        self._end(queue, {"type": "resync"})
+        feed.queues.discard(queue)
+        self._connections -= 1
+        self._schedule_idle(feed)
+
+    def _stop_if_idle(self, uid: str):
+        feed = self._feeds.get(uid)
+        if feed is not None and not feed.queues:
+            self._stop(feed)
+
+    def _stop(self, feed: _UserFeed):
+        self._feeds.pop(feed.uid, None)
+        if feed.idle_handle is not None:
+            feed.idle_handle.cancel()
+        if feed.watch is not None:
+            feed.watch.unsubscribe()
+        self._stats["listenersStopped"] += 1
+
+    def close(self):
+        """Desliga todos os listeners e encerra as conexões (shutdown)."""
+        for feed in list(self._feeds.values()):
+            for queue in feed.queues:
+                self._end(queue)
+            self._connections -= len(feed.queues)
+            feed.queues.clear()
+            self._stop(feed)
+
+    # --- observabilidade ---
+
+    @property
+    def connections(self) -> int:
+        return self._connections
+
+    @property
+    def listeners(self) -> int:
+        return len(self._feeds)
+
+    def stats(self) -> dict:
+        return {
+            "connections": self._connections,
+            "listeners": len(self._feeds),
+            "maxConnections": FEED_MAX_CONNECTIONS,
+            "maxListeners": FEED_MAX_LISTENERS,
+            **self._stats,
+        }
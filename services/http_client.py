@@ -0,0 +1,84 @@
+import os
+
+import httpx
+
+from services import metrics, resilience
+
+try:
+    import h2  # noqa: F401  (habilita HTTP/2 no httpx quando instalado)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Endpoints do Google (sobrescrevíveis para apontar para um stub local)
+IDENTITY_TOOLKIT_URL = os.getenv("IDENTITY_TOOLKIT_URL", "https://identitytoolkit.googleapis.com")
+SECURE_TOKEN_URL = os.getenv("SECURE_TOKEN_URL", "https://securetoken.googleapis.com")
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Cliente HTTP assíncrono compartilhado por todos os fluxos de autenticação.
+    Reaproveita conexões (keep-alive) e usa HTTP/2 quando disponível.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(
+                connect=HTTP_CONNECT_TIMEOUT,
+                read=HTTP_READ_TIMEOUT,
+                write=HTTP_READ_TIMEOUT,
+                pool=HTTP_POOL_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _client
+
+
+def _dependency(url: str) -> str:
+    if url.startswith(SECURE_TOKEN_URL):
+        return "securetoken"
+    if url.startswith(IDENTITY_TOOLKIT_URL):
+        return "identitytoolkit"
+    return "other"
+
+
+async def _post(url: str, kind: str, **kwargs) -> httpx.Response:
+    with metrics.timed(f"http_{kind}"):
+        return await get_client().post(url, **kwargs)
+
+
+async def post(url: str, idempotent: bool = False, **kwargs) -> httpx.Response:
+    """
+    POST com prazo, breaker e (se `idempotent`) retries da dependência; 5xx e
+    429 contam como falha dela.
+    """
+    kind = _dependency(url)
+    if kind == "other":
+        return await _post(url, kind, **kwargs)
+    return await resilience.call(
+        kind,
+        lambda: _post(url, kind, **kwargs),
+        idempotent=idempotent,
+        failed=lambda r: r.status_code >= 500 or r.status_code == 429,
+    )
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,88 @@
+"""
+Idempotency-Key nas mutações (criar assinatura/cartão, confirmar pagamento).
+
+A primeira requisição com uma chave reserva `idempotencyKeys/{hash}` e, se der
+certo, grava a resposta lá; uma repetição (retry do app, duplo clique) recebe
+a mesma resposta sem refazer as escritas. O registro fica no Firestore (vale
+para todas as instâncias) e expira em IDEMPOTENCY_TTL_HOURS pela política de
+TTL em `expiresAt` (firestore.indexes.json).
+
+Uma requisição que falhou libera a chave. Se a instância cair no meio, a
+reserva vence depois de IDEMPOTENCY_LEASE_SECONDS e a chave pode ser usada de
+novo.
+"""
+import os
+import json
+import hashlib
+from datetime import datetime, timezone, timedelta
+
+from firebase import get_fs, transactional
+
+IDEMPOTENCY_TTL = timedelta(hours=float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+IDEMPOTENCY_LEASE = timedelta(seconds=float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "60")))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    """A chave está em uso por outra requisição (em andamento ou com outro corpo)."""
+
+    def __init__(self, message: str, in_progress: bool = False):
+        super().__init__(message)
+        self.in_progress = in_progress
+
+
+def fingerprint(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _ref(uid: str, scope: str, key: str):
+    digest = hashlib.sha256(f"{uid}\n{scope}\n{key}".encode()).hexdigest()
+    return get_fs().collection("idempotencyKeys").document(digest)
+
+
+async def begin(uid: str, scope: str, key: str, request_fingerprint: str) -> dict | None:
+    """
+    Reserva a chave. Devolve None se esta requisição deve executar, ou a
+    resposta gravada ({status, body}) se for uma repetição.
+    """
+    ref = _ref(uid, scope, key)
+
+    @transactional
+    async def _claim(transaction):
+        now = datetime.now(timezone.utc)
+        doc = await ref.get(transaction=transaction)
+        saved = doc.to_dict() if doc.exists else None
+
+        if saved and saved["expiresAt"] > now:
+            if saved["fingerprint"] != request_fingerprint:
+                raise IdempotencyConflict("Idempotency-Key reused with a different request")
+            if saved["state"] == "done":
+                return {"status": saved["status"], "body": saved["body"]}
+            if saved["leaseUntil"] > now:
+                raise IdempotencyConflict("A request with this Idempotency-Key is in progress", in_progress=True)
+
+        transaction.set(ref, {
+            "uid": uid,
+            "scope": scope,
+            "fingerprint": request_fingerprint,
+            "state": "pending",
+            "createdAt": now,
+            "leaseUntil": now + IDEMPOTENCY_LEASE,
+            "expiresAt": now + IDEMPOTENCY_TTL,
+        })
+        return None
+
+    return await _claim(get_fs().transaction())
+
+
+async def complete(uid: str, scope: str, key: str, status: int, body):
+    await _ref(uid, scope, key).update({
+        "state": "done",
+        "status": status,
+        "body": body,
+        "completedAt": datetime.now(timezone.utc),
+    })
+
+
+async def release(uid: str, scope: str, key: str):
+    await _ref(uid, scope, key).delete()
@@ -0,0 +1,256 @@
+"""
+Jobs particionados sobre collection groups.
+
+Cada execução vira um documento em `jobRuns/{id}` com os parâmetros, o estado
+(queued, running, done, failed) e um mapa de partições. A coleção é dividida
+em faixas de __name__ com partition queries do Firestore; as partições rodam
+em paralelo (no máximo JOB_PARALLELISM por vez) e cada uma grava o próprio
+checkpoint (último documento processado + contadores). Uma execução que caiu
+no meio (falha ou processo reiniciado) é retomada pelo próximo disparo do
+mesmo tipo de job, pulando as partições prontas e continuando as outras do
+checkpoint. Só retoma se a identidade do disparo (os parâmetros que definem a
+execução, ex.: incremental ou completa) for a mesma; senão começa outra.
+
+O ponteiro `jobs/{kind}.activeRun` é lido e trocado numa transação: disparos
+concorrentes (várias instâncias, cron duplicado) ficam com a mesma execução.
+
+Um tipo de job é registrado com `register(kind, plan, worker, finish)`:
+
+    plan(params)                         -> lista de partições ({start, end} ou {})
+    worker(params, partition, checkpoint) -> contadores da partição
+    finish(params, totals)               -> resultado final (gravado no jobRun)
+
+O worker recebe a partição com o último checkpoint (`cursor` e `counters`),
+continua a contagem a partir dele e chama `await checkpoint(cursor, counters)`
+depois de confirmar as escritas até `cursor` (caminho do documento).
+"""
+import os
+import uuid
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timezone, timedelta
+
+from firebase import get_fs, transactional
+
+JOB_PARALLELISM = int(os.getenv("JOB_PARALLELISM", "4"))
+JOB_PARTITIONS = int(os.getenv("JOB_PARTITIONS", "16"))
+# Sem heartbeat há mais que isso, a execução é considerada abandonada
+JOB_STALE_AFTER = timedelta(seconds=int(os.getenv("JOB_STALE_SECONDS", "600")))
+
+
+@dataclass
+class JobType:
+    plan: object
+    worker: object
+    finish: object
+
+
+_types: dict[str, JobType] = {}
+# Execuções rodando neste processo (id -> task)
+_tasks: dict[str, asyncio.Task] = {}
+
+
+def register(kind: str, plan, worker, finish):
+    _types[kind] = JobType(plan, worker, finish)
+
+
+def _runs():
+    return get_fs().collection("jobRuns")
+
+
+async def collection_group_partitions(collection_id: str, count: int = JOB_PARTITIONS) -> list[dict]:
+    """Faixas [start, end) de __name__ com tamanhos parecidos (partition query do Firestore)."""
+    if count <= 1:
+        return [{"start": None, "end": None}]
+    partitions = []
+    async for partition in get_fs().collection_group(collection_id).get_partitions(count):
+        partitions.append({
+            "start": partition.start_at.path if partition.start_at is not None else None,
+            "end": partition.end_at.path if partition.end_at is not None else None,
+        })
+    return partitions or [{"start": None, "end": None}]
+
+
+def partition_query(query, partition: dict):
+    """Limita `query` à faixa da partição, continuando do checkpoint se houver."""
+    query = query.order_by("__name__")
+    if partition.get("cursor"):
+        query = query.start_after({"__name__": get_fs().document(partition["cursor"])})
+    elif partition.get("start"):
+        query = query.start_at({"__name__": get_fs().document(partition["start"])})
+    if partition.get("end"):
+        query = query.end_before({"__name__": get_fs().document(partition["end"])})
+    return query
+
+
+def _public(run_id: str, data: dict) -> dict:
+    partitions = data.get("partitions") or {}
+    return {
+        "id": run_id,
+        "kind": data.get("kind"),
+        "status": data.get("status"),
+        "params": data.get("params"),
+        "createdAt": data.get("createdAt"),
+        "startedAt": data.get("startedAt"),
+        "finishedAt": data.get("finishedAt"),
+        "heartbeatAt": data.get("heartbeatAt"),
+        "attempts": data.get("attempts", 0),
+        "partitions": {
+            "total": len(partitions),
+            "done": sum(1 for p in partitions.values() if p.get("done")),
+        },
+        "progress": _totals(partitions),
+        "result": data.get("result"),
+        "error": data.get("error"),
+    }
+
+
+def _totals(partitions: dict) -> dict:
+    totals = {}
+    for partition in partitions.values():
+        for key, value in (partition.get("counters") or {}).items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+async def get_run(run_id: str) -> dict | None:
+    doc = await _runs().document(run_id).get()
+    return _public(doc.id, doc.to_dict()) if doc.exists else None
+
+
+def _is_alive(run_id: str, data: dict, now: datetime) -> bool:
+    task = _tasks.get(run_id)
+    if task is not None:
+        return not task.done()
+    # Rodando em outra instância: confia no heartbeat recente
+    heartbeat = data.get("heartbeatAt")
+    return data.get("status") in ("queued", "running") and heartbeat is not None and now - heartbeat < JOB_STALE_AFTER
+
+
+async def submit(kind: str, params: dict, identity: dict | None = None) -> dict:
+    """
+    Dispara (ou retoma) uma execução do job `kind` e devolve o jobRun sem
+    esperar o fim. Se já existe uma execução viva do mesmo tipo, devolve ela.
+
+    `identity` são os parâmetros que definem a execução (padrão: `params`):
+    uma execução interrompida só é retomada, com os parâmetros dela, se a
+    identidade bater; com outra identidade começa uma nova.
+    """
+    identity = params if identity is None else identity
+    pointer_ref = get_fs().collection("jobs").document(kind)
+
+    @transactional
+    async def _claim(transaction):
+        now = datetime.now(timezone.utc)
+        pointer = await pointer_ref.get(transaction=transaction)
+        active_id = (pointer.to_dict() or {}).get("activeRun")
+
+        if active_id:
+            active_ref = _runs().document(active_id)
+            active = await active_ref.get(transaction=transaction)
+            if active.exists:
+                data = active.to_dict()
+                if _is_alive(active_id, data, now):
+                    return active_id, data, False
+                if data.get("status") != "done" and data.get("identity", data.get("params")) == identity:
+                    # Execução interrompida: retoma do checkpoint com os mesmos parâmetros.
+                    # O heartbeat novo faz os outros disparos verem a execução como viva.
+                    claimed = {"status": "queued", "heartbeatAt": now}
+                    transaction.update(active_ref, claimed)
+                    return active_id, {**data, **claimed}, True
+
+        run_id = uuid.uuid4().hex
+        plan = await _types[kind].plan(params)
+        data = {
+            "kind": kind,
+            "status": "queued",
+            "params": params,
+            "identity": identity,
+            "createdAt": now,
+            "heartbeatAt": now,
+            "attempts": 0,
+            "partitions": {f"p{i}": {**partition, "cursor": None, "done": False, "counters": {}} for i, partition in enumerate(plan)},
+        }
+        transaction.set(_runs().document(run_id), data)
+        transaction.set(pointer_ref, {"activeRun": run_id}, merge=True)
+        return run_id, data, True
+
+    run_id, data, start = await _claim(get_fs().transaction())
+    # Só depois do commit: uma transação refeita não pode deixar task para trás
+    if start:
+        _start(kind, run_id)
+    return _public(run_id, data)
+
+
+def _start(kind: str, run_id: str):
+    _tasks[run_id] = asyncio.create_task(_execute(kind, run_id))
+
+
+async def wait(run_id: str) -> dict | None:
+    task = _tasks.get(run_id)
+    if task is not None:
+        await asyncio.shield(task)
+    return await get_run(run_id)
+
+
+async def _execute(kind: str, run_id: str):
+    job = _types[kind]
+    run_ref = _runs().document(run_id)
+    try:
+        data = (await run_ref.get()).to_dict()
+        params = data["params"]
+        now = datetime.now(timezone.utc)
+        await run_ref.update({
+            "status": "running",
+            "startedAt": data.get("startedAt") or now,
+            "heartbeatAt": now,
+            "attempts": data.get("attempts", 0) + 1,
+            "error": None,
+        })
+
+        partitions = data["partitions"]
+        semaphore = asyncio.Semaphore(JOB_PARALLELISM)
+
+        async def run_partition(key: str):
+            partition = partitions[key]
+
+            async def checkpoint(cursor: str | None, counters: dict):
+                partition["cursor"] = cursor
+                partition["counters"] = counters
+                await run_ref.update({
+                    f"partitions.{key}.cursor": cursor,
+                    f"partitions.{key}.counters": counters,
+                    "heartbeatAt": datetime.now(timezone.utc),
+                })
+
+            async with semaphore:
+                counters = await job.worker(params, partition, checkpoint)
+                partition["counters"] = counters
+                partition["done"] = True
+                await run_ref.update({
+                    f"partitions.{key}.counters": counters,
+                    f"partitions.{key}.done": True,
+                    "heartbeatAt": datetime.now(timezone.utc),
+                })
+
+        # As outras partições terminam (e gravam checkpoint) antes de a execução ser marcada como falha
+        results = await asyncio.gather(
+            *(run_partition(key) for key, p in partitions.items() if not p.get("done")),
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+
+        result = await job.finish(params, _totals(partitions))
+        await run_ref.update({
+            "status": "done",
+            "result": result,
+            "finishedAt": datetime.now(timezone.utc),
+        })
+        await get_fs().collection("jobs").document(kind).set({"activeRun": None}, merge=True)
+    except Exception as e:
+        # Fica como ativa: o próximo disparo retoma das partições/checkpoints salvos
+        await run_ref.update({"status": "failed", "error": str(e)})
+    finally:
+        _tasks.pop(run_id, None)
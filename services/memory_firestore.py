@@ -0,0 +1,683 @@
+"""
+Backend em memória com a mesma interface (assíncrona) do cliente do Firestore
+usada pelo app: coleções, subcoleções, collection_group, where/order_by/
+select/cursores/limit, partition queries, batch (com write_option), transação, Increment e
+on_snapshot (listeners de coleção, chamados na hora de cada commit). Serve para rodar o
+main.py sem um projeto Firebase (DATA_BACKEND=memory), p.ex. nos testes de carga.
+
+A latência de cada RPC pode ser simulada com MEMORY_LATENCY_MS (+ jitter).
+"""
+import os
+import copy
+import random
+import string
+import asyncio
+import functools
+from enum import Enum
+from datetime import datetime, timezone, timedelta
+
+from services import metrics
+
+MEMORY_LATENCY_MS = float(os.getenv("MEMORY_LATENCY_MS", "0"))
+MEMORY_LATENCY_JITTER_MS = float(os.getenv("MEMORY_LATENCY_JITTER_MS", "0"))
+TRANSACTION_MAX_ATTEMPTS = 5
+
+_AUTO_ID_CHARS = string.ascii_letters + string.digits
+
+
+class Increment:
+    def __init__(self, value):
+        self.value = value
+
+
+class LastUpdateOption:
+    """Precondição de escrita: o documento ainda tem este update_time."""
+
+    def __init__(self, last_update_time: datetime):
+        self.last_update_time = last_update_time
+
+
+class _Record:
+    __slots__ = ("data", "create_time", "update_time")
+
+    def __init__(self, data: dict, now: datetime):
+        self.data = data
+        self.create_time = now
+        self.update_time = now
+
+
+def _split_field_path(path: str) -> list[str]:
+    """`a.b` -> ["a", "b"]; segmentos entre crases podem conter pontos."""
+    parts, current, quoted = [], [], False
+    for ch in path:
+        if ch == "`":
+            quoted = not quoted
+        elif ch == "." and not quoted:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+    parts.append("".join(current))
+    return parts
+
+
+_MISSING = object()
+
+
+def _get_field(data: dict, path: str):
+    value = data
+    for part in _split_field_path(path):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set_field(data: dict, path: str, value):
+    parts = _split_field_path(path)
+    for part in parts[:-1]:
+        if not isinstance(data.get(part), dict):
+            data[part] = {}
+        data = data[part]
+
+    if isinstance(value, Increment):
+        current = data.get(parts[-1])
+        value = (current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0) + value.value
+    data[parts[-1]] = copy.deepcopy(value)
+
+
+def _merge(target: dict, source: dict):
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        elif isinstance(value, dict):
+            target[key] = _resolve_increments(value)
+        else:
+            _set_field(target, f"`{key}`", value)
+
+
+def _resolve_increments(data: dict) -> dict:
+    # Increment em `set` sem documento anterior vira o próprio valor
+    result = {}
+    for key, value in data.items():
+        if isinstance(value, Increment):
+            result[key] = value.value
+        elif isinstance(value, dict):
+            result[key] = _resolve_increments(value)
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+
+def _type_rank(value) -> int:
+    # Mesma ordem entre tipos usada pelo Firestore
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, DocumentReference):
+        return 6
+    if isinstance(value, (list, tuple)):
+        return 8
+    return 9
+
+
+def _sort_key(value):
+    rank = _type_rank(value)
+    if rank == 6:
+        return rank, value.path
+    if rank in (8, 9):
+        return rank, repr(value)
+    return rank, value
+
+
+def _compare(op: str, value, expected) -> bool:
+    if op == "==":
+        return value == expected
+    if op == "!=":
+        return value is not None and value != expected
+    if op == "in":
+        return value in expected
+    if op == "not-in":
+        return value is not None and value not in expected
+    if op == "array-contains":
+        return isinstance(value, list) and expected in value
+    if op == "array-contains-any":
+        return isinstance(value, list) and any(v in value for v in expected)
+
+    # Filtros de intervalo só casam valores do mesmo tipo
+    if _type_rank(value) != _type_rank(expected):
+        return False
+    value, expected = _sort_key(value), _sort_key(expected)
+    if op == "<":
+        return value < expected
+    if op == "<=":
+        return value <= expected
+    if op == ">":
+        return value > expected
+    if op == ">=":
+        return value >= expected
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+class DocumentSnapshot:
+    def __init__(self, reference: "DocumentReference", record: _Record | None, field_paths=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = record is not None
+        self.create_time = record.create_time if record else None
+        self.update_time = record.update_time if record else None
+        self.read_time = datetime.now(timezone.utc)
+        self._data = None
+        if record is not None:
+            if field_paths is None:
+                self._data = copy.deepcopy(record.data)
+            else:
+                self._data = {}
+                for path in field_paths:
+                    value = _get_field(record.data, path)
+                    if value is not _MISSING:
+                        _set_field(self._data, path, value)
+
+    def to_dict(self) -> dict | None:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path: str):
+        if self._data is None:
+            return None
+        value = _get_field(self._data, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class DocumentReference:
+    def __init__(self, client: "MemoryClient", path: str):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return f"<DocumentReference {self.path}>"
+
+    @property
+    def parent(self) -> "CollectionReference":
+        return CollectionReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, collection_id: str) -> "CollectionReference":
+        return CollectionReference(self._client, f"{self.path}/{collection_id}")
+
+    async def get(self, field_paths=None, transaction=None) -> DocumentSnapshot:
+        await self._client._rpc("firestore_read")
+        if transaction is not None:
+            transaction._read(self)
+        return self._client._snapshot(self, field_paths)
+
+    async def create(self, document_data: dict):
+        batch = self._client.batch()
+        batch.create(self, document_data)
+        return (await batch.commit())[0]
+
+    async def set(self, document_data: dict, merge: bool = False):
+        batch = self._client.batch()
+        batch.set(self, document_data, merge=merge)
+        return (await batch.commit())[0]
+
+    async def update(self, field_updates: dict, option: LastUpdateOption | None = None):
+        batch = self._client.batch()
+        batch.update(self, field_updates, option=option)
+        return (await batch.commit())[0]
+
+    async def delete(self):
+        batch = self._client.batch()
+        batch.delete(self)
+        return (await batch.commit())[0]
+
+
+class Query:
+    def __init__(self, client: "MemoryClient", path: str, all_descendants: bool = False):
+        self._client = client
+        self._path = path
+        self._all_descendants = all_descendants
+        self._filters: list[tuple[str, str, object]] = []
+        self._orders: list[tuple[str, str]] = []
+        self._projection: list[str] | None = None
+        # (valores do cursor, inclusivo?)
+        self._start: tuple[dict, bool] | None = None
+        self._end: tuple[dict, bool] | None = None
+        self._limit: int | None = None
+        self._offset = 0
+
+    def _copy(self, **changes) -> "Query":
+        query = Query(self._client, self._path, self._all_descendants)
+        query._filters = list(self._filters)
+        query._orders = list(self._orders)
+        query._projection = self._projection
+        query._start = self._start
+        query._end = self._end
+        query._limit = self._limit
+        query._offset = self._offset
+        for name, value in changes.items():
+            setattr(query, name, value)
+        return query
+
+    def where(self, field_path: str | None = None, op_string: str | None = None, value=None, *, filter=None) -> "Query":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(_filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "Query":
+        return self._copy(_orders=self._orders + [(field_path, direction)])
+
+    def select(self, field_paths) -> "Query":
+        return self._copy(_projection=list(field_paths))
+
+    def limit(self, count: int) -> "Query":
+        return self._copy(_limit=count)
+
+    def offset(self, num_to_skip: int) -> "Query":
+        return self._copy(_offset=num_to_skip)
+
+    def _cursor_values(self, document_fields) -> dict:
+        if isinstance(document_fields, DocumentSnapshot):
+            values = {field: document_fields.get(field) for field, _ in self._orders if field != "__name__"}
+            values["__name__"] = document_fields.reference.path
+            return values
+        return dict(document_fields)
+
+    def start_after(self, document_fields) -> "Query":
+        return self._copy(_start=(self._cursor_values(document_fields), False))
+
+    def start_at(self, document_fields) -> "Query":
+        return self._copy(_start=(self._cursor_values(document_fields), True))
+
+    def end_before(self, document_fields) -> "Query":
+        return self._copy(_end=(self._cursor_values(document_fields), False))
+
+    def end_at(self, document_fields) -> "Query":
+        return self._copy(_end=(self._cursor_values(document_fields), True))
+
+    async def get_partitions(self, partition_count: int):
+        """Faixas de __name__ com quantidades parecidas de documentos (só collection group)."""
+        paths = sorted(path for path, _ in self._client._documents_in(self._path, self._all_descendants))
+        step = max(1, -(-len(paths) // max(1, partition_count)))
+        start = None
+        for end in paths[step::step]:
+            end = DocumentReference(self._client, end)
+            yield QueryPartition(self, start, end)
+            start = end
+        yield QueryPartition(self, start, None)
+
+    def _matches(self, record: _Record) -> bool:
+        for field, op, expected in self._filters:
+            value = _get_field(record.data, field)
+            if value is _MISSING or not _compare(op, value, expected):
+                return False
+        # Ordenar por um campo exclui os documentos que não o têm
+        return all(
+            field == "__name__" or _get_field(record.data, field) is not _MISSING
+            for field, _ in self._orders
+        )
+
+    def _order_key(self, path: str, record: _Record) -> list:
+        key = []
+        for field, direction in self._orders or [("__name__", "ASCENDING")]:
+            value = _sort_key(path if field == "__name__" else _get_field(record.data, field))
+            key.append(_Reversed(value) if direction == "DESCENDING" else value)
+        if not any(field == "__name__" for field, _ in self._orders):
+            key.append(_sort_key(path))
+        return key
+
+    def _cursor_key(self, values: dict) -> list:
+        cursor = dict(values)
+        name = cursor.get("__name__")
+        if isinstance(name, DocumentReference):
+            name = name.path
+        elif isinstance(name, str) and "/" not in name:
+            name = f"{self._path}/{name}"
+        cursor["__name__"] = name
+
+        key = []
+        for field, direction in self._orders or [("__name__", "ASCENDING")]:
+            value = _sort_key(cursor.get(field))
+            key.append(_Reversed(value) if direction == "DESCENDING" else value)
+        return key
+
+    def _run(self) -> list[tuple[str, _Record]]:
+        rows = [
+            (path, record)
+            for path, record in self._client._documents_in(self._path, self._all_descendants)
+            if self._matches(record)
+        ]
+        rows.sort(key=lambda row: self._order_key(*row))
+
+        if self._start is not None:
+            cursor, inclusive = self._cursor_key(self._start[0]), self._start[1]
+            rows = [row for row in rows if (key := self._order_key(*row)[:len(cursor)]) > cursor or (inclusive and key == cursor)]
+        if self._end is not None:
+            cursor, inclusive = self._cursor_key(self._end[0]), self._end[1]
+            rows = [row for row in rows if (key := self._order_key(*row)[:len(cursor)]) < cursor or (inclusive and key == cursor)]
+
+        rows = rows[self._offset:]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        return rows
+
+    async def stream(self, transaction=None):
+        await self._client._rpc("firestore_query")
+        for path, record in self._run():
+            reference = DocumentReference(self._client, path)
+            if transaction is not None:
+                transaction._read(reference)
+            yield DocumentSnapshot(reference, record, self._projection)
+
+    async def get(self, transaction=None) -> list[DocumentSnapshot]:
+        return [doc async for doc in self.stream(transaction=transaction)]
+
+
+class QueryPartition:
+    def __init__(self, query: Query, start_at: DocumentReference | None, end_at: DocumentReference | None):
+        self._query = query
+        self.start_at = start_at
+        self.end_at = end_at
+
+    def query(self) -> Query:
+        query = Query(self._query._client, self._query._path, self._query._all_descendants).order_by("__name__")
+        if self.start_at is not None:
+            query = query.start_at({"__name__": self.start_at})
+        if self.end_at is not None:
+            query = query.end_before({"__name__": self.end_at})
+        return query
+
+
+class _Reversed:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+    def __gt__(self, other):
+        return self.value < other.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+class CollectionReference(Query):
+    def __init__(self, client: "MemoryClient", path: str):
+        super().__init__(client, path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self) -> DocumentReference | None:
+        if "/" not in self._path:
+            return None
+        return DocumentReference(self._client, self._path.rsplit("/", 1)[0])
+
+    def document(self, document_id: str | None = None) -> DocumentReference:
+        document_id = document_id or "".join(random.choices(_AUTO_ID_CHARS, k=20))
+        return DocumentReference(self._client, f"{self._path}/{document_id}")
+
+    async def add(self, document_data: dict, document_id: str | None = None):
+        reference = self.document(document_id)
+        result = await reference.create(document_data)
+        return result.update_time, reference
+
+    def on_snapshot(self, callback) -> "Watch":
+        """Chama `callback(docs, changes, read_time)` com o estado inicial e a cada commit na coleção."""
+        watch = Watch(self._client, self._path, callback)
+        self._client._watches.add(watch)
+        docs = self._client._snapshots_in(self._path)
+        callback(docs, [DocumentChange(ChangeType.ADDED, doc) for doc in docs], datetime.now(timezone.utc))
+        return watch
+
+
+class ChangeType(Enum):
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+class DocumentChange:
+    def __init__(self, type: ChangeType, document: DocumentSnapshot):
+        self.type = type
+        self.document = document
+
+
+class Watch:
+    def __init__(self, client: "MemoryClient", path: str, callback):
+        self._client = client
+        self._path = path
+        self._callback = callback
+
+    def unsubscribe(self):
+        self._client._watches.discard(self)
+
+
+class WriteResult:
+    def __init__(self, update_time: datetime):
+        self.update_time = update_time
+
+
+class WriteBatch:
+    def __init__(self, client: "MemoryClient"):
+        self._client = client
+        self._writes: list[tuple[str, DocumentReference, dict | None, bool]] = []
+        # caminho -> update_time exigido (write_option)
+        self._preconditions: dict[str, datetime] = {}
+
+    def create(self, reference: DocumentReference, document_data: dict):
+        self._writes.append(("create", reference, document_data, False))
+
+    def set(self, reference: DocumentReference, document_data: dict, merge: bool = False):
+        self._writes.append(("set", reference, document_data, merge))
+
+    def update(self, reference: DocumentReference, field_updates: dict, option: LastUpdateOption | None = None):
+        self._writes.append(("update", reference, field_updates, False))
+        if option is not None:
+            self._preconditions[reference.path] = option.last_update_time
+
+    def delete(self, reference: DocumentReference):
+        self._writes.append(("delete", reference, None, False))
+
+    def __len__(self):
+        return len(self._writes)
+
+    async def commit(self) -> list[WriteResult]:
+        await self._client._rpc("firestore_write")
+        return self._client._apply(self._writes, self._preconditions)
+
+
+class Transaction(WriteBatch):
+    """Otimista: guarda o update_time do que foi lido e aborta se mudou até o commit."""
+
+    def __init__(self, client: "MemoryClient"):
+        super().__init__(client)
+        self._reads: dict[str, datetime | None] = {}
+
+    def _read(self, reference: DocumentReference):
+        record = self._client._records.get(reference.path)
+        self._reads.setdefault(reference.path, record.update_time if record else None)
+
+    def _begin(self):
+        self._writes = []
+        self._preconditions = {}
+        self._reads = {}
+
+    async def _commit(self) -> list[WriteResult] | None:
+        await self._client._rpc("firestore_write")
+        for path, update_time in self._reads.items():
+            record = self._client._records.get(path)
+            if (record.update_time if record else None) != update_time:
+                return None
+        return self._client._apply(self._writes, self._preconditions)
+
+
+def transactional(fn):
+    """Equivalente em memória do `async_transactional` (refaz a função se houver conflito)."""
+
+    @functools.wraps(fn)
+    async def wrapper(transaction: Transaction, *args, **kwargs):
+        for _ in range(TRANSACTION_MAX_ATTEMPTS):
+            transaction._begin()
+            result = await fn(transaction, *args, **kwargs)
+            if await transaction._commit() is not None:
+                return result
+
+        from google.api_core.exceptions import Aborted
+
+        raise Aborted("Transaction contention")
+
+    return wrapper
+
+
+class MemoryClient:
+    def __init__(self, latency_ms: float = MEMORY_LATENCY_MS, jitter_ms: float = MEMORY_LATENCY_JITTER_MS):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._records: dict[str, _Record] = {}
+        # caminho da coleção -> ids dos documentos
+        self._collections: dict[str, set[str]] = {}
+        self._last_write = datetime.now(timezone.utc)
+        self._watches: set[Watch] = set()
+
+    async def _rpc(self, kind: str):
+        delay = self.latency_ms + (random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        with metrics.timed(kind):
+            # Cede o event loop mesmo sem latência, como uma chamada de rede faria
+            await asyncio.sleep(delay / 1000)
+
+    def collection(self, collection_id: str) -> CollectionReference:
+        return CollectionReference(self, collection_id)
+
+    def collection_group(self, collection_id: str) -> Query:
+        return Query(self, collection_id, all_descendants=True)
+
+    def document(self, document_path: str) -> DocumentReference:
+        return DocumentReference(self, document_path)
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    def transaction(self, **kwargs) -> Transaction:
+        return Transaction(self)
+
+    @staticmethod
+    def write_option(last_update_time: datetime) -> LastUpdateOption:
+        return LastUpdateOption(last_update_time)
+
+    async def get_all(self, references, field_paths=None, transaction=None):
+        await self._rpc("firestore_read")
+        for reference in references:
+            if transaction is not None:
+                transaction._read(reference)
+            yield self._snapshot(reference, field_paths)
+
+    async def close(self):
+        pass
+
+    def _snapshot(self, reference: DocumentReference, field_paths=None) -> DocumentSnapshot:
+        return DocumentSnapshot(reference, self._records.get(reference.path), field_paths)
+
+    def _documents_in(self, path: str, all_descendants: bool):
+        if all_descendants:
+            collections = [c for c in self._collections if c.rsplit("/", 1)[-1] == path]
+        else:
+            collections = [path]
+        for collection in collections:
+            for document_id in self._collections.get(collection, ()):
+                full_path = f"{collection}/{document_id}"
+                yield full_path, self._records[full_path]
+
+    def _now(self) -> datetime:
+        # update_time estritamente crescente (os ETags dependem dele)
+        now = datetime.now(timezone.utc)
+        if now <= self._last_write:
+            now = self._last_write + timedelta(microseconds=1)
+        self._last_write = now
+        return now
+
+    def _apply(self, writes, preconditions: dict | None = None) -> list[WriteResult]:
+        from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+
+        # Valida tudo antes de aplicar (o batch é atômico), na ordem das escritas
+        for path, last_update_time in (preconditions or {}).items():
+            record = self._records.get(path)
+            if record is None or record.update_time != last_update_time:
+                raise FailedPrecondition(f"Document changed since {last_update_time.isoformat()}: {path}")
+
+        exists = {}
+        for op, reference, _, _ in writes:
+            present = exists.get(reference.path, reference.path in self._records)
+            if op == "create" and present:
+                raise AlreadyExists(f"Document already exists: {reference.path}")
+            if op == "update" and not present:
+                raise NotFound(f"No document to update: {reference.path}")
+            exists[reference.path] = op != "delete"
+
+        now = self._now()
+        results = []
+        # caminho -> existia antes do commit (para os listeners)
+        touched: dict[str, tuple[DocumentReference, bool]] = {}
+        for op, reference, data, merge in writes:
+            record = self._records.get(reference.path)
+            touched.setdefault(reference.path, (reference, record is not None))
+            if op == "delete":
+                if record is not None:
+                    del self._records[reference.path]
+                    self._collections[reference.parent._path].discard(reference.id)
+            elif op == "update":
+                for field, value in data.items():
+                    _set_field(record.data, field, value)
+                record.update_time = now
+            elif record is not None and merge:
+                _merge(record.data, data)
+                record.update_time = now
+            elif record is not None:
+                record.data = _resolve_increments(data)
+                record.update_time = now
+            else:
+                self._records[reference.path] = _Record(_resolve_increments(data), now)
+                self._collections.setdefault(reference.parent._path, set()).add(reference.id)
+            results.append(WriteResult(now))
+
+        if self._watches:
+            self._notify(touched.values(), now)
+        return results
+
+    def _snapshots_in(self, path: str) -> list[DocumentSnapshot]:
+        return [
+            DocumentSnapshot(DocumentReference(self, doc_path), record)
+            for doc_path, record in sorted(self._documents_in(path, False))
+        ]
+
+    def _notify(self, touched, read_time: datetime):
+        for watch in list(self._watches):
+            changes = []
+            for reference, existed in touched:
+                if reference.parent._path != watch._path:
+                    continue
+                record = self._records.get(reference.path)
+                if record is None and not existed:
+                    continue
+                kind = ChangeType.REMOVED if record is None else ChangeType.MODIFIED if existed else ChangeType.ADDED
+                changes.append(DocumentChange(kind, DocumentSnapshot(reference, record)))
+            if changes:
+                watch._callback(self._snapshots_in(watch._path), changes, read_time)
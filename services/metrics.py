@@ -0,0 +1,283 @@
+import time
+import bisect
+import functools
+import threading
+from contextvars import ContextVar
+
+# Limites (em segundos) dos buckets dos histogramas de latência
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Chamadas a dependências feitas durante a requisição atual
+_current: ContextVar["RequestStats | None"] = ContextVar("request_stats", default=None)
+
+_lock = threading.Lock()
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestStats:
+    """Contagem e duração das chamadas a dependências de uma requisição."""
+
+    __slots__ = ("calls",)
+
+    def __init__(self):
+        self.calls: dict[str, list] = {}
+
+    def add(self, kind: str, seconds: float):
+        entry = self.calls.get(kind)
+        if entry is None:
+            self.calls[kind] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def server_timing(self) -> str:
+        return ", ".join(
+            f'{kind};dur={seconds * 1000:.1f};desc="{count} calls"'
+            for kind, (count, seconds) in self.calls.items()
+        )
+
+
+# (method, route) -> Histogram
+_routes: dict[tuple[str, str], Histogram] = {}
+# (route, kind) -> [chamadas, segundos]
+_dependencies: dict[tuple[str, str], list] = {}
+
+
+def observe(kind: str, seconds: float):
+    """
+    Registra uma chamada a dependência (ex.: `firestore_read`, `http_securetoken`,
+    `smtp_send`). Dentro de uma requisição, também entra no Server-Timing dela.
+    """
+    stats = _current.get()
+    if stats is not None:
+        stats.add(kind, seconds)
+        return
+    # Fora de requisição (sender do outbox, timers em background)
+    _add_dependency("-", kind, 1, seconds)
+
+
+def _add_dependency(route: str, kind: str, count: int, seconds: float):
+    with _lock:
+        entry = _dependencies.get((route, kind))
+        if entry is None:
+            _dependencies[(route, kind)] = [count, seconds]
+        else:
+            entry[0] += count
+            entry[1] += seconds
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI: histograma de latência por rota e agregação das chamadas
+    a dependências por rota. Também devolve o header Server-Timing.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Streams (SSE) ficam abertos por minutos: fora do histograma de latência
+        if scope["type"] != "http" or is_stream_route(scope):
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and stats.calls:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", stats.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "<unmatched>"
+            with _lock:
+                histogram = _routes.get((scope["method"], path))
+                if histogram is None:
+                    histogram = _routes[(scope["method"], path)] = Histogram()
+                histogram.observe(elapsed)
+            for kind, (count, seconds) in stats.calls.items():
+                _add_dependency(path, kind, count, seconds)
+
+
+def timed(kind: str):
+    """Context manager que mede um trecho e registra como chamada a `kind`."""
+    return _Timer(kind)
+
+
+class _Timer:
+    __slots__ = ("kind", "started")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.kind, time.perf_counter() - self.started)
+        return False
+
+
+class _TimedStream:
+    """Envolve o async generator de uma query e soma o tempo gasto esperando resultados."""
+
+    def __init__(self, stream, kind: str):
+        self._stream = stream
+        self._kind = kind
+        self._seconds = 0.0
+        self._done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        started = time.perf_counter()
+        try:
+            return await self._stream.__anext__()
+        except StopAsyncIteration:
+            self._finish()
+            raise
+        finally:
+            self._seconds += time.perf_counter() - started
+
+    def _finish(self):
+        if not self._done:
+            self._done = True
+            observe(self._kind, self._seconds)
+
+    async def aclose(self):
+        self._finish()
+        await self._stream.aclose()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _wrap_coroutine(fn, kind: str):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            observe(kind, time.perf_counter() - started)
+
+    return wrapper
+
+
+def _wrap_stream(fn, kind: str):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return _TimedStream(fn(*args, **kwargs), kind)
+
+    return wrapper
+
+
+_instrumented = False
+
+
+def instrument_firestore():
+    """
+    Instrumenta as classes assíncronas do SDK do Firestore, contando leituras,
+    escritas e queries sem precisar mexer em cada ponto de chamada.
+    """
+    global _instrumented
+    if _instrumented:
+        return
+
+    from google.cloud.firestore_v1.async_batch import AsyncWriteBatch
+    from google.cloud.firestore_v1.async_client import AsyncClient
+    from google.cloud.firestore_v1.async_document import AsyncDocumentReference
+    from google.cloud.firestore_v1.async_query import AsyncQuery
+    from google.cloud.firestore_v1.async_transaction import AsyncTransaction
+
+    # set/update/delete/create passam por AsyncWriteBatch.commit
+    AsyncDocumentReference.get = _wrap_coroutine(AsyncDocumentReference.get, "firestore_read")
+    AsyncWriteBatch.commit = _wrap_coroutine(AsyncWriteBatch.commit, "firestore_write")
+    AsyncTransaction._commit = _wrap_coroutine(AsyncTransaction._commit, "firestore_write")
+    AsyncQuery.stream = _wrap_stream(AsyncQuery.stream, "firestore_query")
+    AsyncClient.get_all = _wrap_stream(AsyncClient.get_all, "firestore_read")
+    _instrumented = True
+
+
+# Rotas de stream (SSE), que ficam abertas por minutos. Decidido pela rota e
+# não pelo Accept: qualquer cliente pode mandar o header numa rota comum
+STREAM_PATHS = frozenset({"/subscription/stream"})
+
+
+def is_stream_route(scope) -> bool:
+    return scope["path"] in STREAM_PATHS
+
+
+# Gauges lidos na hora de renderizar: nome -> (descrição, função)
+_gauges: dict[str, tuple[str, object]] = {}
+
+
+def register_gauge(name: str, description: str, read):
+    _gauges[name] = (description, read)
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{k}="{v}"' for k, v in labels.items())
+
+
+def render_prometheus() -> str:
+    """Exposição no formato texto do Prometheus."""
+    lines = [
+        "# HELP sinu_http_request_duration_seconds Request latency by route.",
+        "# TYPE sinu_http_request_duration_seconds histogram",
+    ]
+    with _lock:
+        routes = {key: (list(h.counts), h.sum, h.count) for key, h in _routes.items()}
+        dependencies = {key: tuple(value) for key, value in _dependencies.items()}
+
+    for (method, route), (counts, total, count) in sorted(routes.items()):
+        cumulative = 0
+        for bound, bucket in zip(LATENCY_BUCKETS + (float("inf"),), counts):
+            cumulative += bucket
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"sinu_http_request_duration_seconds_bucket{{{_labels(method=method, route=route, le=le)}}} {cumulative}")
+        lines.append(f"sinu_http_request_duration_seconds_sum{{{_labels(method=method, route=route)}}} {total:.6f}")
+        lines.append(f"sinu_http_request_duration_seconds_count{{{_labels(method=method, route=route)}}} {count}")
+
+    lines += [
+        "# HELP sinu_dependency_calls_total Calls to Firestore, Google auth endpoints and SMTP by route.",
+        "# TYPE sinu_dependency_calls_total counter",
+    ]
+    for (route, kind), (count, _) in sorted(dependencies.items()):
+        lines.append(f"sinu_dependency_calls_total{{{_labels(route=route, kind=kind)}}} {count}")
+
+    lines += [
+        "# HELP sinu_dependency_duration_seconds_total Time spent waiting on each dependency by route.",
+        "# TYPE sinu_dependency_duration_seconds_total counter",
+    ]
+    for (route, kind), (_, seconds) in sorted(dependencies.items()):
+        lines.append(f"sinu_dependency_duration_seconds_total{{{_labels(route=route, kind=kind)}}} {seconds:.6f}")
+
+    for name, (description, read) in sorted(_gauges.items()):
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge", f"{name} {read()}"]
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,156 @@
+"""
+Migração das datas gravadas como string ISO para Timestamp nativo:
+
+    subscriptions (collection group): nextPayment, createdDate
+    accounts: lastLoginAt, createdAt
+
+Lê em páginas ordenadas por __name__ (streams curtos, em vez de um stream
+aberto por horas), regrava em batches de até 500 escritas com no máximo
+MIGRATION_CONCURRENCY commits em paralelo e só depois grava o checkpoint em
+jobs/migrate-timestamps. Se cair no meio, a próxima execução continua de onde
+parou; documentos já migrados são só lidos. Strings que não são datas válidas
+ficam como estão e entram no contador `invalid`.
+
+Cada update leva como precondição o update_time lido (write_option): um
+documento alterado pelo usuário entre a leitura da página e o commit não é
+sobrescrito com o valor antigo. Como a precondição falha o batch inteiro, o
+lote é regravado documento a documento e os que mudaram entram no contador
+`skipped`; eles continuam com string e são migrados numa nova execução com
+--restart (os já migrados são só lidos).
+
+    python -m services.migrate_timestamps [--restart]
+"""
+import os
+import asyncio
+import argparse
+from datetime import datetime, timezone
+
+from google.api_core.exceptions import FailedPrecondition
+
+from firebase import get_fs
+from services.timestamps import to_instant
+
+MIGRATION_PAGE_SIZE = int(os.getenv("MIGRATION_PAGE_SIZE", "2000"))
+MIGRATION_BATCH_SIZE = 500
+MIGRATION_CONCURRENCY = int(os.getenv("MIGRATION_CONCURRENCY", "4"))
+
+# Origem -> campos de data
+SOURCES = {
+    "subscriptions": ("nextPayment", "createdDate"),
+    "accounts": ("lastLoginAt", "createdAt"),
+}
+
+
+def _source_query(source: str):
+    if source == "subscriptions":
+        return get_fs().collection_group("subscriptions")
+    return get_fs().collection(source)
+
+
+def converted_fields(data: dict, fields) -> tuple[dict, int]:
+    """Campos a regravar como Timestamp e quantas strings não eram datas."""
+    update, invalid = {}, 0
+    for field in fields:
+        value = data.get(field)
+        if not isinstance(value, str):
+            continue
+        instant = to_instant(value)
+        if instant is None:
+            invalid += 1
+        else:
+            update[field] = instant
+    return update, invalid
+
+
+def _unchanged(doc):
+    return get_fs().write_option(last_update_time=doc.update_time)
+
+
+async def _commit_chunk(chunk: list) -> int:
+    """Grava um lote de (doc, update) sem sobrescrever quem mudou; devolve quantos foram pulados."""
+    batch = get_fs().batch()
+    for doc, update in chunk:
+        batch.update(doc.reference, update, option=_unchanged(doc))
+    try:
+        await batch.commit()
+        return 0
+    except FailedPrecondition:
+        pass
+
+    # Algum documento mudou desde a leitura: regrava um a um e pula os alterados
+    skipped = 0
+    for doc, update in chunk:
+        try:
+            await doc.reference.update(update, option=_unchanged(doc))
+        except FailedPrecondition:
+            skipped += 1
+    return skipped
+
+
+async def _commit_all(chunks: list) -> int:
+    semaphore = asyncio.Semaphore(MIGRATION_CONCURRENCY)
+
+    async def commit(chunk):
+        async with semaphore:
+            return await _commit_chunk(chunk)
+
+    return sum(await asyncio.gather(*(commit(chunk) for chunk in chunks)))
+
+
+async def migrate_source(source: str, state: dict, job_ref, max_pages: int | None = None) -> dict:
+    """Migra uma origem a partir do checkpoint em `state` (atualizado e devolvido)."""
+    fields = SOURCES[source]
+    state = {"cursor": None, "scanned": 0, "migrated": 0, "invalid": 0, "skipped": 0, "done": False, **state}
+    query = _source_query(source).select(list(fields)).order_by("__name__").limit(MIGRATION_PAGE_SIZE)
+
+    pages = 0
+    while not state["done"] and (max_pages is None or pages < max_pages):
+        page = query
+        if state["cursor"]:
+            page = page.start_after({"__name__": get_fs().document(state["cursor"])})
+        docs = [doc async for doc in page.stream()]
+
+        updates = []
+        for doc in docs:
+            update, invalid = converted_fields(doc.to_dict(), fields)
+            state["invalid"] += invalid
+            if update:
+                updates.append((doc, update))
+
+        chunks = [updates[i:i + MIGRATION_BATCH_SIZE] for i in range(0, len(updates), MIGRATION_BATCH_SIZE)]
+        skipped = await _commit_all(chunks)
+        state["migrated"] += len(updates) - skipped
+        state["skipped"] += skipped
+
+        # Checkpoint só depois que as escritas da página foram confirmadas
+        pages += 1
+        state["scanned"] += len(docs)
+        state["done"] = len(docs) < MIGRATION_PAGE_SIZE
+        if docs:
+            state["cursor"] = docs[-1].reference.path
+        await job_ref.set({source: state, "updatedAt": datetime.now(timezone.utc)}, merge=True)
+
+    return state
+
+
+async def migrate_timestamps(restart: bool = False, max_pages: int | None = None) -> dict:
+    """Roda (ou retoma) a migração de todas as origens; devolve o estado de cada uma."""
+    job_ref = get_fs().collection("jobs").document("migrate-timestamps")
+    job = await job_ref.get()
+    saved = {} if restart or not job.exists else job.to_dict()
+
+    report = {}
+    for source in SOURCES:
+        report[source] = await migrate_source(source, saved.get(source) or {}, job_ref, max_pages)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra datas ISO para Timestamp nativo")
+    parser.add_argument("--restart", action="store_true", help="ignora o checkpoint salvo")
+    args = parser.parse_args()
+    for source, state in asyncio.run(migrate_timestamps(args.restart)).items():
+        print(
+            f"{source}: {state['scanned']} scanned, {state['migrated']} migrated, "
+            f"{state['invalid']} invalid, {state.get('skipped', 0)} skipped"
+        )
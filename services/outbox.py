@@ -0,0 +1,212 @@
+import os
+import time
+import random
+import sqlite3
+import smtplib
+import threading
+
+from services import metrics, resilience
+from services.services import build_support_message, open_smtp_connection, send_support_message
+
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "outbox.db")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+# Quanto tempo um lote reservado fica com um processo; depois disso (processo
+# morreu no meio do envio) outro sender pode pegar as linhas de novo
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "600"))
+OUTBOX_BACKOFF_BASE = 2.0       # segundos
+OUTBOX_BACKOFF_MAX = 600.0
+SMTP_IDLE_TIMEOUT = 60.0        # fecha a conexão se ficar parada por mais que isso
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    message TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    last_error TEXT,
+    lease_until REAL
+)
+"""
+
+
+class Outbox:
+    """
+    Fila persistente (SQLite local) das mensagens de suporte. Um sender em
+    background mantém uma conexão SMTP autenticada, envia em lotes e reagenda
+    as falhas com backoff exponencial. Mensagens pendentes sobrevivem a restart.
+
+    Vários workers (uvicorn/gunicorn) podem usar o mesmo arquivo: cada lote é
+    reservado (status 'sending' + lease) num UPDATE atômico antes do envio,
+    então uma mensagem só é enviada por um processo.
+    """
+
+    def __init__(self, path: str = OUTBOX_PATH):
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute(_SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(outbox)")}
+        if "lease_until" not in columns:
+            # Arquivo criado antes da reserva por lease (outro worker pode ter migrado junto)
+            try:
+                self._db.execute("ALTER TABLE outbox ADD COLUMN lease_until REAL")
+            except sqlite3.OperationalError:
+                pass
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._server: smtplib.SMTP | None = None
+        self._last_used = 0.0
+        self.sent = 0
+        self.failed = 0
+        self.connections = 0
+
+    def enqueue(self, name: str, email: str, subject: str, message: str) -> int:
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO outbox (name, email, subject, message, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (name, email, subject, message, now, now),
+            )
+            self._db.commit()
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-sender", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._disconnect()
+
+    def _claim(self) -> list[tuple]:
+        """Reserva o próximo lote (pendentes vencidos e reservas abandonadas) para este processo."""
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute(
+                "UPDATE outbox SET status = 'sending', lease_until = ? WHERE id IN ("
+                "  SELECT id FROM outbox"
+                "  WHERE (status = 'pending' AND next_attempt_at <= ?) OR (status = 'sending' AND lease_until <= ?)"
+                "  ORDER BY next_attempt_at LIMIT ?"
+                ") RETURNING id, name, email, subject, message, attempts",
+                (now + OUTBOX_LEASE_SECONDS, now, now, OUTBOX_BATCH_SIZE),
+            ).fetchall()
+            self._db.commit()
+        return rows
+
+    def _next_wakeup(self) -> float:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'"
+            ).fetchone()
+        if row[0] is None:
+            return OUTBOX_POLL_INTERVAL
+        return min(OUTBOX_POLL_INTERVAL, max(0.0, row[0] - time.time()))
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._claim()
+            if batch:
+                self._send_batch(batch)
+                continue
+
+            if self._server and time.monotonic() - self._last_used > SMTP_IDLE_TIMEOUT:
+                self._disconnect()
+
+            self._wakeup.wait(self._next_wakeup())
+            self._wakeup.clear()
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._server is not None:
+            try:
+                # Garante que a conexão reaproveitada ainda está viva
+                if self._server.noop()[0] == 250:
+                    return self._server
+            except smtplib.SMTPException:
+                pass
+            self._disconnect()
+
+        self._server = open_smtp_connection()
+        self.connections += 1
+        return self._server
+
+    def _disconnect(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+    def _send_batch(self, batch: list[tuple]):
+        for index, (row_id, name, email, subject, message, attempts) in enumerate(batch):
+            if self._stopping.is_set():
+                # Devolve o resto do lote para a fila
+                self._defer([row[0] for row in batch[index:]], 0)
+                return
+            try:
+                with resilience.guarded("smtp"), metrics.timed("smtp_send"):
+                    send_support_message(self._connection(), build_support_message(name, email, subject, message))
+            except resilience.DependencyUnavailable as e:
+                # SMTP fora do ar: não gasta tentativa, o lote volta quando o circuito reabrir
+                self._defer([row[0] for row in batch[index:]], e.retry_after)
+                return
+            except Exception as e:
+                self._disconnect()
+                self._reschedule(row_id, attempts + 1, e)
+                continue
+
+            self._last_used = time.monotonic()
+            self.sent += 1
+            with self._lock:
+                self._db.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                self._db.commit()
+
+    def _defer(self, row_ids: list[int], delay: float):
+        with self._lock:
+            self._db.executemany(
+                "UPDATE outbox SET status = 'pending', next_attempt_at = ? WHERE id = ?",
+                [(time.time() + delay, row_id) for row_id in row_ids],
+            )
+            self._db.commit()
+
+    def _reschedule(self, row_id: int, attempts: int, error: Exception):
+        self.failed += 1
+        print(f"Error sending email (attempt {attempts}): {error}")
+
+        # Backoff exponencial com jitter; desiste após OUTBOX_MAX_ATTEMPTS
+        status = "dead" if attempts >= OUTBOX_MAX_ATTEMPTS else "pending"
+        delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** attempts) * random.uniform(0.5, 1.0)
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (status, attempts, time.time() + delay, str(error), row_id),
+            )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        return {
+            "pending": counts.get("pending", 0),
+            "sending": counts.get("sending", 0),
+            "dead": counts.get("dead", 0),
+            "sent": self.sent,
+            "failed": self.failed,
+            "connections": self.connections,
+            "connected": self._server is not None,
+        }
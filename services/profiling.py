@@ -0,0 +1,210 @@
+import os
+import hmac
+import time
+import uuid
+import functools
+import threading
+from collections import deque
+from contextvars import ContextVar
+
+from services.metrics import is_stream_route
+
+PROFILE_HEADER = "x-profile"
+# 1 a cada N requisições de cada rota é perfilada (0 = desligado)
+PROFILE_SAMPLE_EVERY = int(os.getenv("PROFILE_SAMPLE_EVERY", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+PROFILE_RING_SIZE = int(os.getenv("PROFILE_RING_SIZE", "20"))
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "2"))
+
+# Perfil em andamento na requisição atual (os handlers síncronos leem daqui)
+_active: ContextVar["ProfileRun | None"] = ContextVar("profile_run", default=None)
+
+
+class ProfileRun:
+    __slots__ = ("id", "method", "path", "route", "reason", "started_at", "thread_sessions")
+
+    def __init__(self, method: str, path: str, route: str, reason: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.route = route
+        self.reason = reason
+        self.started_at = time.time()
+        self.thread_sessions = []
+
+
+class ProfileStore:
+    """Anel limitado com os perfis mais recentes (formato speedscope)."""
+
+    def __init__(self, size: int = PROFILE_RING_SIZE):
+        self._profiles: deque[dict] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, run: ProfileRun, duration: float, speedscope: str):
+        with self._lock:
+            self._profiles.append({
+                "id": run.id,
+                "method": run.method,
+                "path": run.path,
+                "route": run.route,
+                "reason": run.reason,
+                "createdAt": run.started_at,
+                "durationMs": round(duration * 1000, 1),
+                "size": len(speedscope),
+                "speedscope": speedscope,
+            })
+
+    def list(self) -> list[dict]:
+        with self._lock:
+            return [{k: v for k, v in p.items() if k != "speedscope"} for p in reversed(self._profiles)]
+
+    def get(self, profile_id: str) -> str | None:
+        with self._lock:
+            for p in self._profiles:
+                if p["id"] == profile_id:
+                    return p["speedscope"]
+        return None
+
+
+def _profiler_available() -> bool:
+    try:
+        import pyinstrument  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ProfilingMiddleware:
+    """
+    Perfila sob demanda com o pyinstrument (amostragem estatística): quando a
+    requisição traz `X-Profile: <JOB_TOKEN>` ou quando cai na amostra 1-em-N
+    da rota. O id do perfil volta no header X-Profile-Id.
+    """
+
+    def __init__(self, app, store: ProfileStore, token: str | None, sample_every: int = PROFILE_SAMPLE_EVERY):
+        self.app = app
+        self.store = store
+        self.token = token.encode() if token else None
+        self.sample_every = sample_every
+        self.enabled = _profiler_available()
+        self._counters: dict[str, int] = {}
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def _route_path(self, scope) -> str:
+        from starlette.routing import Match
+
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", scope["path"])
+        return "<unmatched>"
+
+    def _reason(self, scope) -> str | None:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER.encode():
+                    return "header" if hmac.compare_digest(value, self.token) else None
+
+        # Streams (SSE) não entram na amostragem: o perfil duraria a conexão inteira
+        if self.sample_every > 0 and not is_stream_route(scope):
+            route = self._route_path(scope)
+            with self._lock:
+                count = self._counters.get(route, 0) + 1
+                self._counters[route] = count
+            if count % self.sample_every == 0:
+                return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            return await self.app(scope, receive, send)
+
+        reason = self._reason(scope)
+        if reason is None:
+            return await self.app(scope, receive, send)
+
+        with self._lock:
+            # Limita o overhead: amostras extras são ignoradas se já houver perfis rodando
+            if self._running >= PROFILE_MAX_CONCURRENT and reason == "sample":
+                reason = None
+            else:
+                self._running += 1
+        if reason is None:
+            return await self.app(scope, receive, send)
+
+        try:
+            await self._profile(scope, receive, send, reason)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    async def _profile(self, scope, receive, send, reason: str):
+        from pyinstrument import Profiler
+
+        run = ProfileRun(scope["method"], scope["path"], self._route_path(scope), reason)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", run.id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+        token = _active.set(run)
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            _active.reset(token)
+            self._save(run, profiler.last_session, time.perf_counter() - started)
+
+    def _save(self, run: ProfileRun, session, duration: float):
+        from pyinstrument.renderers import SpeedscopeRenderer
+        from pyinstrument.session import Session
+
+        # Junta o que rodou no event loop com o que rodou no threadpool
+        for thread_session in run.thread_sessions:
+            session = Session.combine(session, thread_session)
+        try:
+            self.store.add(run, duration, SpeedscopeRenderer().render(session))
+        except Exception as e:
+            print(f"Error rendering profile {run.id}: {e!r}")
+
+
+def _profiled_sync(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        run = _active.get()
+        if run is None:
+            return fn(*args, **kwargs)
+
+        from pyinstrument import Profiler
+
+        # O profiler do middleware só enxerga a thread do event loop
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="disabled")
+        profiler.start()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.stop()
+            run.thread_sessions.append(profiler.last_session)
+
+    return wrapper
+
+
+def instrument_sync_endpoints(app):
+    """Envolve os handlers síncronos (que rodam no threadpool) para também serem perfilados."""
+    from fastapi.routing import APIRoute
+    import inspect
+
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or getattr(route.dependant.call, "_profiled", False):
+            continue
+        if inspect.iscoroutinefunction(route.dependant.call):
+            continue
+        route.dependant.call = _profiled_sync(route.dependant.call)
+        route.dependant.call._profiled = True
@@ -0,0 +1,273 @@
+"""
+Deadlines, retries e circuit breakers das dependências externas
+(identitytoolkit, securetoken, Firestore e SMTP).
+
+Cada dependência tem um prazo por tentativa e um circuit breaker: quando a
+taxa de erro na janela (BREAKER_WINDOW_SECONDS, com pelo menos
+BREAKER_MIN_CALLS chamadas) passa de BREAKER_FAILURE_RATE o circuito abre e
+as chamadas falham na hora com DependencyUnavailable (503 na API) em vez de
+prender a requisição. Depois de BREAKER_OPEN_SECONDS uma chamada de teste
+passa (half-open): sucesso fecha o circuito, falha abre de novo.
+
+Só contam como falha timeouts, erros de rede e 5xx; um 400 do Google ou um
+NotFound do Firestore mostram que a dependência está respondendo.
+
+Retries com backoff exponencial e jitter só para chamadas idempotentes. As
+leituras do Firestore já são repetidas pelo próprio SDK e os e-mails pelo
+outbox; aqui eles ganham só o prazo e o breaker.
+"""
+import os
+import time
+import random
+import asyncio
+import smtplib
+import functools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import httpx
+from google.api_core import exceptions as google_exceptions
+
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "30"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+
+
+@dataclass
+class Policy:
+    deadline: float         # segundos por tentativa
+    retries: int = 0        # tentativas extras (só chamadas idempotentes)
+    backoff_base: float = 0.2
+    backoff_max: float = 2.0
+
+
+POLICIES = {
+    "identitytoolkit": Policy(float(os.getenv("IDENTITY_TOOLKIT_DEADLINE", "8")), retries=2),
+    "securetoken": Policy(float(os.getenv("SECURE_TOKEN_DEADLINE", "8")), retries=2),
+    "firestore": Policy(float(os.getenv("FIRESTORE_DEADLINE", "10"))),
+    # Prazo do SMTP é o timeout do socket (SMTP_TIMEOUT em services/services.py)
+    "smtp": Policy(float(os.getenv("SMTP_TIMEOUT", "20"))),
+}
+
+_TRANSIENT = (
+    asyncio.TimeoutError,
+    TimeoutError,
+    httpx.TransportError,
+    ConnectionError,
+    smtplib.SMTPServerDisconnected,
+    smtplib.SMTPConnectError,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.Unknown,
+)
+
+
+class DependencyUnavailable(Exception):
+    def __init__(self, dependency: str, retry_after: float):
+        super().__init__(f"{dependency} unavailable")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._outcomes: deque[tuple[float, bool]] = deque()
+        self._opened_at: float | None = None
+        self._probe_at: float | None = None
+        self.rejected = 0
+        self.trips = 0
+
+    def _prune(self, now: float):
+        while self._outcomes and self._outcomes[0][0] < now - BREAKER_WINDOW_SECONDS:
+            self._outcomes.popleft()
+
+    def _state(self, now: float) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "open" if now - self._opened_at < BREAKER_OPEN_SECONDS else "half_open"
+
+    def before_call(self):
+        """Levanta DependencyUnavailable se o circuito não deixa a chamada passar."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(now)
+            if state == "closed":
+                return
+            # Half-open: uma chamada de teste por vez (uma presa/cancelada libera após o prazo)
+            if state == "half_open" and (self._probe_at is None or now - self._probe_at > BREAKER_OPEN_SECONDS):
+                self._probe_at = now
+                return
+            self.rejected += 1
+            retry_after = max(1.0, BREAKER_OPEN_SECONDS - (now - self._opened_at))
+        raise DependencyUnavailable(self.name, retry_after)
+
+    def record(self, ok: bool):
+        now = time.monotonic()
+        with self._lock:
+            if self._opened_at is not None:
+                # Aberto: só o resultado da chamada de teste decide
+                if self._probe_at is not None:
+                    self._probe_at = None
+                    if ok:
+                        self._opened_at = None
+                        self._outcomes.clear()
+                    else:
+                        self._opened_at = now
+                return
+
+            self._outcomes.append((now, ok))
+            self._prune(now)
+            failures = sum(1 for _, outcome in self._outcomes if not outcome)
+            if len(self._outcomes) >= BREAKER_MIN_CALLS and failures / len(self._outcomes) >= BREAKER_FAILURE_RATE:
+                self._opened_at = now
+                self.trips += 1
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            calls = len(self._outcomes)
+            failures = sum(1 for _, outcome in self._outcomes if not outcome)
+            return {
+                "state": self._state(now),
+                "calls": calls,
+                "failureRate": round(failures / calls, 3) if calls else 0.0,
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
+
+
+_breakers = {name: CircuitBreaker(name) for name in POLICIES}
+
+
+def is_transient(error: BaseException) -> bool:
+    return isinstance(error, _TRANSIENT)
+
+
+def backoff(policy: Policy, attempt: int) -> float:
+    # Full jitter: espalha os retries de várias requisições no tempo
+    return random.uniform(0, min(policy.backoff_max, policy.backoff_base * 2 ** attempt))
+
+
+async def call(name: str, fn, idempotent: bool = False, failed=None):
+    """
+    Executa `fn()` (fábrica de corrotina) com o prazo e o breaker de `name`.
+    `failed(result)` marca uma resposta como falha da dependência (ex.: 5xx);
+    na última tentativa ela é devolvida mesmo assim.
+    """
+    policy, breaker = POLICIES[name], _breakers[name]
+    attempts = 1 + (policy.retries if idempotent else 0)
+    for attempt in range(attempts):
+        breaker.before_call()
+        try:
+            result = await asyncio.wait_for(fn(), policy.deadline)
+        except Exception as e:
+            breaker.record(not is_transient(e))
+            if not is_transient(e) or attempt + 1 == attempts:
+                raise
+        else:
+            ok = failed is None or not failed(result)
+            breaker.record(ok)
+            if ok or attempt + 1 == attempts:
+                return result
+        await asyncio.sleep(backoff(policy, attempt))
+
+
+@contextmanager
+def guarded(name: str):
+    """Breaker para código síncrono (SMTP na thread do outbox)."""
+    breaker = _breakers[name]
+    breaker.before_call()
+    try:
+        yield
+    except Exception as e:
+        breaker.record(not is_transient(e))
+        raise
+    breaker.record(True)
+
+
+class _GuardedStream:
+    """Stream do Firestore com breaker na abertura e prazo por página/documento."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._started = False
+        self._done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        breaker = _breakers["firestore"]
+        if not self._started:
+            breaker.before_call()
+            self._started = True
+        try:
+            return await asyncio.wait_for(self._stream.__anext__(), POLICIES["firestore"].deadline)
+        except StopAsyncIteration:
+            self._finish(True)
+            raise
+        except Exception as e:
+            self._finish(not is_transient(e))
+            raise
+
+    def _finish(self, ok: bool):
+        if not self._done:
+            self._done = True
+            _breakers["firestore"].record(ok)
+
+    async def aclose(self):
+        await self._stream.aclose()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _guard_coroutine(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await call("firestore", lambda: fn(*args, **kwargs))
+
+    return wrapper
+
+
+def _guard_stream(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return _GuardedStream(fn(*args, **kwargs))
+
+    return wrapper
+
+
+_protected = False
+
+
+def protect_firestore():
+    """Prazo + breaker nas mesmas chamadas do SDK que o metrics instrumenta."""
+    global _protected
+    if _protected:
+        return
+
+    from google.cloud.firestore_v1.async_batch import AsyncWriteBatch
+    from google.cloud.firestore_v1.async_client import AsyncClient
+    from google.cloud.firestore_v1.async_document import AsyncDocumentReference
+    from google.cloud.firestore_v1.async_query import AsyncQuery
+    from google.cloud.firestore_v1.async_transaction import AsyncTransaction
+
+    AsyncDocumentReference.get = _guard_coroutine(AsyncDocumentReference.get)
+    AsyncWriteBatch.commit = _guard_coroutine(AsyncWriteBatch.commit)
+    AsyncTransaction._commit = _guard_coroutine(AsyncTransaction._commit)
+    AsyncQuery.stream = _guard_stream(AsyncQuery.stream)
+    AsyncClient.get_all = _guard_stream(AsyncClient.get_all)
+    _protected = True
+
+
+def states() -> dict:
+    return {name: breaker.stats() for name, breaker in _breakers.items()}
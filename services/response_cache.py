@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+@dataclass
+class CacheEntry:
+    value: object
+    etag: str
+    expires_at: float
+    size: int
+
+
+class EtagBuilder:
+    """Mesmo ETag do `etag_for`, acumulado documento a documento (para streams)."""
+
+    def __init__(self, context: str = ""):
+        # `context`: o que além dos documentos muda o corpo (parâmetros, data de referência)
+        self._digest = hashlib.sha1()
+        if context:
+            self._digest.update(f"{context}|".encode())
+
+    def add(self, snap):
+        self._digest.update(f"{snap.id}:{snap.update_time.isoformat() if snap.update_time else ''};".encode())
+
+    def etag(self) -> str:
+        return f'"{self._digest.hexdigest()}"'
+
+
+def etag_for(*snapshots) -> str:
+    """
+    ETag derivado do `update_time` (e do ID) dos documentos que compõem a
+    resposta. Muda sempre que algum documento é criado, alterado ou removido.
+    """
+    builder = EtagBuilder()
+    for snap in snapshots:
+        builder.add(snap)
+    return builder.etag()
+
+
+class ResponseCache:
+    """
+    Cache em memória (por processo) das respostas de leitura, indexado por
+    uid e recurso. Limitado por TTL, número de entradas e bytes (LRU).
+    """
+
+    def __init__(
+        self,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[str, str], CacheEntry] = OrderedDict()
+        self._by_uid: dict[str, set[str]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, uid: str, resource: str) -> CacheEntry | None:
+        key = (uid, resource)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def set(self, uid: str, resource: str, value, etag: str) -> CacheEntry:
+        key = (uid, resource)
+        size = len(json.dumps(value, default=str))
+        entry = CacheEntry(value, etag, time.monotonic() + self.ttl, size)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._by_uid.setdefault(uid, set()).add(resource)
+            self._bytes += size
+
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+
+        return entry
+
+    def invalidate(self, uid: str):
+        """Descarta todas as respostas em cache de um usuário."""
+        with self._lock:
+            for resource in list(self._by_uid.get(uid, ())):
+                self._remove((uid, resource))
+            self.invalidations += 1
+
+    def _remove(self, key: tuple[str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        resources = self._by_uid.get(key[0])
+        if resources is not None:
+            resources.discard(key[1])
+            if not resources:
+                del self._by_uid[key[0]]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "users": len(self._by_uid),
+            "bytes": self._bytes,
+            "maxEntries": self.max_entries,
+            "maxBytes": self.max_bytes,
+        }
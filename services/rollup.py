@@ -0,0 +1,223 @@
+"""
+Resumo materializado em `accounts/{uid}.rollup`, mantido a cada escrita:
+
+    rollup.subscriptions                 total de assinaturas
+    rollup.statusCounts.{status}         contagem por status (active, expiring...)
+    rollup.spend.{moeda}                 gasto mensal equivalente (ignora inativas)
+    rollup.cards.{final}.{moeda}         idem, por cartão
+    rollup.nextPayment                   {id, at} do vencimento mais próximo
+
+Os números são mantidos com incrementos (sem ler o documento da conta); o
+vencimento mais próximo é recalculado com uma query ordenada que para no
+primeiro resultado. `check_rollups` reconstrói tudo a partir das assinaturas.
+"""
+import os
+import asyncio
+from datetime import datetime, timezone
+
+from firebase import get_fs, increment, transactional
+from services.summary import PERIODS_PER_YEAR
+from services.timestamps import to_instant
+
+STATUS_NAMES = {0: "inactive", 1: "active", 2: "expiring", 3: "expired"}
+ROLLUP_FIELDS = ["status", "price", "currency", "billingFrequency", "cardFinalNumbers", "nextPayment"]
+ROLLUP_CHECK_CONCURRENCY = int(os.getenv("ROLLUP_CHECK_CONCURRENCY", "8"))
+TOLERANCE = 0.005
+
+# Sentinela: não mexe no rollup.nextPayment
+UNCHANGED = object()
+
+
+def _account_ref(uid: str):
+    return get_fs().collection("accounts").document(uid)
+
+
+def _contribution(data: dict | None) -> dict:
+    if not data:
+        return {}
+
+    status = data.get("status")
+    contribution = {"subscriptions": 1, "statusCounts": {STATUS_NAMES.get(status, "unknown"): 1}}
+
+    price = data.get("price")
+    if status != 0 and isinstance(price, (int, float)):
+        currency = data.get("currency") or "unknown"
+        monthly = price * PERIODS_PER_YEAR.get(data.get("billingFrequency"), 12) / 12
+        contribution["spend"] = {currency: monthly}
+        if data.get("cardFinalNumbers"):
+            contribution["cards"] = {data["cardFinalNumbers"]: {currency: monthly}}
+    return contribution
+
+
+def add_deltas(total: dict, deltas: dict, sign: int = 1) -> dict:
+    """Soma (in-place) `deltas` aninhados em `total`."""
+    for key, value in deltas.items():
+        if isinstance(value, dict):
+            add_deltas(total.setdefault(key, {}), value, sign)
+        else:
+            total[key] = total.get(key, 0) + sign * value
+    return total
+
+
+def _prune(deltas: dict) -> dict:
+    pruned = {}
+    for key, value in deltas.items():
+        if isinstance(value, dict):
+            value = _prune(value)
+            if value:
+                pruned[key] = value
+        elif abs(value) > 1e-9:
+            pruned[key] = value
+    return pruned
+
+
+def rollup_deltas(old: dict | None, new: dict | None) -> dict:
+    """Diferença que a troca de `old` por `new` (None = inexistente) causa no rollup."""
+    deltas = add_deltas({}, _contribution(new))
+    add_deltas(deltas, _contribution(old), sign=-1)
+    return _prune(deltas)
+
+
+def _as_increments(deltas: dict) -> dict:
+    return {
+        key: _as_increments(value) if isinstance(value, dict) else increment(value)
+        for key, value in deltas.items()
+    }
+
+
+def apply_rollup(writer, uid: str, deltas: dict, earliest=UNCHANGED):
+    """Registra no batch/transação os incrementos do rollup (e o vencimento mais próximo)."""
+    rollup = _as_increments(deltas)
+    if earliest is not UNCHANGED:
+        rollup["nextPayment"] = earliest
+    if rollup:
+        # set+merge com mapas aninhados: chaves (moeda, final do cartão) são literais
+        writer.set(_account_ref(uid), {"rollup": rollup}, merge=True)
+
+
+def _is_candidate(data: dict | None) -> bool:
+    return bool(data) and data.get("status") != 0 and to_instant(data.get("nextPayment")) is not None
+
+
+async def earliest_next_payment(uid: str, transaction=None, changed_id: str | None = None, changed: dict | None = None):
+    """
+    Vencimento mais próximo entre as assinaturas não inativas, considerando
+    `changed` (estado novo de `changed_id`; None = removida) no lugar do que
+    está gravado. Lê no máximo até achar o primeiro candidato.
+    """
+    best = {"id": changed_id, "at": to_instant(changed["nextPayment"])} if _is_candidate(changed) else None
+
+    query = _account_ref(uid).collection("subscriptions").select(["status", "nextPayment"])
+    if best:
+        query = query.where("nextPayment", "<", best["at"])
+    query = query.order_by("nextPayment")
+
+    async for doc in query.stream(transaction=transaction):
+        data = doc.to_dict()
+        if doc.id != changed_id and _is_candidate(data):
+            return {"id": doc.id, "at": to_instant(data["nextPayment"])}
+    return best
+
+
+async def refresh_earliest(uid: str):
+    """Recalcula só o rollup.nextPayment (após escritas em lote)."""
+    earliest = await earliest_next_payment(uid)
+    await _account_ref(uid).set({"rollup": {"nextPayment": earliest}}, merge=True)
+
+
+async def compute_rollup(uid: str, transaction=None) -> dict:
+    """Rollup completo a partir das assinaturas (uma passada no stream)."""
+    rollup = {"subscriptions": 0, "statusCounts": {}, "spend": {}, "cards": {}, "nextPayment": None}
+    query = _account_ref(uid).collection("subscriptions").select(ROLLUP_FIELDS)
+
+    async for sub in query.stream(transaction=transaction):
+        data = sub.to_dict()
+        add_deltas(rollup, _contribution(data))
+        # Compara como instantes: aceita Timestamp e strings ISO ainda não migradas
+        at = to_instant(data.get("nextPayment"))
+        if _is_candidate(data) and (rollup["nextPayment"] is None or at < rollup["nextPayment"]["at"]):
+            rollup["nextPayment"] = {"id": sub.id, "at": at}
+    return rollup
+
+
+def _flatten(value, prefix: str = "") -> dict:
+    if isinstance(value, dict) and prefix != "nextPayment":
+        flat = {}
+        for key, item in value.items():
+            flat.update(_flatten(item, f"{prefix}.{key}" if prefix else key))
+        return flat
+    return {prefix: value}
+
+
+def rollup_drift(stored: dict, expected: dict) -> list[dict]:
+    """Campos em que o rollup gravado diverge do recalculado (ausente = 0)."""
+    stored, expected = _flatten(stored or {}), _flatten(expected)
+    drift = []
+    for path in sorted(set(stored) | set(expected)):
+        a, b = stored.get(path), expected.get(path)
+        if path == "nextPayment":
+            # Empates na data podem apontar para qualquer uma das assinaturas
+            same = to_instant((a or {}).get("at")) == to_instant((b or {}).get("at"))
+        elif not isinstance(a or 0, (int, float)) or not isinstance(b or 0, (int, float)):
+            same = a == b
+        else:
+            same = abs((a or 0) - (b or 0)) <= TOLERANCE
+        if not same:
+            drift.append({"field": path, "stored": a, "expected": b})
+    return drift
+
+
+async def rebuild(uid: str, repair: bool = True) -> list[dict]:
+    """Reconstrói o rollup de uma conta numa transação; devolve a divergência encontrada."""
+    account_ref = _account_ref(uid)
+
+    @transactional
+    async def _rebuild(transaction):
+        account, expected = await asyncio.gather(
+            account_ref.get(transaction=transaction),
+            compute_rollup(uid, transaction),
+        )
+        drift = rollup_drift((account.to_dict() or {}).get("rollup"), expected)
+        if drift and repair:
+            # update substitui o mapa inteiro (descarta chaves que não existem mais)
+            if account.exists:
+                transaction.update(account_ref, {"rollup": expected})
+            else:
+                transaction.set(account_ref, {"rollup": expected})
+        return drift
+
+    return await _rebuild(get_fs().transaction())
+
+
+async def check_rollups(uid: str | None = None, repair: bool = True) -> dict:
+    """
+    Verificador de consistência: recalcula o rollup de cada conta (em paralelo,
+    limitado por ROLLUP_CHECK_CONCURRENCY), reporta e opcionalmente corrige.
+    """
+    if uid:
+        uids = [uid]
+    else:
+        uids = [doc.id async for doc in get_fs().collection("accounts").select([]).stream()]
+
+    semaphore = asyncio.Semaphore(ROLLUP_CHECK_CONCURRENCY)
+
+    async def check(account_uid: str):
+        async with semaphore:
+            return account_uid, await rebuild(account_uid, repair)
+
+    results = await asyncio.gather(*(check(account_uid) for account_uid in uids))
+    drifted = [{"uid": account_uid, "fields": drift} for account_uid, drift in results if drift]
+
+    report = {"accounts": len(uids), "drifted": len(drifted), "repaired": repair, "drift": drifted}
+    await get_fs().collection("jobs").document("check-rollups").set({
+        "lastRunAt": datetime.now(timezone.utc),
+        "accounts": report["accounts"],
+        "drifted": report["drifted"],
+        "repaired": repair,
+    }, merge=True)
+    return report
+
+
+if __name__ == "__main__":
+    result = asyncio.run(check_rollups())
+    print(f"{result['accounts']} accounts, {result['drifted']} drifted")
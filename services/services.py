@@ -3,15 +3,17 @@ import smtplib
 from email.mime.text import MIMEText
 from email.utils import formataddr
 
-SMTP_HOST = "smtp.gmail.com"
-SMTP_PORT = 587
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "20"))
 
 MY_APP_KEY = os.getenv("MY_APP_KEY")
 MY_EMAIL = os.getenv("MY_EMAIL")
 
 SUPPORT_TO = MY_EMAIL
 
-def send_email(name: str, email: str, subject: str, message: str) -> bool:
+def build_support_message(name: str, email: str, subject: str, message: str) -> MIMEText:
     body = (
         f"Você recebeu uma nova solicitação:\n\n"
         f"Contato: {name} <{email}>\n\n"
@@ -24,13 +26,20 @@ def send_email(name: str, email: str, subject: str, message: str) -> bool:
     msg["From"] = formataddr(("Sinu", MY_EMAIL))
     msg["To"] = SUPPORT_TO
     msg["Reply-To"] = formataddr((name, email))
+    return msg
 
+def open_smtp_connection() -> smtplib.SMTP:
+    """Abre uma conexão SMTP já autenticada, para ser reaproveitada entre envios."""
+    server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
     try:
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=200) as server:
+        if SMTP_STARTTLS:
             server.starttls()
+        if MY_APP_KEY:
             server.login(MY_EMAIL, MY_APP_KEY)
-            server.sendmail(MY_EMAIL, [SUPPORT_TO], msg.as_string())
-            return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
\ No newline at end of file
+    except Exception:
+        server.close()
+        raise
+    return server
+
+def send_support_message(server: smtplib.SMTP, msg: MIMEText):
+    server.sendmail(MY_EMAIL, [SUPPORT_TO], msg.as_string())
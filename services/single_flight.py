@@ -0,0 +1,55 @@
+import os
+import time
+import asyncio
+
+# Por quanto tempo um resultado continua sendo devolvido para a mesma chave
+SINGLE_FLIGHT_SHARE_SECONDS = float(os.getenv("SINGLE_FLIGHT_SHARE_SECONDS", "10"))
+
+
+class SingleFlight:
+    """
+    Junta chamadas concorrentes com a mesma chave numa só: a primeira executa,
+    as outras esperam e recebem o mesmo resultado. O resultado ainda vale por
+    `share_seconds` depois de pronto (as abas que acordam juntas não chegam
+    exatamente ao mesmo tempo). Falhas não ficam guardadas.
+    """
+
+    def __init__(self, share_seconds: float = SINGLE_FLIGHT_SHARE_SECONDS):
+        self.share_seconds = share_seconds
+        # chave -> (task, válido até); válido até = None enquanto roda
+        self._calls: dict[str, tuple[asyncio.Task, float | None]] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn):
+        now = time.monotonic()
+        self._prune(now)
+
+        call = self._calls.get(key)
+        if call is not None:
+            self.shared += 1
+            task = call[0]
+        else:
+            self.calls += 1
+            # Task própria: o cancelamento de quem disparou não derruba os outros
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = (task, None)
+            task.add_done_callback(lambda t: self._finished(key, t))
+
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Task):
+        if self._calls.get(key, (None,))[0] is not task:
+            return
+        if task.cancelled() or task.exception() is not None:
+            self._calls.pop(key, None)
+        else:
+            self._calls[key] = (task, time.monotonic() + self.share_seconds)
+
+    def _prune(self, now: float):
+        expired = [key for key, (_, until) in self._calls.items() if until is not None and until <= now]
+        for key in expired:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared, "entries": len(self._calls)}
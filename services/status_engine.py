@@ -0,0 +1,210 @@
+"""
+Regras de status das assinaturas, sem I/O e vetorizadas com NumPy:
+
+    0 Inativa (nunca muda sozinha)
+    1 Ativa
+    2 Expirando (faltam <= 10 dias para o nextPayment)
+    3 Vencida (nextPayment já passou)
+
+Recebe colunas (nextPayment em datetime64[D], status em int) e devolve os
+novos status e a máscara do que mudou numa passada só. O mesmo código atende
+o job de recálculo (milhares de linhas) e as rotas de um documento só.
+"""
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+
+INACTIVE, ACTIVE, EXPIRING, EXPIRED = 0, 1, 2, 3
+EXPIRING_DAYS = 10
+
+# Status ausente/inválido no documento
+NO_STATUS = -1
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NAT = "NaT"
+
+_DIGIT_POSITIONS = [0, 1, 2, 3, 5, 6, 8, 9]
+_UTC_SUFFIX = np.array([ord(c) for c in "+00:00"], dtype=np.uint32)
+_UTC_SUFFIX_RANGE = np.arange(-6, 0)
+
+
+def _slow_day(value) -> str:
+    """Caminho lento do parser: offsets diferentes de UTC e Timestamps protobuf."""
+    if value is None:
+        return _NAT
+    if hasattr(value, "to_datetime"):  # Timestamp do Firestore (protobuf)
+        value = value.to_datetime()
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return _NAT
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.date().isoformat()
+    return _NAT
+
+
+_SECONDS_PER_DAY = 86400
+
+
+def parse_days(values) -> np.ndarray:
+    """
+    Converte valores de nextPayment para datetime64[D] (dia em UTC); NaT se
+    ausente ou inválido. Timestamps nativos (datetime) viram segundos numa
+    list comprehension só; strings de documentos ainda não migrados vão para
+    `_parse_text_days`.
+    """
+    seconds = np.array(
+        [
+            (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+            if isinstance(value, datetime) else np.nan
+            for value in values
+        ],
+        dtype=np.float64,
+    )
+    native = ~np.isnan(seconds)
+    if not native.any():
+        return _parse_text_days(values)
+    days = np.where(native, np.floor(seconds / _SECONDS_PER_DAY), 0).astype(np.int64).view("datetime64[D]")
+    if native.all():
+        return days
+
+    rest = np.flatnonzero(~native)
+    days[rest] = _parse_text_days([values[i] for i in rest.tolist()])
+    return days
+
+
+def _parse_text_days(values) -> np.ndarray:
+    """
+    Strings em UTC ("...Z", "+00:00" ou só a data, o formato gravado pelo app)
+    são convertidas sem loop em Python: o NumPy monta uma matriz de code points
+    e os dígitos da data são lidos direto dela. O resto (outros offsets,
+    Timestamps protobuf) passa pelo parser completo, linha a linha.
+    """
+    n = len(values)
+    text = np.array(values, dtype=str)
+    if n == 0 or text.dtype.itemsize < 40:
+        # Nenhum valor com 10+ caracteres: não há o que ler no caminho rápido
+        return np.array([_slow_day(value) for value in values], dtype="datetime64[D]")
+
+    codes = text.view(np.uint32).reshape(n, -1)
+    length = np.char.str_len(text)
+    rows = np.arange(n)
+
+    tail = np.clip(length[:, None] + _UTC_SUFFIX_RANGE, 0, codes.shape[1] - 1)
+    utc = (
+        (length == 10)
+        | (codes[rows, np.maximum(length - 1, 0)] == ord("Z"))
+        | ((length >= 16) & (codes[rows[:, None], tail] == _UTC_SUFFIX).all(axis=1))
+    )
+
+    chars = codes[:, :10]
+    digits = chars[:, _DIGIT_POSITIONS].astype(np.int32) - ord("0")
+    valid = (
+        utc
+        & (length >= 10)
+        & ((digits >= 0) & (digits <= 9)).all(axis=1)
+        & (chars[:, 4] == ord("-"))
+        & (chars[:, 7] == ord("-"))
+    )
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 4] * 10 + digits[:, 5]
+    day = digits[:, 6] * 10 + digits[:, 7]
+    valid &= (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1)
+
+    month_start = (np.where(valid, year, 1970) - 1970).astype("datetime64[Y]").astype("datetime64[M]") + np.where(valid, month - 1, 0)
+    days_in_month = ((month_start + 1).astype("datetime64[D]") - month_start.astype("datetime64[D]")).astype(np.int32)
+    valid &= day <= days_in_month
+
+    result = month_start.astype("datetime64[D]") + np.where(valid, day - 1, 0)
+
+    # Linhas que não passaram pelo caminho rápido (ou estavam malformadas)
+    for i in np.flatnonzero(~valid).tolist():
+        result[i] = np.datetime64(_slow_day(values[i]), "D")
+    return result
+
+
+def parse_statuses(values) -> np.ndarray:
+    return np.array(
+        [value if type(value) is int else NO_STATUS for value in values],
+        dtype=np.int8,
+    )
+
+
+def compute_statuses(next_payment: np.ndarray, status: np.ndarray, today: np.datetime64) -> tuple[np.ndarray, np.ndarray]:
+    """Novos status e máscara das linhas cujo status mudou."""
+    days = (next_payment - today).astype(np.int64)
+    computed = np.where(days < 0, EXPIRED, np.where(days <= EXPIRING_DAYS, EXPIRING, ACTIVE)).astype(np.int8)
+
+    # Inativas e sem nextPayment ficam como estão
+    keep = (status == INACTIVE) | np.isnat(next_payment)
+    new_status = np.where(keep, status, computed)
+    return new_status, new_status != status
+
+
+def next_transitions(next_payment: np.ndarray, status: np.ndarray, today: np.datetime64) -> np.ndarray:
+    """
+    Dia (meia-noite UTC) em que o status vai mudar sozinho: 10 dias antes do
+    vencimento (Expirando) ou no dia seguinte a ele (Vencido). NaT se não houver.
+    """
+    expiring_at = next_payment - np.timedelta64(EXPIRING_DAYS, "D")
+    expired_at = next_payment + np.timedelta64(1, "D")
+    transition = np.where(today < expiring_at, expiring_at, np.where(today < expired_at, expired_at, np.datetime64(_NAT)))
+    return np.where(status == INACTIVE, np.datetime64(_NAT, "D"), transition).astype("datetime64[D]")
+
+
+_NAT_INT = np.iinfo(np.int64).min
+_MICROSECOND = timedelta(microseconds=1)
+_NAIVE_EPOCH = _EPOCH.replace(tzinfo=None)
+
+
+def _parse_instants(values) -> np.ndarray:
+    """statusChangeAt atuais em datetime64[us] (NaT quando ausentes)."""
+    return np.array(
+        [
+            _NAT_INT if value is None or not isinstance(value, datetime)
+            else (value - _EPOCH) // _MICROSECOND if value.tzinfo is not None
+            else (value - _NAIVE_EPOCH) // _MICROSECOND
+            for value in values
+        ],
+        dtype=np.int64,
+    ).view("datetime64[us]")
+
+
+def status_updates(rows: list[dict], now: datetime | None = None) -> list[dict]:
+    """
+    Campos a gravar em cada linha (`status` e/ou `statusChangeAt`); dict vazio
+    quando nada mudou. `rows` precisa ter nextPayment, status e statusChangeAt.
+    """
+    now = now or datetime.now(timezone.utc)
+    today = np.datetime64(now.astimezone(timezone.utc).date().isoformat(), "D")
+
+    next_payment = parse_days([row.get("nextPayment") for row in rows])
+    status = parse_statuses([row.get("status") for row in rows])
+    new_status, status_changed = compute_statuses(next_payment, status, today)
+
+    transitions = next_transitions(next_payment, new_status, today)
+    current = _parse_instants([row.get("statusChangeAt") for row in rows])
+    transitions_us = transitions.astype("datetime64[us]")
+    both_nat = np.isnat(transitions_us) & np.isnat(current)
+    transition_changed = (transitions_us != current) & ~both_nat
+
+    updates = [{} for _ in rows]
+    changed_rows = np.flatnonzero(status_changed)
+    for i, value in zip(changed_rows.tolist(), new_status[changed_rows].tolist()):
+        updates[i]["status"] = value
+
+    # Poucos dias distintos: cada datetime é criado uma vez só
+    changed_rows = np.flatnonzero(transition_changed)
+    days, inverse = np.unique(transitions[changed_rows], return_inverse=True)
+    instants = [None if np.isnat(day) else _EPOCH + timedelta(days=int(day.astype(np.int64))) for day in days]
+    for i, k in zip(changed_rows.tolist(), inverse.tolist()):
+        updates[i]["statusChangeAt"] = instants[k]
+    return updates
+
+
+def status_update(row: dict, now: datetime | None = None) -> dict:
+    """Versão para um documento só (mesmas regras, sem caminho especial)."""
+    return status_updates([row], now)[0]
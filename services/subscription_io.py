@@ -0,0 +1,107 @@
+import io
+import csv
+import json
+import codecs
+from datetime import datetime
+
+from services.timestamps import to_iso
+
+# Colunas exportadas/importadas (mesma ordem do SubscriptionData)
+EXPORT_FIELDS = [
+    "id",
+    "name",
+    "description",
+    "price",
+    "currency",
+    "subscriptionType",
+    "billingDay",
+    "billingFrequency",
+    "nextPayment",
+    "paymentMethod",
+    "status",
+    "cardBank",
+    "cardFinalNumbers",
+    "createdDate",
+]
+
+
+def _plain(value):
+    # Timestamps do Firestore viram ISO (com "Z"); o resto é serializado como está
+    return to_iso(value) if isinstance(value, datetime) else value
+
+
+def to_ndjson(doc_id: str, data: dict) -> str:
+    row = {field: _plain(data.get(field)) for field in EXPORT_FIELDS if field != "id"}
+    return json.dumps({"id": doc_id, **row}, ensure_ascii=False) + "\n"
+
+
+def csv_header() -> str:
+    return to_csv_line(EXPORT_FIELDS)
+
+
+def to_csv(doc_id: str, data: dict) -> str:
+    return to_csv_line([doc_id] + [_plain(data.get(field)) for field in EXPORT_FIELDS[1:]])
+
+
+def to_csv_line(values) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(["" if v is None else v for v in values])
+    return buffer.getvalue()
+
+
+async def iter_lines(chunks):
+    """
+    Quebra o corpo da requisição (stream de bytes) em linhas de texto,
+    sem carregar o arquivo inteiro em memória.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield pending.rstrip("\r")
+
+
+async def iter_records(chunks, fmt: str):
+    """
+    Gera (número da linha, dict) a partir de um upload NDJSON ou CSV.
+    Linhas inválidas geram (número da linha, Exception).
+    """
+    line_number = 0
+    header = None
+    record = ""
+
+    async for line in iter_lines(chunks):
+        line_number += 1
+
+        if fmt == "ndjson":
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                yield line_number, e
+            continue
+
+        # CSV: um campo entre aspas pode atravessar linhas, então só fecha o
+        # registro quando o número de aspas estiver balanceado
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue
+        values = next(csv.reader([record]))
+        record = ""
+
+        if header is None:
+            header = values
+            continue
+        if not any(values):
+            continue
+        # Células vazias viram None (campos opcionais do SubscriptionData)
+        yield line_number, {k: (v if v != "" else None) for k, v in zip(header, values)}
+
+    if record:
+        yield line_number, ValueError("Unterminated quoted field")
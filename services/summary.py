@@ -0,0 +1,151 @@
+"""
+Resumo de gastos do usuário calculado no servidor numa passada só sobre as
+assinaturas: gasto mensal/anual por moeda, por cartão e por tipo, as próximas
+cobranças e a projeção de caixa dos próximos meses. Valores nunca são somados
+entre moedas diferentes.
+"""
+import heapq
+from datetime import datetime
+
+from services import billing
+from services.timestamps import to_instant, to_iso
+
+# Campos lidos do Firestore para montar o resumo
+SUMMARY_FIELDS = [
+    "name",
+    "price",
+    "currency",
+    "billingFrequency",
+    "billingDay",
+    "nextPayment",
+    "status",
+    "cardFinalNumbers",
+    "subscriptionType",
+]
+
+PERIODS_PER_YEAR = {
+    "weekly": 52,
+    "monthly": 12,
+    "quarterly": 4,
+    "semiannual": 2,
+    "yearly": 1,
+}
+
+NO_CARD = "none"
+
+
+def _month_index(moment: datetime) -> int:
+    return moment.year * 12 + moment.month - 1
+
+
+class SpendingSummary:
+    """Acumulador: `add` para cada assinatura (na ordem do stream) e `result` no fim."""
+
+    def __init__(self, now: datetime, upcoming: int = 5, months: int = 12):
+        self.now = now
+        self.upcoming_limit = upcoming
+        self.months = months
+        self._first_month = _month_index(now)
+        self._currencies: dict[str, dict] = {}
+        self._cards: dict[str, dict] = {}
+        self._types: dict[str, dict] = {}
+        self._cash_flow = [{} for _ in range(months)]
+        # heap de (-vencimento, -seq, item): mantém só os N mais próximos
+        self._upcoming: list[tuple] = []
+        self._seq = 0
+        self.count = 0
+
+    @staticmethod
+    def _add_spend(group: dict, currency: str, monthly: float):
+        totals = group.setdefault(currency, {"monthly": 0.0, "yearly": 0.0, "count": 0})
+        totals["monthly"] += monthly
+        totals["yearly"] += monthly * 12
+        totals["count"] += 1
+
+    def add(self, subscription_id: str, data: dict):
+        # Inativas não geram cobrança
+        if data.get("status") == 0:
+            return
+
+        price = data.get("price")
+        if not isinstance(price, (int, float)):
+            return
+
+        self.count += 1
+        currency = data.get("currency") or "unknown"
+        freq = data.get("billingFrequency")
+        if freq not in PERIODS_PER_YEAR:
+            freq = "monthly"
+        monthly = price * PERIODS_PER_YEAR[freq] / 12
+
+        self._add_spend(self._currencies, currency, monthly)
+        self._add_spend(self._cards.setdefault(data.get("cardFinalNumbers") or NO_CARD, {}), currency, monthly)
+        self._add_spend(self._types.setdefault(data.get("subscriptionType") or "unknown", {}), currency, monthly)
+
+        next_payment = to_instant(data.get("nextPayment"))
+        if next_payment is None:
+            return
+
+        self._add_upcoming(subscription_id, data, next_payment, price, currency)
+        self._add_cash_flow(next_payment, freq, data.get("billingDay"), price, currency)
+
+    def _add_upcoming(self, subscription_id: str, data: dict, due: datetime, price: float, currency: str):
+        if self.upcoming_limit <= 0:
+            return
+        item = {
+            "id": subscription_id,
+            "name": data.get("name"),
+            "price": price,
+            "currency": currency,
+            "dueAt": to_iso(due),
+            "overdue": due.date() < self.now.date(),
+            "cardFinalNumbers": data.get("cardFinalNumbers"),
+        }
+        self._seq += 1
+        entry = (-due.timestamp(), -self._seq, item)
+        if len(self._upcoming) < self.upcoming_limit:
+            heapq.heappush(self._upcoming, entry)
+        elif entry > self._upcoming[0]:
+            heapq.heapreplace(self._upcoming, entry)
+
+    def _add_cash_flow(self, next_payment: datetime, freq: str, billing_day, price: float, currency: str):
+        dues = billing.occurrences(next_payment, freq, billing_day=billing_day)
+        if next_payment.date() < self.now.date():
+            # Cobrança vencida em aberto entra no mês atual; as seguintes seguem o calendário
+            self._add_to_month(0, currency, price)
+            dues = billing.occurrences(next_payment, freq, after=self.now, billing_day=billing_day)
+
+        for due in dues:
+            month = _month_index(due) - self._first_month
+            if month >= self.months:
+                break
+            self._add_to_month(month, currency, price)
+
+    def _add_to_month(self, month: int, currency: str, price: float):
+        bucket = self._cash_flow[month]
+        bucket[currency] = bucket.get(currency, 0.0) + price
+
+    def result(self) -> dict:
+        def rounded(group: dict) -> dict:
+            return {
+                currency: {"monthly": round(t["monthly"], 2), "yearly": round(t["yearly"], 2), "count": t["count"]}
+                for currency, t in sorted(group.items())
+            }
+
+        upcoming = [item for _, _, item in sorted(self._upcoming, reverse=True)]
+        cash_flow = []
+        for offset, bucket in enumerate(self._cash_flow):
+            year, month = divmod(self._first_month + offset, 12)
+            cash_flow.append({
+                "month": f"{year:04d}-{month + 1:02d}",
+                "totals": {currency: round(total, 2) for currency, total in sorted(bucket.items())},
+            })
+
+        return {
+            "subscriptions": self.count,
+            "totals": rounded(self._currencies),
+            "byCard": {card: rounded(group) for card, group in sorted(self._cards.items())},
+            "byType": {kind: rounded(group) for kind, group in sorted(self._types.items())},
+            "upcoming": upcoming,
+            "cashFlow": cash_flow,
+        }
@@ -0,0 +1,44 @@
+"""
+Datas (nextPayment, createdDate, lastLoginAt...) são gravadas como Timestamp
+nativo do Firestore, o que permite consultas por intervalo indexadas sem
+depender do formato da string. Documentos antigos ainda têm strings ISO: as
+leituras aceitam os dois formatos até a migração (services/migrate_timestamps)
+terminar. Na API as datas continuam saindo como ISO em UTC com "Z".
+"""
+from datetime import datetime, timezone
+
+
+def to_instant(value) -> datetime | None:
+    """datetime em UTC a partir de Timestamp/datetime/string ISO; None se ausente ou inválido."""
+    if value is None:
+        return None
+    if hasattr(value, "to_datetime"):  # Timestamp do Firestore (protobuf)
+        value = value.to_datetime()
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        # Sem fuso (datas antigas sem offset) é tratado como UTC
+        return value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return None
+
+
+def to_iso(value) -> str:
+    """Mesmo formato que o app sempre usou: "2026-01-01T19:41:21.994Z"."""
+    instant = to_instant(value)
+    if instant is None:
+        return value
+    return instant.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def to_json(value):
+    """Converte (recursivamente) os datetimes de uma resposta para ISO."""
+    if isinstance(value, datetime):
+        return to_iso(value)
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_json(item) for item in value]
+    return value
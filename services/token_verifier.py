@@ -0,0 +1,244 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import httpx
+
+from services import metrics
+
+# Certificados públicos usados pelo Firebase Auth para assinar os ID tokens
+CERTS_URL = os.getenv(
+    "TOKEN_CERTS_URL",
+    "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com",
+)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+CLOCK_SKEW_SECONDS = 5
+KEY_FETCH_TIMEOUT = 10
+KEY_REFRESH_RETRY = 60       # segundos até tentar de novo se o refresh falhar
+KEY_REFRESH_MARGIN = 0.9     # renova as chaves com 90% do max-age consumido
+# Intervalo mínimo entre buscas forçadas por `kid` desconhecido (senão qualquer
+# um força uma busca por requisição só inventando o kid)
+KEY_FORCED_REFRESH_INTERVAL = float(os.getenv("KEY_FORCED_REFRESH_INTERVAL", "30"))
+DEFAULT_MAX_AGE = 3600
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class InvalidTokenError(ValueError):
+    pass
+
+
+def _token_key(id_token: str) -> str:
+    return hashlib.sha256(id_token.encode()).hexdigest()
+
+
+def _parse_max_age(cache_control: str | None) -> int:
+    match = _MAX_AGE_RE.search(cache_control or "")
+    return int(match.group(1)) if match else DEFAULT_MAX_AGE
+
+
+class SigningKeyStore:
+    """
+    Mantém em memória os certificados de assinatura do Google e os renova em
+    background de acordo com o Cache-Control (max-age) da resposta.
+    """
+
+    def __init__(self, url: str = CERTS_URL):
+        self.url = url
+        self._certs: dict[str, str] = {}
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._timer: threading.Timer | None = None
+        self._fetched_at = float("-inf")
+        self.fetches = 0
+        self.throttled = 0
+
+    def get(self, force: bool = False) -> dict[str, str]:
+        # Só bloqueia a requisição se não houver nenhuma chave válida em memória
+        if force or not self._certs or time.time() >= self._expires_at:
+            self.refresh(force=force)
+        return self._certs
+
+    def refresh_unknown_kid(self) -> dict[str, str]:
+        """
+        Busca as chaves de novo para um `kid` que não conhecemos (rotação), no
+        máximo uma vez por KEY_FORCED_REFRESH_INTERVAL; dentro da janela
+        devolve as chaves atuais e o token é recusado.
+        """
+        with self._lock:
+            if time.monotonic() - self._fetched_at < KEY_FORCED_REFRESH_INTERVAL:
+                self.throttled += 1
+                return self._certs
+            # Marca antes de buscar: as outras threads não entram na fila do lock
+            self._fetched_at = time.monotonic()
+        self.refresh(force=True)
+        return self._certs
+
+    def refresh(self, force: bool = False):
+        with self._lock:
+            # Outra thread pode ter renovado enquanto esperávamos o lock
+            if not force and self._certs and time.time() < self._expires_at:
+                return
+
+            with metrics.timed("http_signing_keys"):
+                r = httpx.get(self.url, timeout=KEY_FETCH_TIMEOUT)
+            r.raise_for_status()
+            max_age = _parse_max_age(r.headers.get("Cache-Control"))
+
+            self._certs = r.json()
+            self._expires_at = time.time() + max_age
+            self._fetched_at = time.monotonic()
+            self.fetches += 1
+            self._schedule(max(KEY_REFRESH_RETRY, max_age * KEY_REFRESH_MARGIN))
+
+    def _schedule(self, delay: float):
+        if self._timer:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh(force=True)
+        except Exception as e:
+            # Mantém as chaves atuais e tenta novamente mais tarde
+            print(f"Error refreshing token signing keys: {e}")
+            self._schedule(KEY_REFRESH_RETRY)
+
+    def stop(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._certs),
+            "fetches": self.fetches,
+            "throttled": self.throttled,
+            "expiresIn": max(0, int(self._expires_at - time.time())),
+        }
+
+
+class TokenVerifier:
+    """
+    Verifica ID tokens do Firebase localmente, com as chaves em memória, e
+    guarda os tokens já verificados num LRU limitado (chave = hash do token).
+    Cada entrada expira junto com o `exp` do próprio token.
+
+    `revoke` (logout) recusa um token antes do `exp`. A lista é por processo:
+    em outras instâncias o token continua valendo até expirar (no máximo 1h),
+    como acontecia com o verify_id_token sem check_revoked.
+    """
+
+    def __init__(self, project_id: str, max_size: int = TOKEN_CACHE_SIZE, keys: SigningKeyStore | None = None):
+        self.project_id = project_id
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self.max_size = max_size
+        self.keys = keys or SigningKeyStore()
+        self._cache: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        # hash do token -> exp (depois disso o próprio exp já recusa o token)
+        self._revoked: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_cached(self, id_token: str) -> dict | None:
+        """Só a consulta ao cache (sem I/O nem criptografia); None se não estiver lá."""
+        key = _token_key(id_token)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and entry[1] > time.time():
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        return None
+
+    def verify(self, id_token: str) -> dict:
+        cached = self.get_cached(id_token)
+        if cached is not None:
+            return cached
+
+        key = _token_key(id_token)
+        now = time.time()
+
+        with self._lock:
+            self._cache.pop(key, None)
+            self.misses += 1
+            if key in self._revoked:
+                raise InvalidTokenError("Token revoked")
+
+        decoded = self._verify_signature(id_token)
+
+        with self._lock:
+            if key in self._revoked:
+                # Revogado enquanto a assinatura era verificada
+                raise InvalidTokenError("Token revoked")
+            self._cache[key] = (decoded, float(decoded["exp"]))
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.max_size:
+                self._evict(now)
+
+        return decoded
+
+    def revoke(self, id_token: str):
+        """Recusa o token daqui em diante, mesmo que esteja no cache (token inválido levanta InvalidTokenError)."""
+        decoded = self.verify(id_token)
+        key = _token_key(id_token)
+        now = time.time()
+        with self._lock:
+            self._cache.pop(key, None)
+            for revoked in [k for k, exp in self._revoked.items() if exp <= now]:
+                del self._revoked[revoked]
+            self._revoked[key] = float(decoded["exp"])
+
+    def _verify_signature(self, id_token: str) -> dict:
+        from google.auth import jwt as google_jwt
+
+        try:
+            kid = google_jwt.decode_header(id_token).get("kid")
+            certs = self.keys.get()
+            if kid and kid not in certs:
+                # Chave nova (rotação): força a atualização, com intervalo mínimo entre buscas
+                certs = self.keys.refresh_unknown_kid()
+            claims = google_jwt.decode(
+                id_token,
+                certs=certs,
+                audience=self.project_id,
+                clock_skew_in_seconds=CLOCK_SKEW_SECONDS,
+            )
+        except Exception as e:
+            raise InvalidTokenError(str(e)) from e
+
+        sub = claims.get("sub")
+        if claims.get("iss") != self.issuer:
+            raise InvalidTokenError("Invalid token issuer")
+        if not isinstance(sub, str) or not sub or len(sub) > 128:
+            raise InvalidTokenError("Invalid token subject")
+
+        # Mesmo formato devolvido pelo firebase_admin.auth.verify_id_token
+        claims["uid"] = sub
+        return claims
+
+    def _evict(self, now: float):
+        # Remove primeiro os tokens expirados, depois os menos usados
+        for key in [k for k, (_, exp) in self._cache.items() if exp <= now]:
+            del self._cache[key]
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self._cache),
+            "maxSize": self.max_size,
+            "revoked": len(self._revoked),
+            "signingKeys": self.keys.stats(),
+        }
@@ -0,0 +1,57 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+# Testes rodam no backend em memória, sem projeto Firebase nem .env
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATA_BACKEND"] = "memory"
+os.environ.setdefault("PROJECT_ID", "test-project")
+os.environ.setdefault("API_KEY", "test-key")
+os.environ.setdefault("JOB_TOKEN", "test-job-token")
+
+JOB_HEADERS = {"Authorization": f"Bearer {os.environ['JOB_TOKEN']}"}
+
+SUBSCRIPTION = {
+    "name": "Netflix",
+    "price": 39.9,
+    "currency": "BRL",
+    "subscriptionType": "monthly",
+    "billingDay": 5,
+    "billingFrequency": "monthly",
+    "nextPayment": "2026-11-05T00:00:00Z",
+    "paymentMethod": "card",
+    "status": 1,
+    "cardBank": "Nu",
+    "cardFinalNumbers": "1111",
+}
+
+
+def card(numbers: str) -> dict:
+    return {"cardName": numbers, "cardBank": "Nu", "cardFinalNumbers": numbers, "dueDate": 5, "limit": 1000, "status": 1}
+
+
+@pytest.fixture
+def uid():
+    # Um usuário por teste: o cache de respostas é por uid
+    return uuid.uuid4().hex
+
+
+@pytest.fixture
+def client(uid, monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+
+    import firebase
+    import main
+    from services.outbox import Outbox
+
+    monkeypatch.setattr(firebase, "_fs", None)
+    monkeypatch.setattr(main, "_support_outbox", None)
+    monkeypatch.setattr(main, "Outbox", lambda: Outbox(str(tmp_path / "outbox.db")))
+    # Sem rede no warm-up
+    monkeypatch.setattr(main.token_verifier.keys, "get", lambda *args, **kwargs: {})
+    main.app.dependency_overrides[main.verify_firebase_token] = lambda: {"uid": uid}
+    with TestClient(main.app) as client:
+        yield client
+    main.app.dependency_overrides.clear()
@@ -0,0 +1,90 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+
+import main
+from services import admission
+from services.admission import Bulkhead, RateLimiter, Rejected
+
+
+def admitted(group):
+    return main.admission.bulkheads[group].admitted
+
+
+def test_accept_header_does_not_skip_bulkhead(client):
+    before = admitted("default")
+    response = client.get("/subscription/list", headers={"Accept": "text/event-stream"})
+    assert response.status_code == 200
+    assert admitted("default") == before + 1
+
+
+def test_stream_route_is_exempt(client):
+    before = admitted("default")
+    # Sem token: 401, mas sem passar pelo bulkhead
+    main.app.dependency_overrides.clear()
+    assert client.get("/subscription/stream").status_code == 401
+    assert admitted("default") == before
+
+
+def test_full_bulkhead_rejects_with_503(client, monkeypatch):
+    monkeypatch.setitem(main.admission.bulkheads, "default", Bulkhead("default", 0, 0))
+    response = client.get("/subscription/list")
+    assert response.status_code == 503
+    assert response.json() == {"detail": "SERVER_BUSY"}
+    assert response.headers["Retry-After"] == "1"
+
+    # Outros grupos e as rotas isentas continuam respondendo
+    assert client.get("/health").status_code == 200
+    assert main.admission.bulkheads["default"].rejected == 1
+
+
+def test_bulkhead_queues_then_times_out(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_QUEUE_TIMEOUT", 0.01)
+    bulkhead = Bulkhead("test", 1, 1)
+
+    async def run():
+        await bulkhead.acquire()
+        # Um na fila; o próximo já é recusado sem esperar
+        waiting = asyncio.ensure_future(bulkhead.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected):
+            await bulkhead.acquire()
+        with pytest.raises(Rejected):
+            await waiting
+
+        bulkhead.release()
+        await bulkhead.acquire()
+        return bulkhead.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["active"], stats["waiting"], stats["admitted"], stats["rejected"]) == (1, 0, 2, 2)
+
+
+def test_rate_limiter_refills(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter("test", 2, 10)
+
+    limiter.check("ip:a")
+    limiter.check("ip:a")
+    with pytest.raises(Rejected) as error:
+        limiter.check("ip:a")
+    assert error.value.status_code == 429
+    assert error.value.retry_after == pytest.approx(5)
+    limiter.check("ip:b")
+
+    now[0] += 5
+    limiter.check("ip:a")
+
+
+def test_login_rate_limit_returns_429(client, monkeypatch):
+    limiter = main.admission.rate_limiters["login"]
+    monkeypatch.setattr(limiter, "_buckets", OrderedDict())
+    for _ in range(limiter.capacity):
+        limiter.check("ip:testclient")
+
+    response = client.post("/login", json={"email": "a@b.c", "password": "secret"})
+    assert response.status_code == 429
+    assert response.json()["detail"] == "TOO_MANY_REQUESTS"
+    assert int(response.headers["Retry-After"]) >= 1
@@ -0,0 +1,126 @@
+import main
+from conftest import SUBSCRIPTION, card
+from firebase import get_fs
+from services import rollup
+from test_cards import create_card, totals
+
+
+def add(client, **overrides):
+    return client.post("/subscription/add", json={**SUBSCRIPTION, **overrides}).json()["subscription_id"]
+
+
+def card_ids(client):
+    return {c["cardFinalNumbers"]: c["id"] for c in client.get("/cards/list").json()["cards"]}
+
+
+def test_subscription_batch_updates_and_deletes(client, uid):
+    create_card(client, "1111")
+    create_card(client, "2222")
+    first, second, third, fourth = add(client), add(client, price=10), add(client, price=5), add(client, price=1)
+
+    response = client.post("/subscription/batch", json={"operations": [
+        {"op": "update", "id": first, "update": {"cardFinalNumbers": "2222"}},
+        {"op": "update", "id": second, "update": {"price": 20}},
+        {"op": "delete", "id": third},
+        {"op": "delete", "id": "missing"},
+        {"op": "delete", "id": first},
+        {"op": "update", "id": fourth},
+    ]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["commits"] == 1
+    assert [result.get("error") for result in body["results"]] == [
+        None, None, None, "Subscription not found", "Duplicate operation for this id", "No fields to update",
+    ]
+    assert [result["ok"] for result in body["results"]] == [True, True, True, False, False, False]
+
+    listing = {sub["id"]: sub for sub in client.get("/subscription/list").json()}
+    assert set(listing) == {first, second, fourth}
+    assert listing[second]["price"] == 20
+    # Totais dos cartões e rollup ajustados no mesmo commit
+    assert totals(client) == {"1111": 21, "2222": 39.9}
+    assert client.portal.call(rollup.check_rollups, uid, False)["drifted"] == 0
+
+
+def test_subscription_batch_splits_commits(client, monkeypatch):
+    monkeypatch.setattr(main, "COMMIT_MAX_WRITES", 3)
+    ids = [add(client, price=i) for i in range(1, 5)]
+
+    # Sem cartão cadastrado: cada commit leva as assinaturas + o rollup (2 por commit)
+    body = client.post("/subscription/batch", json={"operations": [
+        {"op": "update", "id": subscription_id, "update": {"price": 100}} for subscription_id in ids
+    ]}).json()
+    assert all(result["ok"] for result in body["results"])
+    assert body["commits"] == 2
+    assert {sub["price"] for sub in client.get("/subscription/list").json()} == {100}
+
+
+def test_failed_commit_marks_only_its_operations(client, monkeypatch):
+    monkeypatch.setattr(main, "COMMIT_MAX_WRITES", 3)
+    ids = [add(client, price=i) for i in range(1, 5)]
+    batch_type = type(get_fs().batch())
+    original = batch_type.commit
+    calls = []
+
+    async def flaky_commit(self):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("unavailable")
+        return await original(self)
+
+    monkeypatch.setattr(batch_type, "commit", flaky_commit)
+    body = client.post("/subscription/batch", json={"operations": [
+        {"op": "delete", "id": subscription_id} for subscription_id in ids
+    ]}).json()
+
+    assert [result["ok"] for result in body["results"]] == [True, True, False, False]
+    assert body["results"][2]["error"] == "Commit failed: unavailable"
+    monkeypatch.setattr(batch_type, "commit", original)
+    assert {sub["id"] for sub in client.get("/subscription/list").json()} == set(ids[2:])
+
+
+def test_batch_limits(client, monkeypatch):
+    assert client.post("/subscription/batch", json={"operations": []}).status_code == 400
+    monkeypatch.setattr(main, "BATCH_MAX_OPERATIONS", 2)
+    operations = [{"op": "delete", "id": f"id-{i}"} for i in range(3)]
+    assert client.post("/subscription/batch", json={"operations": operations}).status_code == 400
+    assert client.post("/cards/batch", json={"operations": operations}).status_code == 400
+
+
+def test_card_batch_updates_renumbers_and_deletes(client):
+    for numbers in ("1111", "2222", "3333"):
+        create_card(client, numbers)
+    add(client, cardFinalNumbers="4444", price=7)
+    ids = card_ids(client)
+
+    body = client.post("/cards/batch", json={"operations": [
+        {"op": "update", "id": ids["1111"], "update": {**card("1111"), "cardName": "Principal"}},
+        {"op": "update", "id": ids["2222"], "update": card("4444")},
+        {"op": "delete", "id": ids["3333"]},
+        {"op": "delete", "id": "missing"},
+    ]}).json()
+
+    assert [result["ok"] for result in body["results"]] == [True, True, True, False]
+    assert body["results"][3]["error"] == "Card not found"
+    cards_list = {c["cardFinalNumbers"]: c for c in client.get("/cards/list").json()["cards"]}
+    assert set(cards_list) == {"1111", "4444"}
+    assert cards_list["1111"]["cardName"] == "Principal"
+    # Número novo: total recalculado com as assinaturas daquele final
+    assert cards_list["4444"]["totalSpent"] == 7
+
+    # O número liberado pode ser usado de novo
+    create_card(client, "2222")
+
+
+def test_card_batch_swaps_numbers(client):
+    create_card(client, "1111")
+    create_card(client, "2222")
+    add(client, cardFinalNumbers="2222", price=3)
+    ids = card_ids(client)
+
+    body = client.post("/cards/batch", json={"operations": [
+        {"op": "update", "id": ids["1111"], "update": card("2222")},
+        {"op": "delete", "id": ids["2222"]},
+    ]}).json()
+    assert all(result["ok"] for result in body["results"])
+    assert totals(client) == {"2222": 3}
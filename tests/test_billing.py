@@ -0,0 +1,75 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from conftest import SUBSCRIPTION
+from services import billing
+
+
+def at(year, month, day, hour=0):
+    return datetime(year, month, day, hour, tzinfo=timezone.utc)
+
+
+def test_next_due_keeps_future_anchor():
+    assert billing.next_due(at(2026, 12, 5), "monthly", at(2026, 10, 17)) == at(2026, 12, 5)
+
+
+def test_next_due_skips_periods_in_constant_time():
+    # Anchor antigo: não itera mês a mês, vai direto ao primeiro depois de `after`
+    assert billing.next_due(at(2000, 1, 5), "monthly", at(2026, 10, 17)) == at(2026, 11, 5)
+
+
+def test_next_due_same_day_is_not_after():
+    assert billing.next_due(at(2026, 1, 5, 12), "monthly", at(2026, 10, 5, 18)) == at(2026, 11, 5, 12)
+
+
+@pytest.mark.parametrize("after, expected", [
+    (at(2026, 2, 1), at(2026, 2, 28)),
+    (at(2026, 3, 1), at(2026, 3, 31)),
+    (at(2026, 4, 1), at(2026, 4, 30)),
+    (at(2028, 2, 1), at(2028, 2, 29)),
+])
+def test_next_due_clamps_day_31(after, expected):
+    # Fevereiro encurta o dia 31, mas os meses seguintes voltam para o 31
+    assert billing.next_due(at(2026, 1, 31), "monthly", after) == expected
+
+
+def test_next_due_uses_billing_day_over_clamped_anchor():
+    # nextPayment já gravado em 28/02 com billingDay 31 volta ao 31 em março
+    assert billing.next_due(at(2026, 2, 28), "monthly", at(2026, 3, 1), 31) == at(2026, 3, 31)
+
+
+@pytest.mark.parametrize("frequency, expected", [
+    ("weekly", at(2026, 10, 20)),
+    ("quarterly", at(2027, 1, 6)),
+    ("semiannual", at(2027, 1, 6)),
+    ("yearly", at(2027, 1, 6)),
+])
+def test_next_due_frequencies(frequency, expected):
+    assert billing.next_due(at(2026, 1, 6), frequency, at(2026, 10, 17)) == expected
+
+
+def test_next_due_leap_day_yearly():
+    assert billing.next_due(at(2024, 2, 29), "yearly", at(2024, 3, 1)) == at(2025, 2, 28)
+    assert billing.next_due(at(2024, 2, 29), "yearly", at(2027, 3, 1)) == at(2028, 2, 29)
+
+
+def test_next_due_unknown_frequency():
+    with pytest.raises(ValueError):
+        billing.next_due(at(2026, 1, 6), "daily", at(2026, 10, 17))
+
+
+def test_confirm_payment_advances_to_next_due(client):
+    expired = {**SUBSCRIPTION, "status": 3, "billingDay": 31, "nextPayment": "2025-01-31T00:00:00Z"}
+    subscription_id = client.post("/subscription/add", json=expired).json()["subscription_id"]
+
+    update = client.post(f"/subscription/confirm-payment/{subscription_id}").json()["update"]
+    expected = billing.next_due(at(2025, 1, 31), "monthly", datetime.now(timezone.utc), 31)
+    assert update["nextPayment"] == expected.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+    assert update["status"] in (1, 2)
+
+
+def test_confirm_payment_requires_expired(client):
+    subscription_id = client.post("/subscription/add", json=SUBSCRIPTION).json()["subscription_id"]
+    assert client.post(f"/subscription/confirm-payment/{subscription_id}").status_code == 400
+    assert client.post("/subscription/confirm-payment/missing").status_code == 404
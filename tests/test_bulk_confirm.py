@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+
+import main
+from conftest import SUBSCRIPTION
+from firebase import get_fs
+from services import billing, rollup
+from services.timestamps import to_iso
+
+
+EXPIRED = {**SUBSCRIPTION, "status": 3, "nextPayment": "2025-01-05T00:00:00Z"}
+
+
+def add(client, **overrides):
+    return client.post("/subscription/add", json={**EXPIRED, **overrides}).json()["subscription_id"]
+
+
+async def read_rollup(uid):
+    snap = await get_fs().collection("accounts").document(uid).get()
+    return snap.to_dict().get("rollup")
+
+
+def test_bulk_confirm_advances_and_reports_skipped(client, uid):
+    first = add(client)
+    second = add(client, billingFrequency="yearly")
+    active = add(client, status=1, nextPayment="2026-12-05T00:00:00Z")
+
+    response = client.post("/subscription/confirm-payment/bulk", json={"ids": [first, second, first, active, "missing"]})
+    assert response.status_code == 200
+    body = response.json()
+
+    assert [item["id"] for item in body["confirmed"]] == [first, second]
+    assert body["skipped"] == [
+        {"id": active, "reason": "Subscription is not expired"},
+        {"id": "missing", "reason": "Subscription not found"},
+    ]
+    now = datetime.now(timezone.utc)
+    listing = {sub["id"]: sub for sub in client.get("/subscription/list").json()}
+    assert listing[first]["nextPayment"] == to_iso(billing.next_due(datetime(2025, 1, 5, tzinfo=timezone.utc), "monthly", now, 5))
+    assert listing[second]["nextPayment"] == to_iso(billing.next_due(datetime(2025, 1, 5, tzinfo=timezone.utc), "yearly", now, 5))
+
+    # Contadores no mesmo commit e vencimento mais próximo recalculado depois
+    stored = client.portal.call(read_rollup, uid)
+    assert stored["statusCounts"].get("expired", 0) == 0
+    assert stored["nextPayment"]["id"] == first
+    assert client.portal.call(rollup.check_rollups, uid, False)["drifted"] == 0
+
+
+def test_bulk_confirm_limits(client):
+    assert client.post("/subscription/confirm-payment/bulk", json={"ids": []}).status_code == 400
+
+    # Um commit tem no máximo COMMIT_MAX_WRITES escritas, e o rollup ocupa uma delas
+    ids = [f"id-{i}" for i in range(main.CONFIRM_BULK_MAX + 1)]
+    assert client.post("/subscription/confirm-payment/bulk", json={"ids": ids}).status_code == 400
+    assert main.CONFIRM_BULK_MAX + 1 <= main.COMMIT_MAX_WRITES
+
+
+def test_bulk_confirm_at_cap_fits_one_commit(client, monkeypatch):
+    batch_type = type(get_fs().batch())
+    original = batch_type.commit
+    sizes = []
+
+    async def commit(self):
+        sizes.append(len(self))
+        return await original(self)
+
+    ids = [add(client) for _ in range(3)]
+    monkeypatch.setattr(main, "CONFIRM_BULK_MAX", 3)
+    monkeypatch.setattr(batch_type, "commit", commit)
+    assert len(client.post("/subscription/confirm-payment/bulk", json={"ids": ids}).json()["confirmed"]) == 3
+    # Três assinaturas + o rollup num commit; depois só o set do refresh_earliest
+    assert sizes == [4, 1]
@@ -0,0 +1,66 @@
+from conftest import JOB_HEADERS, SUBSCRIPTION, card
+from firebase import get_fs
+from services import cards
+
+
+def create_card(client, numbers):
+    assert client.post("/cards/create", json=card(numbers)).status_code == 200
+
+
+def totals(client):
+    return {c["cardFinalNumbers"]: c["totalSpent"] for c in client.get("/cards/list").json()["cards"]}
+
+
+def test_card_totals_follow_subscriptions(client):
+    create_card(client, "1111")
+    create_card(client, "2222")
+
+    first = client.post("/subscription/add", json=SUBSCRIPTION).json()["subscription_id"]
+    client.post("/subscription/add", json={**SUBSCRIPTION, "price": 10})
+    assert totals(client) == {"1111": 49.9, "2222": 0}
+
+    # Trocar de cartão tira de um e soma no outro
+    client.patch(f"/subscription/update/{first}", json={"cardFinalNumbers": "2222"})
+    assert totals(client) == {"1111": 10, "2222": 39.9}
+
+    client.patch(f"/subscription/update/{first}", json={"price": 50})
+    assert totals(client) == {"1111": 10, "2222": 50}
+
+    client.delete(f"/subscription/delete/{first}")
+    assert totals(client) == {"1111": 10, "2222": 0}
+
+
+def test_new_card_starts_with_existing_subscriptions(client):
+    client.post("/subscription/add", json=SUBSCRIPTION)
+    client.post("/subscription/add", json={**SUBSCRIPTION, "cardFinalNumbers": "2222"})
+    create_card(client, "1111")
+    assert totals(client) == {"1111": 39.9}
+
+
+def test_renumbered_card_is_recomputed(client):
+    create_card(client, "1111")
+    client.post("/subscription/add", json={**SUBSCRIPTION, "cardFinalNumbers": "2222", "price": 7})
+    card_id = client.get("/cards/list").json()["cards"][0]["id"]
+
+    assert client.patch(f"/cards/update/{card_id}", json=card("2222")).status_code == 200
+    assert totals(client) == {"2222": 7}
+    client.post("/subscription/add", json={**SUBSCRIPTION, "cardFinalNumbers": "1111"})
+    assert totals(client) == {"2222": 7}
+
+
+def test_card_without_index_entry(client, uid):
+    # Cartões anteriores ao cardIndex caem na query por cardFinalNumbers
+    create_card(client, "1111")
+    client.portal.call(cards.card_index_ref(uid, "1111").delete)
+
+    client.post("/subscription/add", json=SUBSCRIPTION)
+    assert totals(client) == {"1111": 39.9}
+
+
+def test_reconcile_finds_no_drift(client, uid):
+    create_card(client, "1111")
+    client.post("/subscription/add", json=SUBSCRIPTION)
+    run = client.post("/job/reconcile-cards", params={"uid": uid, "wait": True}, headers=JOB_HEADERS).json()
+    assert run["status"] == "done"
+    assert run["result"]["drifted"] == 0
+    assert client.portal.call(get_fs().collection("accounts").document(uid).collection("cardIndex").document("1111").get).exists
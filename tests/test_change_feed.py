@@ -0,0 +1,76 @@
+import pytest
+from fastapi import HTTPException
+
+import main
+from conftest import SUBSCRIPTION
+from services import change_feed
+from services.change_feed import FeedFull
+
+
+@pytest.fixture
+def tokens(client, uid, monkeypatch):
+    # Verificação real das rotas de stream, com um único token válido
+    def verify(token):
+        if token != "good":
+            raise ValueError("bad token")
+        return {"uid": uid}
+
+    monkeypatch.setattr(main.token_verifier, "verify", verify)
+    main.app.dependency_overrides.pop(main.verify_firebase_token)
+    return "good"
+
+
+def test_sse_accepts_token_in_query(client, uid, tokens):
+    assert client.portal.call(main.verify_stream_token, None, tokens) == {"uid": uid}
+    assert client.portal.call(main.verify_stream_token, f"Bearer {tokens}", None) == {"uid": uid}
+
+    # O header, quando vem, é o que vale
+    with pytest.raises(HTTPException):
+        client.portal.call(main.verify_stream_token, "Bearer bad", tokens)
+
+
+def test_sse_rejects_missing_or_invalid_token(client, tokens):
+    assert client.get("/subscription/stream").status_code == 401
+    assert client.get("/subscription/stream", params={"access_token": "bad"}).status_code == 401
+    assert client.get("/subscription/list", params={"access_token": tokens}).status_code == 401
+
+
+def test_websocket_sync_then_changes(client, tokens):
+    headers = {"Authorization": f"Bearer {tokens}"}
+    existing = client.post("/subscription/add", json=SUBSCRIPTION, headers=headers).json()["subscription_id"]
+
+    with client.websocket_connect("/subscription/stream", headers=headers) as ws:
+        sync = ws.receive_json()
+        assert sync["type"] == "sync"
+        assert [doc["id"] for doc in sync["documents"]] == [existing]
+
+        added = client.post("/subscription/add", json={**SUBSCRIPTION, "name": "Spotify"}, headers=headers).json()["subscription_id"]
+        event = ws.receive_json()
+        assert (event["type"], event["id"], event["data"]["name"]) == ("added", added, "Spotify")
+
+        client.delete(f"/subscription/delete/{existing}", headers=headers)
+        event = ws.receive_json()
+        assert (event["type"], event["id"], event["data"]) == ("removed", existing, None)
+
+
+def test_websocket_token_in_first_message(client, tokens):
+    with client.websocket_connect("/subscription/stream") as ws:
+        ws.send_text(tokens)
+        assert ws.receive_json() == {"type": "sync", "documents": []}
+
+
+def test_feed_limits_connections_per_user(client, uid, monkeypatch):
+    monkeypatch.setattr(change_feed, "FEED_MAX_CONNECTIONS_PER_USER", 1)
+
+    async def connect_twice():
+        queue = await main.change_feed.connect(uid)
+        with pytest.raises(FeedFull):
+            await main.change_feed.connect(uid)
+        main.change_feed.disconnect(uid, queue)
+        # A vaga volta e o listener ocioso é reaproveitado
+        again = await main.change_feed.connect(uid)
+        main.change_feed.disconnect(uid, again)
+        return main.change_feed.stats()
+
+    stats = client.portal.call(connect_twice)
+    assert stats["rejected"] >= 1
@@ -0,0 +1,60 @@
+from conftest import SUBSCRIPTION, card
+
+
+def subscriptions(client):
+    return client.get("/subscription/list").json()
+
+
+def test_same_key_replays_response(client):
+    headers = {"Idempotency-Key": "add-1"}
+    first = client.post("/subscription/add", json=SUBSCRIPTION, headers=headers)
+    second = client.post("/subscription/add", json=SUBSCRIPTION, headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert len(subscriptions(client)) == 1
+
+
+def test_same_key_different_body_is_rejected(client):
+    headers = {"Idempotency-Key": "add-1"}
+    client.post("/subscription/add", json=SUBSCRIPTION, headers=headers)
+    response = client.post("/subscription/add", json={**SUBSCRIPTION, "price": 1}, headers=headers)
+
+    assert response.status_code == 422
+    assert len(subscriptions(client)) == 1
+
+
+def test_invalid_key(client):
+    response = client.post("/subscription/add", json=SUBSCRIPTION, headers={"Idempotency-Key": "x" * 300})
+    assert response.status_code == 400
+    assert subscriptions(client) == []
+
+
+def test_without_key_creates_every_time(client):
+    client.post("/subscription/add", json=SUBSCRIPTION)
+    client.post("/subscription/add", json=SUBSCRIPTION)
+    assert len(subscriptions(client)) == 2
+
+
+def test_failed_request_releases_key(client):
+    headers = {"Idempotency-Key": "pay-1"}
+    assert client.post("/subscription/confirm-payment/missing", headers=headers).status_code == 404
+
+    subscription_id = client.post(
+        "/subscription/add", json={**SUBSCRIPTION, "status": 3, "nextPayment": "2026-10-01T00:00:00Z"}
+    ).json()["subscription_id"]
+    # Mesma chave, outro pedido: a reserva da tentativa com erro foi liberada
+    first = client.post(f"/subscription/confirm-payment/{subscription_id}", headers={"Idempotency-Key": "pay-2"})
+    second = client.post(f"/subscription/confirm-payment/{subscription_id}", headers={"Idempotency-Key": "pay-2"})
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+
+
+def test_card_create_replays(client):
+    headers = {"Idempotency-Key": "card-1"}
+    first = client.post("/cards/create", json=card("4242"), headers=headers)
+    second = client.post("/cards/create", json=card("4242"), headers=headers)
+
+    assert second.json() == first.json()
+    assert len(client.get("/cards/list").json()["cards"]) == 1
@@ -0,0 +1,98 @@
+import csv
+import io
+import json
+
+import main
+from conftest import SUBSCRIPTION, card
+from firebase import get_fs
+
+
+def ndjson(*records) -> bytes:
+    return "\n".join(r if isinstance(r, str) else json.dumps(r) for r in records).encode()
+
+
+def import_(client, body: bytes, fmt="ndjson"):
+    return client.post(f"/subscription/import?format={fmt}", content=body)
+
+
+def rollup_count(client, uid):
+    account = client.portal.call(get_fs().collection("accounts").document(uid).get)
+    return (account.to_dict() or {}).get("rollup", {}).get("subscriptions")
+
+
+def totals(client):
+    return {c["cardFinalNumbers"]: c["totalSpent"] for c in client.get("/cards/list").json()["cards"]}
+
+
+def test_ndjson_import_with_partial_errors(client, uid):
+    client.post("/cards/create", json=card("1111"))
+    body = ndjson(SUBSCRIPTION, "{not json", {**SUBSCRIPTION, "price": "free"}, "", {**SUBSCRIPTION, "price": 10})
+
+    result = import_(client, body).json()
+    assert result["imported"] == 2
+    assert result["failed"] == 2
+    assert [error["line"] for error in result["errors"]] == [2, 3]
+    assert result["lastImportedLine"] == 5
+
+    assert len(client.get("/subscription/list").json()) == 2
+    assert totals(client) == {"1111": 49.9}
+    assert rollup_count(client, uid) == 2
+
+
+def test_csv_round_trip(client):
+    client.post("/subscription/add", json={**SUBSCRIPTION, "description": 'linha 1\nlinha 2, com "aspas"'})
+    client.post("/subscription/add", json={**SUBSCRIPTION, "name": "Spotify", "cardFinalNumbers": None, "cardBank": None})
+
+    exported = client.get("/subscription/export?format=csv")
+    assert exported.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(exported.text)))
+    assert sorted(row["name"] for row in rows) == ["Netflix", "Spotify"]
+
+    result = client.post("/subscription/import", content=exported.content, headers={"Content-Type": "text/csv"}).json()
+    assert (result["imported"], result["failed"]) == (2, 0)
+    names = [s["name"] for s in client.get("/subscription/list").json()]
+    assert sorted(names) == ["Netflix", "Netflix", "Spotify", "Spotify"]
+    descriptions = {s.get("description") for s in client.get("/subscription/list").json()}
+    assert 'linha 1\nlinha 2, com "aspas"' in descriptions
+
+
+def test_ndjson_export(client):
+    client.post("/subscription/add", json=SUBSCRIPTION)
+    lines = client.get("/subscription/export").text.strip().split("\n")
+    assert json.loads(lines[0])["name"] == "Netflix"
+
+
+def test_errors_are_capped(client):
+    result = import_(client, ndjson(*["{bad"] * 150, SUBSCRIPTION)).json()
+    assert result["failed"] == 150
+    assert len(result["errors"]) == main.IMPORT_MAX_ERRORS
+    assert result["imported"] == 1
+
+
+def test_failed_commit_keeps_totals_consistent(client, uid, monkeypatch):
+    client.post("/cards/create", json=card("1111"))
+    monkeypatch.setattr(main, "IMPORT_BATCH_SIZE", 2)
+
+    batch_type = type(get_fs().batch())
+    original = batch_type.commit
+    calls = {"n": 0}
+
+    async def flaky_commit(self):
+        calls["n"] += 1
+        if calls["n"] == 2:
+            raise RuntimeError("quota exceeded")
+        return await original(self)
+
+    monkeypatch.setattr(batch_type, "commit", flaky_commit)
+    response = import_(client, ndjson(*[{**SUBSCRIPTION, "price": 1}] * 5))
+
+    assert response.status_code == 500
+    result = response.json()
+    assert result["detail"] == "Import interrupted"
+    assert result["imported"] == 2
+    assert result["lastImportedLine"] == 2
+    assert "quota exceeded" in result["error"]
+
+    # O lote gravado entrou no total do cartão e no rollup
+    assert totals(client) == {"1111": 2}
+    assert rollup_count(client, uid) == 2
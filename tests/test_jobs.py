@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from conftest import JOB_HEADERS, SUBSCRIPTION
+from services import jobs
+
+
+class CountingJob:
+    """Job de teste: N partições, cada uma conta 3 itens com checkpoint; pode falhar uma vez."""
+
+    def __init__(self, partitions=2, fail_on=None):
+        self.partitions = partitions
+        self.fail_on = fail_on
+        self.calls = []
+
+    async def plan(self, params):
+        return [{"start": f"p{i}"} for i in range(self.partitions)]
+
+    async def worker(self, params, partition, checkpoint):
+        self.calls.append((partition["start"], partition.get("cursor")))
+        counters = dict(partition.get("counters") or {})
+        start = int(partition["cursor"]) + 1 if partition.get("cursor") else 0
+        for item in range(start, 3):
+            counters["items"] = counters.get("items", 0) + 1
+            await checkpoint(str(item), counters)
+            if partition["start"] == self.fail_on and item == 1:
+                self.fail_on = None
+                raise RuntimeError("boom")
+        return counters
+
+    async def finish(self, params, totals):
+        return {"ok": True, **totals}
+
+
+@pytest.fixture
+def job(monkeypatch):
+    def install(**kwargs):
+        counting = CountingJob(**kwargs)
+        monkeypatch.setitem(jobs._types, "counting", jobs.JobType(counting.plan, counting.worker, counting.finish))
+        return counting
+    return install
+
+
+async def run(kind, params, identity=None):
+    submitted = await jobs.submit(kind, params, identity)
+    return await jobs.wait(submitted["id"])
+
+
+def test_job_runs_all_partitions(client, job):
+    job(partitions=3)
+    done = client.portal.call(run, "counting", {"mode": "a"})
+
+    assert done["status"] == "done"
+    assert done["attempts"] == 1
+    assert done["partitions"] == {"total": 3, "done": 3}
+    assert done["result"] == {"ok": True, "items": 9}
+
+    status = client.get(f"/job/status/{done['id']}", headers=JOB_HEADERS)
+    assert status.status_code == 200
+    assert status.json()["status"] == "done"
+
+
+def test_job_status_requires_token_and_existing_run(client):
+    assert client.get("/job/status/missing", headers=JOB_HEADERS).status_code == 404
+    assert client.get("/job/status/missing").status_code == 401
+
+
+def test_failed_run_resumes_from_checkpoint(client, job):
+    counting = job(partitions=2, fail_on="p1")
+    failed = client.portal.call(run, "counting", {"mode": "a"})
+    assert failed["status"] == "failed"
+    assert failed["error"] == "boom"
+    assert failed["partitions"]["done"] == 1
+
+    # Mesmo id, pula a partição pronta e continua do último checkpoint
+    counting.calls.clear()
+    resumed = client.portal.call(run, "counting", {"mode": "a"})
+    assert resumed["id"] == failed["id"]
+    assert resumed["status"] == "done"
+    assert resumed["attempts"] == 2
+    assert counting.calls == [("p1", "1")]
+    assert resumed["result"] == {"ok": True, "items": 6}
+
+
+def test_other_identity_starts_new_run(client, job):
+    job(partitions=1, fail_on="p0")
+    failed = client.portal.call(run, "counting", {"mode": "a", "at": 1}, {"mode": "a"})
+    assert failed["status"] == "failed"
+
+    other = client.portal.call(run, "counting", {"mode": "b", "at": 2}, {"mode": "b"})
+    assert other["id"] != failed["id"]
+    assert other["status"] == "done"
+
+    # A mesma identidade com outros parâmetros não retoma a que falhou (não é mais a ativa)
+    again = client.portal.call(run, "counting", {"mode": "a", "at": 3}, {"mode": "a"})
+    assert again["id"] not in (failed["id"], other["id"])
+
+
+def test_concurrent_submits_share_one_run(client, job):
+    counting = job(partitions=2)
+
+    async def submit_twice():
+        first, second = await asyncio.gather(
+            jobs.submit("counting", {"mode": "a"}),
+            jobs.submit("counting", {"mode": "a"}),
+        )
+        await jobs.wait(first["id"])
+        return first, second
+
+    first, second = client.portal.call(submit_twice)
+    assert first["id"] == second["id"]
+    assert len(counting.calls) == 2
+
+
+def test_recalculate_endpoint(client):
+    client.post("/subscription/add", json=SUBSCRIPTION)
+    response = client.post("/job/recalculate", params={"wait": True}, headers=JOB_HEADERS)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["kind"] == "recalculate"
+    assert body["status"] == "done"
+
+    queued = client.post("/job/check-rollups", headers=JOB_HEADERS)
+    assert queued.status_code == 202
+    assert queued.json()["status"] in ("queued", "running", "done")
@@ -0,0 +1,33 @@
+from conftest import JOB_HEADERS
+from services import metrics
+
+
+def request_count(method: str, route: str) -> int:
+    histogram = metrics._routes.get((method, route))
+    return histogram.count if histogram else 0
+
+
+def test_requests_are_measured_by_route(client):
+    before = request_count("GET", "/cards/{card_id}")
+    client.get("/cards/abc")
+    client.get("/cards/def")
+    assert request_count("GET", "/cards/{card_id}") == before + 2
+
+
+def test_accept_header_does_not_hide_requests(client):
+    # Só a rota de stream fica fora do histograma, não quem manda Accept: text/event-stream
+    before = request_count("GET", "/cards/list")
+    client.get("/cards/list", headers={"Accept": "text/event-stream"})
+    assert request_count("GET", "/cards/list") == before + 1
+
+
+def test_stream_route_is_exempt():
+    scope = {"type": "http", "path": "/subscription/stream", "headers": []}
+    assert metrics.is_stream_route(scope)
+    assert not metrics.is_stream_route({**scope, "path": "/subscription/list", "headers": [(b"accept", b"text/event-stream")]})
+
+
+def test_prometheus_endpoint(client):
+    client.get("/cards/list")
+    body = client.get("/metrics", headers=JOB_HEADERS).text
+    assert 'sinu_http_request_duration_seconds_count{method="GET",route="/cards/list"}' in body
@@ -0,0 +1,96 @@
+from datetime import datetime, timezone
+
+import pytest
+from google.api_core.exceptions import FailedPrecondition
+
+from firebase import get_fs
+from services import migrate_timestamps
+
+
+def subscriptions(uid):
+    return get_fs().collection("accounts").document(uid).collection("subscriptions")
+
+
+async def seed(uid, count):
+    await get_fs().collection("accounts").document(uid).set({"createdAt": "2024-01-02T03:04:05Z"})
+    for i in range(count):
+        await subscriptions(uid).document(f"s{i:03d}").set({
+            "nextPayment": "2026-11-05T00:00:00Z",
+            "createdDate": "not a date" if i == 0 else "2025-01-01T00:00:00.000Z",
+            "price": 10,
+        })
+
+
+async def read(uid, subscription_id):
+    return (await subscriptions(uid).document(subscription_id).get()).to_dict()
+
+
+def test_migrates_strings_and_resumes(client, uid, monkeypatch):
+    monkeypatch.setattr(migrate_timestamps, "MIGRATION_PAGE_SIZE", 2)
+    monkeypatch.setattr(migrate_timestamps, "MIGRATION_BATCH_SIZE", 1)
+    client.portal.call(seed, uid, 5)
+
+    # Para depois de uma página e retoma do checkpoint
+    first = client.portal.call(migrate_timestamps.migrate_timestamps, True, 1)
+    assert first["subscriptions"]["scanned"] == 2
+    assert not first["subscriptions"]["done"]
+    report = client.portal.call(migrate_timestamps.migrate_timestamps)
+
+    subs = report["subscriptions"]
+    assert (subs["scanned"], subs["migrated"], subs["invalid"], subs["skipped"]) == (5, 5, 1, 0)
+    assert subs["done"]
+    assert report["accounts"]["migrated"] == 1
+
+    data = client.portal.call(read, uid, "s001")
+    assert data["nextPayment"] == datetime(2026, 11, 5, tzinfo=timezone.utc)
+    assert data["createdDate"] == datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert client.portal.call(read, uid, "s000")["createdDate"] == "not a date"
+
+    # Rodar de novo não regrava nada
+    again = client.portal.call(migrate_timestamps.migrate_timestamps, True)
+    assert again["subscriptions"]["migrated"] == 0
+
+
+def test_concurrent_update_is_not_overwritten(client, uid, monkeypatch):
+    client.portal.call(seed, uid, 3)
+    original = migrate_timestamps._commit_chunk
+
+    async def commit_after_user_edit(chunk):
+        # O usuário altera s001 entre a leitura da página e o commit
+        if any(doc.id == "s001" for doc, _ in chunk):
+            await subscriptions(uid).document("s001").update({"price": 99})
+        return await original(chunk)
+
+    monkeypatch.setattr(migrate_timestamps, "_commit_chunk", commit_after_user_edit)
+    subs = client.portal.call(migrate_timestamps.migrate_timestamps, True)["subscriptions"]
+    assert (subs["migrated"], subs["skipped"]) == (2, 1)
+
+    edited = client.portal.call(read, uid, "s001")
+    assert edited["price"] == 99
+    assert edited["nextPayment"] == "2026-11-05T00:00:00Z"
+    assert isinstance(client.portal.call(read, uid, "s002")["nextPayment"], datetime)
+
+    # Pulados são migrados na próxima execução
+    monkeypatch.setattr(migrate_timestamps, "_commit_chunk", original)
+    retry = client.portal.call(migrate_timestamps.migrate_timestamps, True)["subscriptions"]
+    assert (retry["migrated"], retry["skipped"]) == (1, 0)
+    assert client.portal.call(read, uid, "s001")["price"] == 99
+
+
+def test_memory_batch_precondition(client, uid):
+    async def run():
+        ref = subscriptions(uid).document("x")
+        await ref.set({"price": 1})
+        stale = (await ref.get()).update_time
+        await ref.update({"price": 2})
+
+        batch = get_fs().batch()
+        batch.update(ref, {"price": 3}, option=get_fs().write_option(last_update_time=stale))
+        with pytest.raises(FailedPrecondition):
+            await batch.commit()
+
+        current = await ref.get()
+        await ref.update({"price": 4}, option=get_fs().write_option(last_update_time=current.update_time))
+        return (await ref.get()).to_dict()["price"]
+
+    assert client.portal.call(run) == 4
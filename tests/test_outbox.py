@@ -0,0 +1,164 @@
+import email
+import socket
+import sqlite3
+import time
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from services import outbox as outbox_module
+from services import services
+from services.outbox import Outbox
+
+
+class Inbox:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_config(monkeypatch):
+    monkeypatch.setattr(services, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(services, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(services, "SMTP_TIMEOUT", 5)
+    monkeypatch.setattr(services, "MY_APP_KEY", None)
+    monkeypatch.setattr(services, "MY_EMAIL", "app@sinu.test")
+    monkeypatch.setattr(services, "SUPPORT_TO", "support@sinu.test")
+    monkeypatch.setattr(services, "SMTP_PORT", free_port())
+
+
+@pytest.fixture
+def inbox(smtp_config):
+    """Servidor SMTP local (aiosmtpd) no lugar do Gmail."""
+    inbox = Inbox()
+    controller = Controller(inbox, hostname="127.0.0.1", port=services.SMTP_PORT)
+    controller.start()
+    yield inbox
+    controller.stop()
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    box = Outbox(str(tmp_path / "outbox.db"))
+    yield box
+    box.stop()
+
+
+def body(envelope) -> str:
+    return email.message_from_bytes(envelope.content).get_payload(decode=True).decode()
+
+
+def rows(box):
+    return box._db.execute("SELECT status, attempts, next_attempt_at, last_error FROM outbox").fetchall()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timeout"
+        time.sleep(0.02)
+
+
+def test_enqueued_message_is_delivered(outbox, inbox):
+    outbox.enqueue("Ana", "ana@example.com", "Ajuda", "Não consigo entrar")
+    outbox.start()
+    wait_for(lambda: inbox.messages)
+
+    envelope = inbox.messages[0]
+    assert envelope.mail_from == "app@sinu.test"
+    assert envelope.rcpt_tos == ["support@sinu.test"]
+    assert "[Sinu Support] Ajuda" in envelope.content.decode()
+    assert "Não consigo entrar" in body(envelope)
+    wait_for(lambda: outbox.stats()["pending"] == 0)
+    assert outbox.stats()["sent"] == 1
+    assert rows(outbox) == []
+
+
+def test_connection_is_reused_across_messages(outbox, inbox):
+    for i in range(3):
+        outbox.enqueue("Ana", "ana@example.com", f"Assunto {i}", "...")
+    outbox._send_batch(outbox._claim())
+    assert len(inbox.messages) == 3
+    assert outbox.stats()["connections"] == 1
+
+
+def test_failure_is_rescheduled_with_backoff(outbox, smtp_config):
+    # Nenhum servidor escutando na porta
+    outbox.enqueue("Ana", "ana@example.com", "Ajuda", "...")
+    before = time.time()
+    outbox._send_batch(outbox._claim())
+
+    [(status, attempts, next_attempt_at, last_error)] = rows(outbox)
+    assert (status, attempts) == ("pending", 1)
+    assert next_attempt_at >= before + outbox_module.OUTBOX_BACKOFF_BASE * 2 * 0.5
+    assert last_error
+    # Ainda no backoff: não é pego de novo
+    assert outbox._claim() == []
+
+
+def test_message_goes_dead_after_max_attempts(outbox, smtp_config, monkeypatch):
+    monkeypatch.setattr(outbox_module, "OUTBOX_MAX_ATTEMPTS", 2)
+    outbox.enqueue("Ana", "ana@example.com", "Ajuda", "...")
+    outbox._send_batch(outbox._claim())
+    outbox._db.execute("UPDATE outbox SET next_attempt_at = 0")
+    outbox._send_batch(outbox._claim())
+
+    assert rows(outbox)[0][:2] == ("dead", 2)
+    assert outbox.stats()["dead"] == 1
+    outbox._db.execute("UPDATE outbox SET next_attempt_at = 0")
+    assert outbox._claim() == []
+
+
+def test_rows_are_claimed_by_one_process(tmp_path):
+    # Dois workers com o mesmo arquivo
+    path = str(tmp_path / "shared.db")
+    first, second = Outbox(path), Outbox(path)
+    for i in range(5):
+        first.enqueue("Ana", "ana@example.com", f"Assunto {i}", "...")
+
+    claimed = first._claim()
+    assert len(claimed) == 5
+    assert second._claim() == []
+    assert second.stats()["sending"] == 5
+
+
+def test_abandoned_claim_is_picked_up_after_lease(tmp_path, monkeypatch):
+    path = str(tmp_path / "shared.db")
+    crashed, survivor = Outbox(path), Outbox(path)
+    crashed.enqueue("Ana", "ana@example.com", "Ajuda", "...")
+    crashed._claim()
+
+    assert survivor._claim() == []
+    monkeypatch.setattr(outbox_module, "OUTBOX_LEASE_SECONDS", 0)
+    survivor._db.execute("UPDATE outbox SET lease_until = 0")
+    survivor._db.commit()
+    assert len(survivor._claim()) == 1
+
+
+def test_old_file_gets_lease_column(tmp_path):
+    path = str(tmp_path / "old.db")
+    db = sqlite3.connect(path)
+    db.execute(outbox_module._SCHEMA.replace(",\n    lease_until REAL", ""))
+    db.commit()
+    db.close()
+
+    box = Outbox(path)
+    box.enqueue("Ana", "ana@example.com", "Ajuda", "...")
+    assert len(box._claim()) == 1
+
+
+def test_support_endpoint_delivers(client, inbox):
+    response = client.post("/api/support", json={"name": "Ana", "email": "ana@example.com", "subject": "Oi", "message": "Teste"})
+    assert response.status_code == 202
+    wait_for(lambda: inbox.messages)
+    assert "Mensagem:\nTeste" in body(inbox.messages[0])
@@ -0,0 +1,166 @@
+import asyncio
+import smtplib
+
+import httpx
+import pytest
+
+from services import resilience
+from services.resilience import CircuitBreaker, DependencyUnavailable
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def breakers(monkeypatch):
+    # Breakers novos por teste (os globais vivem o processo todo)
+    for name in resilience.POLICIES:
+        monkeypatch.setitem(resilience._breakers, name, CircuitBreaker(name))
+    monkeypatch.setattr(resilience, "backoff", lambda policy, attempt: 0)
+    return resilience._breakers
+
+
+def trip(breaker):
+    for _ in range(resilience.BREAKER_MIN_CALLS):
+        breaker.record(False)
+
+
+def test_breaker_opens_on_failure_rate(clock):
+    breaker = CircuitBreaker("test")
+    for _ in range(resilience.BREAKER_MIN_CALLS - 1):
+        breaker.record(False)
+    # Abaixo do mínimo de chamadas na janela ainda não abre
+    breaker.before_call()
+
+    breaker.record(False)
+    with pytest.raises(DependencyUnavailable) as error:
+        breaker.before_call()
+    assert error.value.retry_after == resilience.BREAKER_OPEN_SECONDS
+    assert breaker.stats()["state"] == "open"
+    assert (breaker.stats()["trips"], breaker.stats()["rejected"]) == (1, 1)
+
+
+def test_breaker_ignores_old_failures(clock):
+    breaker = CircuitBreaker("test")
+    for _ in range(resilience.BREAKER_MIN_CALLS - 1):
+        breaker.record(False)
+    clock.now += resilience.BREAKER_WINDOW_SECONDS + 1
+    breaker.record(False)
+    breaker.before_call()
+    assert breaker.stats()["calls"] == 1
+
+
+def test_half_open_probe_closes_or_reopens(clock):
+    breaker = CircuitBreaker("test")
+    trip(breaker)
+    clock.now += resilience.BREAKER_OPEN_SECONDS
+
+    # Uma chamada de teste por vez
+    breaker.before_call()
+    with pytest.raises(DependencyUnavailable):
+        breaker.before_call()
+    breaker.record(False)
+    assert breaker.stats()["state"] == "open"
+
+    clock.now += resilience.BREAKER_OPEN_SECONDS
+    breaker.before_call()
+    breaker.record(True)
+    assert breaker.stats()["state"] == "closed"
+    breaker.before_call()
+
+
+def test_call_retries_transient_errors_when_idempotent(breakers):
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise httpx.ConnectError("down")
+        return "ok"
+
+    assert asyncio.run(resilience.call("securetoken", flaky, idempotent=True)) == "ok"
+    assert len(attempts) == 3
+
+    attempts.clear()
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(resilience.call("securetoken", flaky))
+    assert len(attempts) == 1
+
+
+def test_call_does_not_retry_or_count_client_errors(breakers):
+    attempts = []
+
+    async def bad_request():
+        attempts.append(1)
+        raise ValueError("400")
+
+    with pytest.raises(ValueError):
+        asyncio.run(resilience.call("identitytoolkit", bad_request, idempotent=True))
+    assert len(attempts) == 1
+    assert breakers["identitytoolkit"].stats()["failureRate"] == 0.0
+
+
+def test_call_retries_failed_responses_and_returns_last(breakers):
+    responses = iter([503, 503, 503])
+
+    async def upstream():
+        return httpx.Response(next(responses))
+
+    result = asyncio.run(resilience.call("securetoken", upstream, idempotent=True, failed=lambda r: r.status_code >= 500))
+    assert result.status_code == 503
+    assert breakers["securetoken"].stats()["calls"] == 3
+
+
+def test_call_applies_deadline(breakers, monkeypatch):
+    monkeypatch.setitem(resilience.POLICIES, "firestore", resilience.Policy(0.01))
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(resilience.call("firestore", slow))
+    assert breakers["firestore"].stats()["failureRate"] == 1.0
+
+
+def test_open_breaker_fails_fast(breakers):
+    trip(breakers["identitytoolkit"])
+    called = []
+
+    async def fn():
+        called.append(1)
+
+    with pytest.raises(DependencyUnavailable):
+        asyncio.run(resilience.call("identitytoolkit", fn))
+    assert called == []
+
+
+def test_guarded_records_outcomes(breakers):
+    with resilience.guarded("smtp"):
+        pass
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        with resilience.guarded("smtp"):
+            raise smtplib.SMTPServerDisconnected()
+    assert breakers["smtp"].stats()["failureRate"] == 0.5
+
+
+def test_open_breaker_is_503_and_reported_in_health(client, uid, breakers):
+    trip(breakers["securetoken"])
+
+    response = client.post("/auth/refresh", json={"refreshToken": f"rt-{uid}"})
+    assert response.status_code == 503
+    assert response.json() == {"detail": "SERVICE_UNAVAILABLE", "dependency": "securetoken"}
+    assert int(response.headers["Retry-After"]) >= 1
+
+    assert client.get("/health").json()["dependencies"]["securetoken"]["state"] == "open"
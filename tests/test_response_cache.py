@@ -0,0 +1,75 @@
+from conftest import SUBSCRIPTION, card
+from firebase import get_fs
+
+
+def test_list_revalidates_with_304(client):
+    client.post("/subscription/add", json=SUBSCRIPTION)
+    first = client.get("/subscription/list")
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    second = client.get("/subscription/list", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["ETag"] == etag
+
+
+def test_mutation_changes_etag(client):
+    subscription_id = client.post("/subscription/add", json=SUBSCRIPTION).json()["subscription_id"]
+    etag = client.get("/subscription/list").headers["ETag"]
+
+    client.patch(f"/subscription/update/{subscription_id}", json={"price": 50})
+    response = client.get("/subscription/list", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()[0]["price"] == 50
+
+    client.delete(f"/subscription/delete/{subscription_id}")
+    assert client.get("/subscription/list").json() == []
+
+
+def test_stale_etag_gets_full_body(client):
+    client.post("/subscription/add", json=SUBSCRIPTION)
+    response = client.get("/subscription/list", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+
+
+def test_query_params_have_their_own_entry(client):
+    client.post("/subscription/add", json=SUBSCRIPTION)
+    client.post("/subscription/add", json={**SUBSCRIPTION, "currency": "USD"})
+    assert len(client.get("/subscription/list").json()) == 2
+    assert len(client.get("/subscription/list", params={"currency": "USD"}).json()) == 1
+
+
+def test_cards_and_card_etags(client):
+    client.post("/cards/create", json=card("1111"))
+    listing = client.get("/cards/list")
+    card_id = listing.json()["cards"][0]["id"]
+    assert client.get("/cards/list", headers={"If-None-Match": listing.headers["ETag"]}).status_code == 304
+
+    single = client.get(f"/cards/{card_id}")
+    assert client.get(f"/cards/{card_id}", headers={"If-None-Match": single.headers["ETag"]}).status_code == 304
+
+    client.patch(f"/cards/update/{card_id}", json={**card("1111"), "limit": 5})
+    assert client.get(f"/cards/{card_id}", headers={"If-None-Match": single.headers["ETag"]}).json()["card"]["limit"] == 5
+    assert client.get("/cards/missing").status_code == 404
+
+
+def test_profile_etag(client, uid):
+    client.portal.call(get_fs().collection("accounts").document(uid).set, {"name": "Ana"})
+    first = client.get("/user/profile")
+    assert first.json()["name"] == "Ana"
+    assert client.get("/user/profile", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+
+def test_cache_is_per_user(client):
+    import main
+
+    client.post("/subscription/add", json=SUBSCRIPTION)
+    etag = client.get("/subscription/list").headers["ETag"]
+
+    main.app.dependency_overrides[main.verify_firebase_token] = lambda: {"uid": "someone-else"}
+    response = client.get("/subscription/list", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == []
@@ -0,0 +1,99 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+from services.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight(share_seconds=10)
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def run():
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(5)))
+        # Logo depois, ainda dentro da janela: mesmo resultado sem executar de novo
+        results.append(await flight.do("k", fn))
+        results.append(await flight.do("other", fn))
+        return results
+
+    assert asyncio.run(run()) == [1, 1, 1, 1, 1, 1, 2]
+    assert flight.stats() == {"calls": 2, "shared": 5, "entries": 2}
+
+
+def test_result_expires_after_window():
+    flight = SingleFlight(share_seconds=0)
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        return len(calls)
+
+    async def run():
+        return [await flight.do("k", fn), await flight.do("k", fn)]
+
+    assert asyncio.run(run()) == [1, 2]
+
+
+def test_failures_are_not_shared_afterwards():
+    flight = SingleFlight()
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("upstream")
+        return "ok"
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await flight.do("k", fn)
+        return await flight.do("k", fn)
+
+    assert asyncio.run(run()) == "ok"
+
+
+def test_cancelled_caller_does_not_cancel_others():
+    flight = SingleFlight()
+
+    async def fn():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def run():
+        first = asyncio.ensure_future(flight.do("k", fn))
+        second = asyncio.ensure_future(flight.do("k", fn))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "done"
+
+
+def test_concurrent_refreshes_make_one_upstream_call(client, uid, monkeypatch):
+    upstream = []
+
+    async def post(url, idempotent=False, **kwargs):
+        upstream.append(kwargs["data"]["refresh_token"])
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"id_token": "new-id", "refresh_token": "rotated", "user_id": uid})
+
+    monkeypatch.setattr(main.http_client, "post", post)
+
+    async def refresh_in_parallel():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await asyncio.gather(*(
+                http.post("/auth/refresh", json={"refreshToken": f"rt-{uid}"}) for _ in range(3)
+            ))
+
+    responses = client.portal.call(refresh_in_parallel)
+    assert [r.status_code for r in responses] == [200, 200, 200]
+    assert {r.json()["idToken"] for r in responses} == {"new-id"}
+    assert upstream == [f"rt-{uid}"]
@@ -0,0 +1,61 @@
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from benchmarks.status_engine import legacy_status_update, make_rows
+from services import status_engine
+
+NOW = datetime(2026, 10, 17, 15, 30, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("native", [False, True])
+def test_vectorized_matches_legacy_scalar_path(native):
+    rows = make_rows(2000, NOW, seed=7, native=native)
+    assert status_engine.status_updates(rows, NOW) == [legacy_status_update(row, NOW) for row in rows]
+
+
+def test_single_row_matches_batch():
+    rows = make_rows(200, NOW, seed=3)
+    assert [status_engine.status_update(row, NOW) for row in rows] == status_engine.status_updates(rows, NOW)
+
+
+@pytest.mark.parametrize("next_payment", [
+    "2026-10-27",
+    "2026-10-27T00:00:00Z",
+    "2026-10-27T23:59:59.999Z",
+    "2026-10-27T10:00:00+00:00",
+    "2026-10-27T21:00:00-03:00",
+    "2026-10-28T01:00:00+02:00",
+    datetime(2026, 10, 27, 8, tzinfo=timezone.utc),
+])
+def test_date_formats_match_legacy(next_payment):
+    # Caminho rápido (UTC) e caminho lento (outros offsets) dão o mesmo dia
+    row = {"nextPayment": next_payment, "status": 1, "statusChangeAt": None}
+    assert status_engine.status_update(row, NOW) == legacy_status_update(row, NOW)
+
+
+@pytest.mark.parametrize("days, status", [(-1, 3), (0, 2), (10, 2), (11, 1)])
+def test_expiring_window_boundaries(days, status):
+    row = {"nextPayment": NOW + timedelta(days=days), "status": 1, "statusChangeAt": None}
+    update = status_engine.status_update(row, NOW)
+    assert update.get("status", 1) == status
+
+
+@pytest.mark.parametrize("row", [
+    {"nextPayment": "2020-01-01T00:00:00Z", "status": 0, "statusChangeAt": None},
+    {"nextPayment": None, "status": 1, "statusChangeAt": None},
+])
+def test_rows_left_alone(row):
+    assert status_engine.status_update(row, NOW) == legacy_status_update(row, NOW) == {}
+
+
+def test_invalid_date_left_alone():
+    # A implementação antiga levantava ValueError aqui
+    row = {"nextPayment": "not a date", "status": 1, "statusChangeAt": None}
+    assert status_engine.status_update(row, NOW) == {}
+
+
+def test_unchanged_row_has_no_update():
+    row = {"nextPayment": "2026-12-25T00:00:00Z", "status": 1, "statusChangeAt": None}
+    row.update(status_engine.status_update(row, NOW))
+    assert status_engine.status_update(row, NOW) == {}
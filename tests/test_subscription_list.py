@@ -0,0 +1,79 @@
+import base64
+
+from conftest import SUBSCRIPTION
+
+
+def add(client, count, **fields):
+    return [client.post("/subscription/add", json={**SUBSCRIPTION, **fields}).json()["subscription_id"] for _ in range(count)]
+
+
+def test_without_limit_returns_everything(client):
+    add(client, 3)
+    response = client.get("/subscription/list")
+    assert len(response.json()) == 3
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_cursor_pagination_walks_all_pages(client):
+    ids = add(client, 7)
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/subscription/list", params=params)
+        page = response.json()
+        assert len(page) <= 3
+        seen += [item["id"] for item in page]
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert pages == 3
+    assert sorted(seen) == sorted(ids)
+
+
+def test_exact_page_has_no_next_cursor(client):
+    add(client, 3)
+    assert "X-Next-Cursor" not in client.get("/subscription/list", params={"limit": 3}).headers
+
+
+def test_cursor_with_nextpayment_range(client):
+    for day in ("2026-11-05", "2026-11-10", "2026-11-15", "2026-12-20"):
+        add(client, 1, nextPayment=f"{day}T00:00:00Z")
+    params = {"nextPaymentFrom": "2026-11-06T00:00:00Z", "nextPaymentTo": "2026-12-31T00:00:00Z", "limit": 1}
+    first = client.get("/subscription/list", params=params)
+    second = client.get("/subscription/list", params={**params, "cursor": first.headers["X-Next-Cursor"]})
+    third = client.get("/subscription/list", params={**params, "cursor": second.headers["X-Next-Cursor"]})
+
+    days = [page.json()[0]["nextPayment"][:10] for page in (first, second, third)]
+    assert days == ["2026-11-10", "2026-11-15", "2026-12-20"]
+    assert "X-Next-Cursor" not in third.headers
+
+
+def test_invalid_cursor(client):
+    assert client.get("/subscription/list", params={"cursor": "not-base64!"}).status_code == 400
+    for payload in (b"not json", b'"x"', b"[1]", b'{"id": 1}'):
+        garbage = base64.urlsafe_b64encode(payload).decode()
+        assert client.get("/subscription/list", params={"cursor": garbage}).status_code == 400
+
+
+def test_invalid_range_and_limit(client):
+    assert client.get("/subscription/list", params={"nextPaymentFrom": "yesterday"}).status_code == 400
+    assert client.get("/subscription/list", params={"limit": 0}).status_code == 422
+    assert client.get("/subscription/list", params={"limit": 501}).status_code == 422
+
+
+def test_filters(client):
+    add(client, 2)
+    add(client, 1, currency="USD")
+    add(client, 1, status=0, cardFinalNumbers="2222")
+
+    assert len(client.get("/subscription/list", params={"currency": "USD"}).json()) == 1
+    assert len(client.get("/subscription/list", params={"status": 0}).json()) == 1
+    assert len(client.get("/subscription/list", params={"cardFinalNumbers": "1111"}).json()) == 3
+
+
+def test_field_projection(client):
+    add(client, 1)
+    items = client.get("/subscription/list", params={"fields": "name,price"}).json()
+    assert items == [{"name": "Netflix", "price": 39.9, "id": items[0]["id"]}]
+    assert client.get("/subscription/list", params={"fields": "name,password"}).status_code == 400
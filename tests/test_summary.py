@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+
+import main
+from conftest import SUBSCRIPTION
+from services.summary import SpendingSummary
+
+
+class FrozenDatetime(datetime):
+    frozen = datetime(2026, 10, 17, 12, tzinfo=timezone.utc)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.frozen
+
+
+def test_totals_per_currency_card_and_type():
+    result = SpendingSummary(datetime(2026, 10, 17, tzinfo=timezone.utc))
+    result.add("a", {"price": 30, "currency": "BRL", "cardFinalNumbers": "1111", "subscriptionType": "video"})
+    result.add("b", {"price": 120, "currency": "BRL", "billingFrequency": "yearly", "subscriptionType": "video"})
+    result.add("c", {"price": 10, "currency": "USD", "billingFrequency": "weekly", "cardFinalNumbers": "1111"})
+    result.add("d", {"price": 99, "currency": "BRL", "status": 0})
+    result.add("e", {"price": "free", "currency": "BRL"})
+    out = result.result()
+
+    assert out["subscriptions"] == 3
+    assert out["totals"] == {
+        "BRL": {"monthly": 40.0, "yearly": 480.0, "count": 2},
+        "USD": {"monthly": 43.33, "yearly": 520.0, "count": 1},
+    }
+    assert out["byCard"]["1111"] == {
+        "BRL": {"monthly": 30.0, "yearly": 360.0, "count": 1},
+        "USD": {"monthly": 43.33, "yearly": 520.0, "count": 1},
+    }
+    assert out["byCard"]["none"]["BRL"]["count"] == 1
+    assert out["byType"]["video"]["BRL"]["monthly"] == 40.0
+
+
+def test_upcoming_keeps_nearest_and_flags_overdue():
+    result = SpendingSummary(datetime(2026, 10, 17, tzinfo=timezone.utc), upcoming=2)
+    for name, due in [("late", "2026-10-10"), ("far", "2027-01-01"), ("soon", "2026-10-20")]:
+        result.add(name, {"name": name, "price": 1, "currency": "BRL", "nextPayment": f"{due}T00:00:00Z"})
+    upcoming = result.result()["upcoming"]
+
+    assert [item["id"] for item in upcoming] == ["late", "soon"]
+    assert upcoming[0]["overdue"] is True
+    assert upcoming[1]["overdue"] is False
+
+
+def test_cash_flow_projects_months_and_carries_overdue():
+    result = SpendingSummary(datetime(2026, 10, 17, tzinfo=timezone.utc), months=3)
+    result.add("monthly", {"price": 10, "currency": "BRL", "billingDay": 5, "nextPayment": "2026-11-05T00:00:00Z"})
+    result.add("overdue", {"price": 7, "currency": "BRL", "billingDay": 1, "nextPayment": "2026-10-01T00:00:00Z"})
+    result.add("yearly", {"price": 100, "currency": "USD", "billingFrequency": "yearly", "nextPayment": "2026-12-01T00:00:00Z"})
+    cash_flow = result.result()["cashFlow"]
+
+    assert [bucket["month"] for bucket in cash_flow] == ["2026-10", "2026-11", "2026-12"]
+    assert cash_flow[0]["totals"] == {"BRL": 7.0}
+    assert cash_flow[1]["totals"] == {"BRL": 17.0}
+    assert cash_flow[2]["totals"] == {"BRL": 17.0, "USD": 100.0}
+
+
+def test_summary_endpoint(client, monkeypatch):
+    monkeypatch.setattr(main, "datetime", FrozenDatetime)
+    client.post("/subscription/add", json=SUBSCRIPTION)
+    body = client.get("/user/summary").json()
+
+    assert body["totals"] == {"BRL": {"monthly": 39.9, "yearly": 478.8, "count": 1}}
+    assert body["upcoming"][0]["dueAt"] .startswith("2026-11-05T00:00:00")
+    assert body["cashFlow"][0]["month"] == "2026-10"
+    assert len(body["cashFlow"]) == 12
+
+
+def test_summary_etag_changes_with_date_and_params(client, monkeypatch):
+    monkeypatch.setattr(main, "datetime", FrozenDatetime)
+    client.post("/subscription/add", json=SUBSCRIPTION)
+    first = client.get("/user/summary")
+    etag = first.headers["ETag"]
+    assert client.get("/user/summary", headers={"If-None-Match": etag}).status_code == 304
+
+    other = client.get("/user/summary", params={"months": 3}, headers={"If-None-Match": etag})
+    assert other.status_code == 200
+    assert other.headers["ETag"] != etag
+
+    # Virou o mês: mesmo documento, corpo diferente
+    monkeypatch.setattr(FrozenDatetime, "frozen", datetime(2026, 11, 1, tzinfo=timezone.utc))
+    next_day = client.get("/user/summary", headers={"If-None-Match": etag})
+    assert next_day.status_code == 200
+    assert next_day.headers["ETag"] != etag
+    assert next_day.json()["cashFlow"][0]["month"] == "2026-11"
@@ -0,0 +1,170 @@
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.auth import crypt, jwt
+
+from services import token_verifier
+from services.token_verifier import InvalidTokenError, SigningKeyStore, TokenVerifier
+
+PROJECT_ID = "test-project"
+
+
+def rsa_key():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    public = key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return private.decode(), public.decode()
+
+
+SIGNING_KEY, PUBLIC_KEY = rsa_key()
+OTHER_KEY, _ = rsa_key()
+
+
+class FakeKeyStore(SigningKeyStore):
+    """Chaves fixas, sem rede; conta as buscas."""
+
+    def __init__(self, certs: dict):
+        super().__init__("http://keys.invalid")
+        self.published = certs
+
+    def refresh(self, force: bool = False):
+        with self._lock:
+            self._certs = dict(self.published)
+            self._expires_at = time.time() + 3600
+            self._fetched_at = time.monotonic()
+            self.fetches += 1
+
+
+def make_token(key=SIGNING_KEY, kid="k1", **claims):
+    now = int(time.time())
+    payload = {
+        "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+        "aud": PROJECT_ID,
+        "sub": "user-1",
+        "iat": now,
+        "exp": now + 3600,
+        **claims,
+    }
+    return jwt.encode(crypt.RSASigner.from_string(key, kid), payload, header={"kid": kid}).decode()
+
+
+@pytest.fixture
+def keys():
+    return FakeKeyStore({"k1": PUBLIC_KEY})
+
+
+@pytest.fixture
+def verifier(keys):
+    return TokenVerifier(PROJECT_ID, keys=keys)
+
+
+def test_valid_token(verifier):
+    decoded = verifier.verify(make_token(email="a@b.c"))
+    assert decoded["uid"] == "user-1"
+    assert decoded["email"] == "a@b.c"
+
+
+def test_second_verify_is_a_cache_hit(verifier):
+    token = make_token()
+    verifier.verify(token)
+    assert verifier.get_cached(token)["uid"] == "user-1"
+    verifier.verify(token)
+    assert (verifier.hits, verifier.misses) == (2, 1)
+
+
+def test_cache_entry_expires_with_token(verifier, monkeypatch):
+    token = make_token(exp=int(time.time()) + 60)
+    verifier.verify(token)
+
+    later = time.time() + 120
+    monkeypatch.setattr(token_verifier.time, "time", lambda: later)
+    assert verifier.get_cached(token) is None
+    assert verifier.stats()["hits"] == 0
+
+
+def test_expired_token(verifier):
+    now = int(time.time())
+    with pytest.raises(InvalidTokenError):
+        verifier.verify(make_token(iat=now - 7200, exp=now - 3600))
+
+
+@pytest.mark.parametrize("token", [
+    pytest.param(lambda: make_token(key=OTHER_KEY), id="forged-signature"),
+    pytest.param(lambda: make_token(aud="other-project"), id="wrong-audience"),
+    pytest.param(lambda: make_token(iss="https://securetoken.google.com/other-project"), id="wrong-issuer"),
+    pytest.param(lambda: make_token(sub=""), id="empty-subject"),
+    pytest.param(lambda: make_token(sub="x" * 129), id="long-subject"),
+    pytest.param(lambda: make_token()[:-4] + "AAAA", id="tampered"),
+    pytest.param(lambda: "not-a-jwt", id="garbage"),
+])
+def test_invalid_tokens(verifier, token):
+    with pytest.raises(InvalidTokenError):
+        verifier.verify(token())
+    assert verifier.stats()["size"] == 0
+
+
+def test_unknown_kid_refresh_is_throttled(verifier, keys):
+    verifier.verify(make_token())
+    fetches = keys.fetches
+
+    # O primeiro kid desconhecido busca as chaves; os seguintes, dentro da janela, não
+    for i in range(5):
+        with pytest.raises(InvalidTokenError):
+            verifier.verify(make_token(key=OTHER_KEY, kid=f"bogus-{i}"))
+    assert keys.fetches == fetches
+    assert keys.throttled == 5
+
+
+def test_rotated_key_is_picked_up(keys):
+    verifier = TokenVerifier(PROJECT_ID, keys=keys)
+    verifier.verify(make_token())
+    new_key, new_public = rsa_key()
+    keys.published = {"k1": PUBLIC_KEY, "k2": new_public}
+    # Passou o intervalo mínimo desde a última busca
+    keys._fetched_at -= token_verifier.KEY_FORCED_REFRESH_INTERVAL
+
+    assert verifier.verify(make_token(key=new_key, kid="k2"))["uid"] == "user-1"
+
+
+def test_revoked_token(verifier):
+    token = make_token()
+    verifier.verify(token)
+    verifier.revoke(token)
+
+    assert verifier.get_cached(token) is None
+    with pytest.raises(InvalidTokenError):
+        verifier.verify(token)
+    # Outros tokens do mesmo usuário continuam valendo
+    assert verifier.verify(make_token(iat=int(time.time()) - 1))["uid"] == "user-1"
+
+
+def test_revoke_rejects_invalid_token(verifier):
+    with pytest.raises(InvalidTokenError):
+        verifier.revoke(make_token(key=OTHER_KEY))
+    assert verifier.stats()["revoked"] == 0
+
+
+def test_lru_is_bounded(keys):
+    verifier = TokenVerifier(PROJECT_ID, max_size=3, keys=keys)
+    tokens = [make_token(sub=f"user-{i}") for i in range(5)]
+    for token in tokens:
+        verifier.verify(token)
+    assert verifier.stats()["size"] == 3
+    assert verifier.get_cached(tokens[0]) is None
+    assert verifier.get_cached(tokens[-1])["uid"] == "user-4"
+
+
+def test_logout_revokes_token(client, monkeypatch):
+    import main
+
+    keys = FakeKeyStore({"k1": PUBLIC_KEY})
+    monkeypatch.setattr(main, "token_verifier", TokenVerifier(main.PROJECT_ID, keys=keys))
+    main.app.dependency_overrides.clear()
+    token = make_token(aud=main.PROJECT_ID, iss=f"https://securetoken.google.com/{main.PROJECT_ID}")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/cards/list", headers=headers).status_code == 200
+    assert client.post("/auth/logout", headers=headers).status_code == 200
+    assert client.get("/cards/list", headers=headers).status_code == 401